@@ -0,0 +1,135 @@
+# Author: @vexance
+# Purpose: Minimal cloudtrail:LookupEvents endpoint serving synthetic events for module benchmarks (moto does not implement
+# LookupEvents). Run as a separate process: python -m benchmarks.cloudtrail_standin --port PORT --events N
+#
+
+import argparse
+import json
+
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+ACCOUNT_ID = '123456789012' # moto's default account
+PAGE_SIZE = 50 # LookupEvents maximum (and default) page size
+
+# (eventSource, eventName, readOnly, resource ARN template)
+EVENT_TYPES = (
+    ('s3.amazonaws.com', 'GetObject', True, 'arn:aws:s3:::bench-bucket-{n}/data/object-{i}.json'),
+    ('ec2.amazonaws.com', 'DescribeInstances', True, 'arn:aws:ec2:{region}:{account}:instance/i-{i:017x}'),
+    ('lambda.amazonaws.com', 'GetFunction20150331v2', True, 'arn:aws:lambda:{region}:{account}:function:bench-function-{n}'),
+    ('iam.amazonaws.com', 'AttachRolePolicy', False, 'arn:aws:iam::{account}:role/bench-role-{n}'),
+    ('ssm.amazonaws.com', 'SendCommand', False, 'arn:aws:ssm:{region}:{account}:document/AWS-RunShellScript'),
+    ('sts.amazonaws.com', 'AssumeRole', True, 'arn:aws:iam::{account}:role/bench-role-{n}')
+)
+ERROR_CODES = (None, None, None, None, 'AccessDenied', 'ThrottlingException')
+
+
+def make_event(index: int, region: str, now: datetime) -> dict:
+    '''Build a deterministic LookupEvents entry; principals / resources repeat so modules see realistic duplication'''
+    source, name, read_only, arn = EVENT_TYPES[index % len(EVENT_TYPES)]
+    resource = arn.format(n=index % 97, i=index, region=region, account=ACCOUNT_ID)
+    event_time = now - timedelta(seconds=index * 7)
+
+    if index % 3 == 0:
+        identity = {
+            'type': 'AssumedRole',
+            'arn': f'arn:aws:sts::{ACCOUNT_ID}:assumed-role/bench-role-{index % 13}/session-{index % 5}',
+            'sessionContext': {'sessionIssuer': {'type': 'Role', 'arn': f'arn:aws:iam::{ACCOUNT_ID}:role/bench-role-{index % 13}'}}
+        }
+    else:
+        identity = {'type': 'IAMUser', 'arn': f'arn:aws:iam::{ACCOUNT_ID}:user/bench-user-{index % 29}'}
+
+    record = {
+        'eventVersion': '1.08',
+        'userIdentity': identity,
+        'eventTime': event_time.strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'eventSource': source,
+        'eventName': name,
+        'awsRegion': region,
+        'sourceIPAddress': f'10.0.{index % 256}.{(index // 256) % 256}',
+        'userAgent': 'aws-cli/2.15.0',
+        'requestParameters': {'resourceArn': resource},
+        'resources': [{'ARN': resource, 'accountId': ACCOUNT_ID}],
+        'readOnly': read_only,
+        'eventID': f'{index:08x}-0000-4000-8000-{index:012x}',
+        'recipientAccountId': ACCOUNT_ID
+    }
+    error = ERROR_CODES[index % len(ERROR_CODES)]
+    if error != None: record['errorCode'] = error
+
+    return {
+        'EventId': record['eventID'],
+        'EventName': name,
+        'ReadOnly': str(read_only).lower(),
+        'EventTime': event_time.timestamp(),
+        'EventSource': source,
+        'Username': identity['arn'].split('/')[-1],
+        'Resources': [{'ResourceType': source.split('.')[0], 'ResourceName': resource}],
+        'CloudTrailEvent': json.dumps(record)
+    }
+
+
+def lookup_events(body: dict, region: str, total: int, now: datetime) -> dict:
+    '''Serve one page of the events matching the request's ReadOnly lookup attribute (if any)'''
+    read_only = None
+    for attr in body.get('LookupAttributes', []):
+        if attr.get('AttributeKey') == 'ReadOnly': read_only = attr.get('AttributeValue') == 'true'
+
+    page_size = min(int(body.get('MaxResults', PAGE_SIZE)), PAGE_SIZE)
+    index = int(body.get('NextToken', '0'))
+    events = []
+    while index < total and len(events) < page_size:
+        if read_only == None or EVENT_TYPES[index % len(EVENT_TYPES)][2] == read_only:
+            events.append(make_event(index, region, now))
+        index += 1
+
+    res = {'Events': events}
+    if index < total: res['NextToken'] = str(index)
+    return res
+
+
+def make_handler(total: int):
+    now = datetime.now(timezone.utc)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1' # keep-alive, as botocore expects
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            if not self.headers.get('X-Amz-Target', '').endswith('.LookupEvents'):
+                return self.respond(400, {'__type': 'UnknownOperationException', 'message': 'Only LookupEvents is implemented'})
+
+            # Credential scope: AWS4-HMAC-SHA256 Credential=AKID/20240101/us-east-1/cloudtrail/aws4_request
+            scope = self.headers.get('Authorization', '').split('Credential=')[-1].split('/')
+            region = scope[2] if (len(scope) > 2) else 'us-east-1'
+            self.respond(200, lookup_events(body, region, total, now))
+
+        def respond(self, status: int, payload: dict) -> None:
+            data = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/x-amz-json-1.1')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Synthetic cloudtrail:LookupEvents endpoint for benchmarks')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=True)
+    parser.add_argument('--events', type=int, default=5000, help='events available per region')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(args.events))
+    server.daemon_threads = True
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+# Author: @vexance
+# Purpose: Offline benchmarks for credential serialization and the sqlite credstore at large credential counts
+#
+# Usage (from the repository root):
+#   python -m benchmarks.credstore [--creds 10000] [--repeat 5] [--compare previous.json]
+#
+# Only interfaces shared by every credstore version are used (str(cred), from_dict, CredentialStoreConnector), so the script
+# can be copied into a worktree of an older revision to produce a --compare baseline.
+#
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from pathlib import Path
+
+from stratustryke import __version__
+from stratustryke.core.credential import Credential
+from stratustryke.core.credential.aws import AWSCredential
+from stratustryke.core.credstore import CredentialStoreConnector
+from stratustryke.core.framework import StratustrykeFramework
+from stratustryke.lib import home_dir
+
+
+WORKSPACES = 10 # credentials are spread evenly across this many workspaces
+
+
+def make_credentials(count: int) -> list:
+    '''AWS credentials with realistic field sizes; every other one is a temporary (STS) credential with a session token'''
+    creds = []
+    for i in range(count):
+        temporary = (i % 2 == 0)
+        creds.append(AWSCredential(f'bench-cred-{i:06d}', f'workspace-{i % WORKSPACES}', acc_id=f'{100000000000 + i % 997:012d}',
+                                   access_key=f'{"ASIA" if temporary else "AKIA"}{i:016d}', secret_key=f'{i:040d}',
+                                   session_token=(f'IQoJb3JpZ2luX2VjE{i:08d}' + 'x' * 600) if temporary else None,
+                                   default_region='us-east-1', arn=f'arn:aws:iam::{100000000000 + i % 997:012d}:user/bench-{i}',
+                                   expiry='2030-01-01T00:00:00Z' if temporary else None))
+    return creds
+
+
+def legacy_encode(cred: Credential) -> str:
+    '''Credential data in the str(dict) format written before credentials were serialized as JSON; None if this version
+    only has that format'''
+    return str(cred.to_dict()) if hasattr(cred, 'to_dict') else None
+
+
+def timed(fn, repeat: int) -> float:
+    '''Median wall time in seconds of repeat calls to fn()'''
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append(time.perf_counter() - started)
+    return statistics.median(runs)
+
+
+def serialization(creds: list, repeat: int) -> dict:
+    '''Encode / decode every credential as the credstore does (str(cred) / from_dict), plus decoding of legacy str(dict) data'''
+    encoded = [str(cred) for cred in creds]
+    results = {
+        'encode': timed(lambda: [str(cred) for cred in creds], repeat),
+        'decode': timed(lambda: [AWSCredential(cred._alias, from_dict=data) for cred, data in zip(creds, encoded)], repeat)
+    }
+
+    legacy = [legacy_encode(cred) for cred in creds]
+    if legacy[0] != None and legacy[0] != encoded[0]:
+        results['decode_legacy'] = timed(lambda: [AWSCredential(cred._alias, from_dict=data) for cred, data in zip(creds, legacy)], repeat)
+    return results
+
+
+def credstore(framework: StratustrykeFramework, creds: list, workdir: Path, repeat: int) -> dict:
+    '''Store the credentials in a new credstore, then time opening it, hydrating / querying credentials, and migrating a copy
+    whose data is in the legacy format'''
+    path = workdir/'credstore.sqlite'
+    store = CredentialStoreConnector(framework, str(path))
+    started = time.perf_counter()
+    for cred in creds: store.store_credential(cred)
+    results = {'store_all': time.perf_counter() - started}
+    store._conn.close()
+
+    results['open'] = timed(lambda: CredentialStoreConnector(framework, str(path))._conn.close(), repeat)
+
+    store = CredentialStoreConnector(framework, str(path))
+    aliases = list(store)
+    def hydrate_all():
+        store.load_credentials() # drop hydrated objects so each run builds them again
+        for alias in aliases: store[alias]
+    results['hydrate_all'] = timed(hydrate_all, repeat)
+    results['query_workspace'] = timed(lambda: [store.query(workspace=f'workspace-{i}') for i in range(WORKSPACES)], repeat) / WORKSPACES
+    store._conn.close()
+
+    # Migration of a store written before JSON serialization (schema version 2) re-encodes every credential
+    if legacy_encode(creds[0]) in (None, str(creds[0])): return results
+    def migrate():
+        legacy_path = workdir/'legacy.sqlite'
+        shutil.copyfile(path, legacy_path)
+        conn = sqlite3.connect(str(legacy_path))
+        with conn:
+            conn.executemany('UPDATE credentials SET data = ? WHERE alias = ?', [(legacy_encode(cred), cred._alias) for cred in creds])
+            conn.execute('PRAGMA user_version = 2')
+        conn.close()
+        started = time.perf_counter()
+        CredentialStoreConnector(framework, str(legacy_path))._conn.close()
+        elapsed = time.perf_counter() - started
+        legacy_path.unlink()
+        return elapsed
+    results['migrate_legacy'] = statistics.median(migrate() for _ in range(repeat))
+    return results
+
+
+def print_results(results: dict, count: int) -> None:
+    print(f'{"Benchmark":<20}{"Wall (s)":>10}{"Creds/s":>12}')
+    for name, wall in results.items():
+        per_sec = f'{count / wall:>12.0f}' if (wall > 0 and name != 'query_workspace') else f'{"-":>12}'
+        print(f'{name:<20}{wall:>10.3f}{per_sec}')
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Benchmark stratustryke credential serialization and the credstore')
+    parser.add_argument('--creds', type=int, default=10000, help='number of credentials (default: 10000)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark (the median is reported)')
+    parser.add_argument('--output', default=None, help='results JSON path (default: ~/.local/share/stratustryke/benchmarks/credstore_<timestamp>.json)')
+    parser.add_argument('--compare', default=None, help='previous results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=10.0, help='percent slowdown counted as a regression with --compare (exit status 1)')
+    args = parser.parse_args()
+
+    output = Path(args.output) if (args.output != None) else home_dir()/'benchmarks'/f'credstore_{datetime.now().strftime("%Y%m%d_%H%M%S")}.json'
+    workdir = Path(tempfile.mkdtemp(prefix='stratustryke-bench-'))
+    environ = {key: os.environ.get(key, None) for key in ('HOME', 'USERPROFILE')}
+    try:
+        # Keep the framework's data directory (credstore, logs, module index) out of the user's ~/.local/share/stratustryke
+        for key in environ: os.environ[key] = str(workdir)
+        framework = StratustrykeFramework(stdout=open(os.devnull, 'w'))
+        creds = make_credentials(args.creds)
+        repeat = max(1, args.repeat)
+        print(f'[*] Timing serialization of {args.creds} credentials', file=sys.stderr)
+        results = serialization(creds, repeat)
+        print(f'[*] Timing credstore operations on {args.creds} credentials', file=sys.stderr)
+        results.update(credstore(framework, creds, workdir, repeat))
+    finally:
+        for key, val in environ.items():
+            if val == None: os.environ.pop(key, None)
+            else: os.environ[key] = val
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results = {name: round(wall, 4) for name, wall in results.items()}
+    report = {
+        'version': __version__,
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'creds': args.creds,
+        'repeat': args.repeat,
+        'results': results
+    }
+
+    os.makedirs(output.parent, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+
+    print_results(results, args.creds)
+    print(f'\nResults written to {output}')
+
+    if args.compare != None:
+        baseline = json.loads(Path(args.compare).read_text())
+        if baseline.get('creds', None) != args.creds:
+            print('Warning: credential count differs from the baseline; timings are not directly comparable')
+        regressions = []
+        for name, wall in results.items():
+            old = baseline.get('results', {}).get(name, None)
+            if old == None or old <= 0: continue
+            change = (wall - old) / old * 100
+            print(f'  {name}: {old:.3f}s -> {wall:.3f}s ({change:+.1f}%)')
+            if change > args.threshold: regressions.append(name)
+        if regressions:
+            print(f'\n{len(regressions)} regression(s) beyond {args.threshold:.0f}%')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,9 +4,24 @@ from __future__ import unicode_literals
 
 import argparse
 import logging
+import sys
 
 from stratustryke import __version__
-from stratustryke.core.interface import InteractiveInterpreter
+
+
+def run_headless(arguments) -> int:
+	'''Run a single module without the interactive interpreter; returns the process exit status'''
+	from stratustryke.core.headless import HeadlessRunner, parse_assignment, EXIT_USAGE_ERROR
+
+	try:
+		options = [parse_assignment(value) for value in arguments.options]
+		configs = [parse_assignment(value) for value in arguments.configs]
+	except ValueError as err:
+		print(f'stratustryke.py run: error: {err}', file=sys.stderr)
+		return EXIT_USAGE_ERROR
+
+	runner = HeadlessRunner(arguments.output)
+	return runner.run(arguments.module, arguments.cred, options, configs, arguments.all_creds, arguments.workspace, arguments.parallel, arguments.profile, arguments.resume)
 
 
 def main():
@@ -14,6 +29,19 @@ def main():
 	parser.add_argument('-v', '--version', action='version', version=parser.prog + ' Version: ' + __version__)
 	parser.add_argument('--log-level', dest='loglvl', action='store', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'], default='CRITICAL', help='set the logging level')
 	parser.add_argument('--rc-file', dest='resource_file', default=None, help='execute a resource file')
+
+	subparsers = parser.add_subparsers(dest='command', metavar='command')
+	run_parser = subparsers.add_parser('run', help='run a single module non-interactively and exit with its status')
+	run_parser.add_argument('module', help='full path of the module to run (e.g., aws/iam/enum/get_caller_identity)')
+	run_parser.add_argument('--cred', dest='cred', default=None, help='credstore alias to load into the module')
+	run_parser.add_argument('--set', dest='options', action='append', default=[], metavar='OPTION=VALUE', help='set a module option (repeatable)')
+	run_parser.add_argument('--config', dest='configs', action='append', default=[], metavar='CONFIG=VALUE', help='set a framework config (repeatable)')
+	run_parser.add_argument('--all-creds', dest='all_creds', action='store_true', help='run the module once per stored credential it accepts in the workspace')
+	run_parser.add_argument('--workspace', dest='workspace', default=None, help='workspace to take credentials from with --all-creds (default: WORKSPACE config)')
+	run_parser.add_argument('--parallel', dest='parallel', type=int, default=None, help='max module instances run concurrently with --all-creds')
+	run_parser.add_argument('--resume', dest='resume', action='store_true', help='continue from the checkpoint of a previous run with the same options, skipping completed work')
+	run_parser.add_argument('--profile', dest='profile', action='store_true', help='profile the run (cProfile / tracemalloc) and save reports under ~/.local/share/stratustryke/profiles')
+	run_parser.add_argument('--output', dest='output', choices=['text', 'jsonl'], default='text', help='text: console output to stdout; jsonl: result records as JSON lines to stdout, console output to stderr')
 	arguments = parser.parse_args()
 
 	logging.getLogger('').setLevel(logging.DEBUG)
@@ -21,6 +49,14 @@ def main():
 	console_log_handler.setLevel(getattr(logging, arguments.loglvl))
 	console_log_handler.setFormatter(logging.Formatter("%(levelname)-8s %(message)s"))
 	logging.getLogger('').addHandler(console_log_handler)
+
+	if arguments.command == 'run':
+		status = run_headless(arguments)
+		logging.shutdown()
+		sys.exit(status)
+
+	from stratustryke.core.interface import InteractiveInterpreter
+
 	rc_file = arguments.resource_file
 	del arguments, parser
 
@@ -0,0 +1,256 @@
+# Author: @vexance
+# Purpose: Opt-in SQLite cache of read-only AWS API responses shared across modules (AWS_CACHE config / 'cache' command)
+#
+
+import base64
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+from stratustryke.lib import aws_cache_filepath
+from stratustryke.settings import AWS_CACHE_ENABLED, AWS_CACHE_TTL, AWS_CACHE_OPERATION_TTLS
+
+
+# Operations are cacheable if their name starts with one of these; other operations bypass the cache
+CACHEABLE_PREFIXES = ('Describe', 'List', 'Get')
+
+# Operations that don't change account state; any other successful call invalidates cached responses for its service / region
+READ_ONLY_PREFIXES = CACHEABLE_PREFIXES + ('Head', 'Lookup', 'Search', 'Scan', 'Query', 'BatchGet', 'Select', 'Simulate', 'Validate', 'Estimate')
+
+# Never cached: identity / temporary credential services and read-only operations returning secrets or short-lived tokens
+UNCACHEABLE_SERVICES = {'sts', 'sso', 'sso-oidc', 'signin'}
+UNCACHEABLE_OPERATIONS = {
+    'secretsmanager:GetSecretValue', 'secretsmanager:BatchGetSecretValue', 'ssm:GetParameter', 'ssm:GetParameters',
+    'ssm:GetParametersByPath', 'ssm:GetParameterHistory', 'ec2:GetPasswordData', 'ecr:GetAuthorizationToken',
+    'ecr-public:GetAuthorizationToken', 'codeartifact:GetAuthorizationToken', 'redshift:GetClusterCredentials',
+    'redshift:GetClusterCredentialsWithIAM', 'cognito-identity:GetCredentialsForIdentity', 'cognito-identity:GetOpenIdToken',
+    'cognito-identity:GetOpenIdTokenForDeveloperIdentity', 'eks:GetToken', 'lightsail:GetInstanceAccessDetails',
+    'ec2-instance-connect:SendSSHPublicKey'
+}
+
+# Cache database schema version (stored in PRAGMA user_version)
+SCHEMA_VERSION = 1
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS responses (
+        key TEXT PRIMARY KEY,
+        principal TEXT NOT NULL,
+        region TEXT,
+        service TEXT NOT NULL,
+        operation TEXT NOT NULL,
+        created REAL NOT NULL,
+        expires REAL NOT NULL,
+        response TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS responses_service ON responses (service, region)',
+    'CREATE INDEX IF NOT EXISTS responses_expires ON responses (expires)'
+]
+
+
+def encode_value(value):
+    '''json.dumps default= hook preserving the datetime / bytes values found in botocore parsed responses'''
+    if isinstance(value, datetime): return {'__datetime__': value.isoformat()}
+    if isinstance(value, (bytes, bytearray)): return {'__bytes__': base64.b64encode(value).decode()}
+    return str(value)
+
+
+def decode_value(obj: dict):
+    '''json.loads object_hook reversing encode_value()'''
+    if len(obj) == 1:
+        if '__datetime__' in obj: return datetime.fromisoformat(obj['__datetime__'])
+        if '__bytes__' in obj: return base64.b64decode(obj['__bytes__'])
+    return obj
+
+
+class AWSResponseCache(object):
+    '''
+    Caches successful responses of idempotent Describe* / List* / Get* AWS API calls made through pooled boto3 sessions (see
+    attach_boto_session()). Entries are keyed by (caller principal, region, service, operation, normalized parameters) and
+    expire after a per-operation TTL (AWS_CACHE_OPERATION_TTLS, else the AWS_CACHE_TTL config). Calls to other operations
+    always go to AWS, and a successful mutating call drops the cached responses for its service / region. The cache is
+    disabled unless the AWS_CACHE config is enabled.
+    '''
+
+    def __init__(self, path: str = None, enabled: bool = AWS_CACHE_ENABLED, ttl: float = AWS_CACHE_TTL) -> None:
+        self._logger = logging.getLogger('stratustryke.apicache')
+        self._lock = threading.RLock() # connection is shared with module worker threads
+        self._conn = None
+        self.path = Path(path) if (path != None) else None # default: lib.aws_cache_filepath()
+        self.enabled = enabled
+        self.ttl = ttl
+        self.hits = Counter() # (service, operation) => responses served from the cache (this session)
+        self.misses = Counter() # (service, operation) => cacheable calls sent to AWS (this session)
+        self._eligible = {} # (service, operation, streaming) => bool
+
+
+    def configure(self, enabled: bool, ttl: float = None, path: str = None) -> None:
+        '''Apply the AWS_CACHE / AWS_CACHE_TTL configs; the database is opened on first use'''
+        self.enabled = enabled
+        if ttl != None: self.ttl = ttl
+        if path != None and Path(path) != self.path:
+            with self._lock:
+                if self._conn != None: self._conn.close()
+                self._conn = None
+                self.path = Path(path)
+
+
+    def connection(self) -> sqlite3.Connection:
+        with self._lock:
+            if self._conn == None:
+                if self.path == None: self.path = aws_cache_filepath()
+                conn = sqlite3.connect(str(self.path), check_same_thread=False)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                if conn.execute('PRAGMA user_version').fetchone()[0] < SCHEMA_VERSION:
+                    with conn:
+                        for statement in SCHEMA:
+                            conn.execute(statement)
+                        conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+                self._conn = conn
+            return self._conn
+
+
+    def cacheable(self, service: str, operation: str, streaming: bool = False) -> bool:
+        key = (service, operation, streaming)
+        eligible = self._eligible.get(key, None)
+        if eligible == None:
+            eligible = self._eligible[key] = (not streaming) and operation.startswith(CACHEABLE_PREFIXES) and \
+                (service not in UNCACHEABLE_SERVICES) and (f'{service}:{operation}' not in UNCACHEABLE_OPERATIONS)
+        return eligible
+
+
+    def operation_ttl(self, service: str, operation: str) -> float:
+        return AWS_CACHE_OPERATION_TTLS.get(f'{service}:{operation}', self.ttl)
+
+
+    @staticmethod
+    def request_key(principal: str, region: str, service: str, operation: str, params: str) -> str:
+        material = json.dumps([principal, region, service, operation, params])
+        return hashlib.sha256(material.encode()).hexdigest()
+
+
+    def get(self, key: str):
+        ''':return: the cached parsed response for a request key, or None if absent / expired'''
+        with self._lock:
+            row = self.connection().execute('SELECT response FROM responses WHERE key = ? AND expires > ?', (key, time.time())).fetchone()
+        return json.loads(row[0], object_hook=decode_value) if (row != None) else None
+
+
+    def put(self, key: str, principal: str, region: str, service: str, operation: str, parsed: dict) -> None:
+        now = time.time()
+        response = json.dumps(parsed, default=encode_value)
+        with self._lock, self.connection() as conn:
+            conn.execute('INSERT OR REPLACE INTO responses (key, principal, region, service, operation, created, expires, response) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, principal, region, service, operation, now, now + self.operation_ttl(service, operation), response))
+
+
+    def invalidate(self, service: str, region: str = None) -> int:
+        '''Drop cached responses for a service (in one region if specified)
+        :return: int number of responses dropped'''
+        query, params = 'DELETE FROM responses WHERE service = ?', [service]
+        if region != None:
+            query, params = f'{query} AND region = ?', params + [region]
+        with self._lock, self.connection() as conn:
+            return conn.execute(query, params).rowcount
+
+
+    def clear(self, service: str = None, expired: bool = False) -> int:
+        '''Delete cached responses (only for a service and / or only expired ones, if specified)
+        :return: int number of responses deleted'''
+        clauses, params = [], []
+        if service != None: clauses, params = clauses + ['service = ?'], params + [service]
+        if expired: clauses, params = clauses + ['expires <= ?'], params + [time.time()]
+        where = f' WHERE {" AND ".join(clauses)}' if (len(clauses) > 0) else ''
+        with self._lock, self.connection() as conn:
+            count = conn.execute(f'DELETE FROM responses{where}', params).rowcount
+        if service == None and not expired:
+            self.hits.clear()
+            self.misses.clear()
+        return count
+
+
+    def stats(self) -> list:
+        ''':return: list[tuple] of (service, operation, entries, expired, bytes, hits, misses) for stored / requested operations'''
+        with self._lock:
+            rows = self.connection().execute('''SELECT service, operation, COUNT(*), SUM(expires <= ?), SUM(LENGTH(response))
+                                                FROM responses GROUP BY service, operation''', (time.time(),)).fetchall()
+        stats = {(service, operation): [entries, expired, nbytes] for service, operation, entries, expired, nbytes in rows}
+        for key in set(self.hits) | set(self.misses):
+            stats.setdefault(key, [0, 0, 0])
+        return sorted((service, operation, *counts, self.hits[(service, operation)], self.misses[(service, operation)])
+                      for (service, operation), counts in stats.items())
+
+
+    def attach_boto_session(self, session, principal) -> None:
+        '''Register event handlers on a boto3 session so cacheable calls from its clients are served from / stored to the cache
+        while it is enabled. Cached responses are stored as parsed before botocore's after-call handlers run, so those handlers
+        (e.g., IAM policy document decoding) process cache hits exactly as they do live responses.
+        :param principal: callable returning the caller identity the session's responses are cached under'''
+        def before_parameter_build(params = None, model = None, context = None, **kwargs):
+            if not self.enabled or context == None: return
+            service = model.service_model.service_name
+            if self.cacheable(service, model.name, model.has_streaming_output or model.has_event_stream_output):
+                context['stratustryke_cache_params'] = json.dumps(params, sort_keys=True, default=encode_value)
+
+        def before_call(model = None, request_signer = None, context = None, **kwargs):
+            if not self.enabled or context == None: return None
+            service, operation = model.service_model.service_name, model.name
+            region = getattr(request_signer, 'region_name', None)
+            params = context.pop('stratustryke_cache_params', None)
+            if params == None:
+                if not operation.startswith(READ_ONLY_PREFIXES): context['stratustryke_cache_mutation'] = (service, region)
+                return None
+
+            try:
+                identity = principal()
+                key = AWSResponseCache.request_key(identity, region, service, operation, params)
+                parsed = self.get(key)
+            except Exception as err:
+                self._logger.error(f'AWS response cache lookup failed for {service}:{operation}: {err}')
+                return None
+
+            if parsed != None:
+                self.hits[(service, operation)] += 1
+                from botocore.awsrequest import AWSResponse
+                return (AWSResponse(None, 200, {}, None), parsed)
+
+            self.misses[(service, operation)] += 1
+            context['stratustryke_cache_store'] = (key, identity, region, service, operation)
+            return None
+
+        def needs_retry(response = None, request_dict = None, **kwargs):
+            context = request_dict.get('context', None) if (request_dict != None) else None
+            if response == None or context == None: return None
+            http_response, parsed = response
+            if http_response.status_code >= 300: return None
+
+            try:
+                pending = context.pop('stratustryke_cache_store', None)
+                if pending != None and http_response.status_code == 200:
+                    key, identity, region, service, operation = pending
+                    self.put(key, identity, region, service, operation, parsed)
+
+                mutation = context.pop('stratustryke_cache_mutation', None)
+                if mutation != None:
+                    self.invalidate(*mutation)
+            except Exception as err:
+                self._logger.error(f'AWS response cache update failed: {err}')
+            return None # never changes botocore's retry decision
+
+        session.events.register('before-parameter-build', before_parameter_build)
+        session.events.register('before-call', before_call)
+        session.events.register('needs-retry', needs_retry)
+
+
+_CACHE = AWSResponseCache()
+
+
+def aws_response_cache() -> AWSResponseCache:
+    return _CACHE
@@ -0,0 +1,241 @@
+# Author: @vexance
+# Purpose: Persistent checkpoints of completed work units / findings so long-running modules can resume ('run --resume')
+#
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from datetime import datetime, timezone
+from pathlib import Path
+
+from stratustryke.settings import CHECKPOINT_BATCH_SIZE, CHECKPOINT_INTERVAL
+
+
+# Checkpoint store schema version (stored in PRAGMA user_version)
+SCHEMA_VERSION = 1
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS checkpoints (
+        key TEXT PRIMARY KEY,
+        module TEXT NOT NULL,
+        status TEXT NOT NULL,
+        completed INTEGER NOT NULL DEFAULT 0,
+        total INTEGER,
+        findings INTEGER NOT NULL DEFAULT 0,
+        created TEXT NOT NULL,
+        updated TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS checkpoints_module ON checkpoints (module, updated)',
+    'CREATE TABLE IF NOT EXISTS units (key TEXT NOT NULL, unit TEXT NOT NULL, PRIMARY KEY (key, unit)) WITHOUT ROWID',
+    '''CREATE TABLE IF NOT EXISTS findings (
+        key TEXT NOT NULL,
+        record_type TEXT NOT NULL,
+        message TEXT,
+        level TEXT NOT NULL,
+        fields TEXT NOT NULL,
+        UNIQUE (key, record_type, fields)
+    )''',
+    'CREATE INDEX IF NOT EXISTS findings_key ON findings (key)'
+]
+
+# Checkpoint status values
+STATUS_RUNNING = 'running' # run in progress (or the process died without closing the checkpoint)
+STATUS_INCOMPLETE = 'incomplete' # run was interrupted / raised, or returned with units left unfinished
+STATUS_COMPLETE = 'complete' # every unit finished
+
+
+def checkpoint_key(module_name: str, scope: dict) -> str:
+    '''Hash a module name and its checkpoint scope (see StratustrykeModule.checkpoint_scope()) into a checkpoint key; option
+    values (including sensitive ones such as passwords) are only stored as part of the hash'''
+    material = json.dumps([module_name, sorted((str(name), str(val)) for name, val in scope.items())])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+def timestamp() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
+
+
+class Checkpoint(object):
+    '''
+    Completed work units and findings for one module run. Units are strings identifying a piece of work (e.g., a wordlist
+    entry); completions and findings are buffered and written in batches (every CHECKPOINT_BATCH_SIZE entries or
+    CHECKPOINT_INTERVAL seconds) so a hard crash repeats at most one batch of units. Without a store (e.g., a module run
+    outside of 'run'), progress is only tracked in memory. Safe to use from worker threads.
+    '''
+
+    def __init__(self, store: 'CheckpointStore' = None, key: str = None, module_name: str = None, done: set = None,
+                 findings: int = 0, resumed: bool = False) -> None:
+        self._store = store
+        self.key = key
+        self.module_name = module_name
+        self.resumed = resumed
+        self.total = None
+        self.findings = findings
+        self._lock = threading.Lock()
+        self._done = set() if (done == None) else done
+        self._pending_units = []
+        self._pending_findings = []
+        self._last_flush = time.monotonic()
+        self._closed = False
+
+
+    @property
+    def completed(self) -> int:
+        return len(self._done)
+
+
+    def is_done(self, unit: str) -> bool:
+        return str(unit) in self._done
+
+
+    def pending(self, units: list) -> list:
+        '''Filter out units completed by a previous run; also records len(units) as the checkpoint total
+        :param units: list[str] every unit of work the run covers
+        :return: list[str] units still to be done, in their original order'''
+        self.total = len(units)
+        if len(self._done) == 0: return list(units)
+        return [unit for unit in units if str(unit) not in self._done]
+
+
+    def complete(self, unit: str) -> None:
+        '''Mark a unit as finished; only call once all of the unit's work (and findings) are done'''
+        unit = str(unit)
+        with self._lock:
+            if unit in self._done: return
+            self._done.add(unit)
+            if self._store == None: return
+            self._pending_units.append(unit)
+            self.flush_due()
+
+
+    def add_finding(self, record_type: str, message: str, level: str, fields: dict) -> None:
+        '''Persist a result emitted by the module (called from StratustrykeModule.emit()) so it can be replayed on resume'''
+        with self._lock:
+            self.findings += 1
+            if self._store == None: return
+            self._pending_findings.append((record_type, message, level, json.dumps(fields, default=str, sort_keys=True)))
+            self.flush_due()
+
+
+    def flush_due(self) -> None:
+        '''Flush if a full batch is pending or CHECKPOINT_INTERVAL has passed; caller holds the lock'''
+        pending = len(self._pending_units) + len(self._pending_findings)
+        if pending >= CHECKPOINT_BATCH_SIZE or (time.monotonic() - self._last_flush) >= CHECKPOINT_INTERVAL:
+            self._flush(STATUS_RUNNING)
+
+
+    def _flush(self, status: str) -> None:
+        units, findings = self._pending_units, self._pending_findings
+        self._pending_units, self._pending_findings = [], []
+        self._last_flush = time.monotonic()
+        self._store.save(self, units, findings, status)
+
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._store != None: self._flush(STATUS_RUNNING)
+
+
+    def close(self, finished: bool = False) -> str:
+        '''Write pending units / findings and the final status
+        :param finished: (bool) True if the module run returned without raising
+        :return: str checkpoint status'''
+        done = finished and (self.total == None or self.completed >= self.total)
+        status = STATUS_COMPLETE if done else STATUS_INCOMPLETE
+        with self._lock:
+            if self._closed: return status
+            self._closed = True
+            if self._store != None: self._flush(status)
+        return status
+
+
+class CheckpointStore(object):
+    '''SQLite database (lib.checkpoint_filepath()) of module checkpoints keyed by module and option hash'''
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._logger = logging.getLogger('stratustryke.checkpoint')
+        self._lock = threading.RLock() # connection is shared with module worker threads
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.migrate()
+
+
+    def migrate(self) -> None:
+        '''Create or upgrade the checkpoint schema to SCHEMA_VERSION'''
+        with self._lock:
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION: return
+            with self._conn:
+                for statement in SCHEMA:
+                    self._conn.execute(statement)
+                self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+    def open(self, module_name: str, key: str, resume: bool = False) -> Checkpoint:
+        '''Open the checkpoint for a module run. When resuming, previously completed units are loaded; otherwise any stored
+        progress for the key is discarded and the run starts fresh.'''
+        now = timestamp()
+        with self._lock, self._conn:
+            row = self._conn.execute('SELECT findings FROM checkpoints WHERE key = ?', (key,)).fetchone()
+            if resume and row != None:
+                done = set(unit for (unit,) in self._conn.execute('SELECT unit FROM units WHERE key = ?', (key,)))
+                self._conn.execute('UPDATE checkpoints SET status = ?, updated = ? WHERE key = ?', (STATUS_RUNNING, now, key))
+                self._logger.info(f'Resuming {module_name} checkpoint {key[:12]} with {len(done)} completed units')
+                return Checkpoint(self, key, module_name, done, row[0], True)
+
+            self._delete(key)
+            self._conn.execute('INSERT INTO checkpoints (key, module, status, created, updated) VALUES (?, ?, ?, ?, ?)',
+                               (key, module_name, STATUS_RUNNING, now, now))
+        return Checkpoint(self, key, module_name)
+
+
+    def save(self, checkpoint: Checkpoint, units: list, findings: list, status: str) -> None:
+        '''Write a batch of completed units / findings and the checkpoint's progress in one transaction'''
+        with self._lock, self._conn:
+            if len(units) > 0:
+                self._conn.executemany('INSERT OR IGNORE INTO units (key, unit) VALUES (?, ?)', ((checkpoint.key, unit) for unit in units))
+            if len(findings) > 0:
+                self._conn.executemany('INSERT OR IGNORE INTO findings (key, record_type, message, level, fields) VALUES (?, ?, ?, ?, ?)',
+                                       ((checkpoint.key, *finding) for finding in findings))
+            self._conn.execute('''UPDATE checkpoints SET status = ?, completed = ?, total = ?, updated = ?,
+                               findings = (SELECT COUNT(*) FROM findings WHERE key = checkpoints.key) WHERE key = ?''',
+                               (status, checkpoint.completed, checkpoint.total, timestamp(), checkpoint.key))
+
+
+    def findings(self, key: str) -> list:
+        ''':return: list[tuple] of (record_type, message, level, fields dict) stored for a checkpoint'''
+        with self._lock:
+            rows = self._conn.execute('SELECT record_type, message, level, fields FROM findings WHERE key = ? ORDER BY rowid', (key,)).fetchall()
+        return [(record_type, message, level, json.loads(fields)) for record_type, message, level, fields in rows]
+
+
+    def list(self, module_name: str = None) -> list:
+        ''':return: list[tuple] of (key, module, status, completed, total, findings, updated), most recently updated first'''
+        query = 'SELECT key, module, status, completed, total, findings, updated FROM checkpoints'
+        params = ()
+        if module_name != None:
+            query, params = f'{query} WHERE module = ?', (module_name,)
+        with self._lock:
+            return self._conn.execute(f'{query} ORDER BY updated DESC', params).fetchall()
+
+
+    def _delete(self, key: str) -> None:
+        '''Remove a checkpoint's rows; caller holds the lock and an open transaction'''
+        for table in ('units', 'findings', 'checkpoints'):
+            self._conn.execute(f'DELETE FROM {table} WHERE key = ?', (key,))
+
+
+    def clear(self, module_name: str = None) -> int:
+        '''Delete stored checkpoints (for one module, if specified)
+        :return: int number of checkpoints deleted'''
+        keys = [row[0] for row in self.list(module_name)]
+        with self._lock, self._conn:
+            for key in keys:
+                self._delete(key)
+        return len(keys)
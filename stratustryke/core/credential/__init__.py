@@ -1,19 +1,24 @@
 
+import json
+
 from ast import literal_eval
 
 from stratustryke.settings import DEFAULT_WORKSPACE
 
 
+# Version of the serialized credential format (the '_v' key of Credential.serialize() output). Data without a version
+# key is the legacy str(dict) representation and is read with literal_eval.
+SERIAL_VERSION = 1
+
+
 class Credential:
 
     CREDENTIAL_TYPE = 'Generic'
+    FIELDS = ('_alias', '_workspace', '_verified') # attributes persisted by serialize(); subclasses list only their own
 
     def __init__(self, alias: str, workspace: str = DEFAULT_WORKSPACE, verfied: bool = False, from_dict: str = None):
         if from_dict != None:
-            from_dict = literal_eval(from_dict)
-            for key in from_dict.keys():
-                attr = str(key)
-                self.__setattr__(attr, from_dict.get(key))
+            self.load_fields(from_dict)
             return
         else:
             self._alias = alias
@@ -21,12 +26,48 @@ class Credential:
             self._verified = verfied
 
 
+    @classmethod
+    def serial_fields(cls) -> tuple:
+        '''Persisted attribute names for the class (FIELDS collected across the class hierarchy; computed once per class)'''
+        fields = cls.__dict__.get('_serial_fields', None)
+        if fields == None:
+            fields = []
+            for klass in reversed(cls.__mro__):
+                for field in klass.__dict__.get('FIELDS', ()):
+                    if field not in fields: fields.append(field)
+            fields = tuple(fields)
+            cls._serial_fields = fields
+        return fields
+
+
+    @staticmethod
+    def deserialize(data: str) -> dict:
+        '''Decode serialized credential data (current JSON format or legacy str(dict) format) into a dict'''
+        if isinstance(data, dict):
+            return data
+        if data.startswith('{"'):
+            return json.loads(data)
+        return literal_eval(data)
+
+
+    def load_fields(self, data) -> None:
+        '''Set the credential's persisted attributes from serialized data or a dict; fields absent from the data are set to None'''
+        values = Credential.deserialize(data)
+        for field in self.serial_fields():
+            setattr(self, field, values.get(field, None))
+
+
+    def to_dict(self) -> dict:
+        return {field: getattr(self, field, None) for field in self.serial_fields()}
+
+
+    def serialize(self) -> str:
+        '''Encode the credential as compact JSON (stored in the credstore)'''
+        return json.dumps({'_v': SERIAL_VERSION, **self.to_dict()}, separators=(',', ':'), default=str)
+
+
     def __str__(self) -> str:
-        builder = {}
-        builder['_alias'] = self._alias
-        builder['_verified'] = self._verified
-        builder['_workspace'] = self._workspace
-        return str(builder)
+        return self.serialize()
 
     
     def to_string(self) -> str:
@@ -34,6 +75,9 @@ class Credential:
 
 
 class GenericCredential(Credential):
+
+    FIELDS = ('_secretname', '_secretvalue')
+
     def __init__(self, alias: str, workspace: str = DEFAULT_WORKSPACE, verfied: bool = False, secret_name: str = None, secret_value: str = None, from_dict: dict = None):
         if from_dict != None:
             return super().__init__(alias, from_dict=from_dict)
@@ -43,17 +87,10 @@ class GenericCredential(Credential):
             self._secretvalue = secret_value
 
 
-    def __str__(self) -> str:
-        tmp = super().__str__()
-        builder = literal_eval(tmp)
-        builder['_secretname'] = self._secretname
-        builder['_secretvalue'] = self._secretvalue
-        return str(builder)
-
-
 class APICredential(Credential):
 
     CREDENTIAL_TYPE = 'API'
+    FIELDS = ('_auth_type', '_secret', '_endpoint')
 
     def __init__(self, alias: str, workspace: str = DEFAULT_WORKSPACE, verfied: bool = False, auth_type: str = None, secret: str = None, endpoint: str = None, from_dict: dict = None):
         if from_dict != None:
@@ -64,16 +101,11 @@ class APICredential(Credential):
             self._secret = secret
             self._endpoint = endpoint
 
-    def __str__(self) -> str:
-        tmp = super().__str__()
-        builder = literal_eval(tmp)
-        builder['_auth_type'] = self._auth_type
-        builder['_secret'] = self._secret
-        builder['_endpoint'] = self._endpoint
-        return str(builder)
-
 
 class CloudCredential(Credential):
+
+    FIELDS = ('_account_id', '_cred_id')
+
     def __init__(self, alias: str, workspace: str = DEFAULT_WORKSPACE, verfied: bool = False, acc_id: str = None, cred_id: str = None, from_dict: dict = None):
         if from_dict != None:
             return super().__init__(alias, from_dict=from_dict)
@@ -81,10 +113,3 @@ class CloudCredential(Credential):
             super().__init__(alias, workspace, verfied)
             self._account_id = acc_id
             self._cred_id = cred_id
-
-    def __str__(self) -> str:
-        tmp = super().__str__()
-        builder = literal_eval(tmp)
-        builder['_account_id'] = self._account_id
-        builder['_cred_id'] = self._cred_id
-        return str(builder)
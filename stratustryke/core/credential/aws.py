@@ -1,25 +1,254 @@
-import boto3
+import hashlib
+import threading
+import time
+import typing
 
-from ast import literal_eval
-from requests_auth_aws_sigv4 import AWSSigV4
-from re import match as regex_match
+from collections import OrderedDict
+from datetime import timezone
+from re import match as regex_match, sub as re_sub
 
 from stratustryke.core.credential import CloudCredential
-from stratustryke.settings import AWS_DEFAULT_REGION, AWS_SINGULAR_DEFAULT_REGION, DEFAULT_WORKSPACE
+from stratustryke.core.ratelimit import rate_limiters
+from stratustryke.core.metrics import api_metrics
+from stratustryke.core.apicache import aws_response_cache
+from stratustryke.settings import AWS_DEFAULT_REGION, AWS_SINGULAR_DEFAULT_REGION, DEFAULT_WORKSPACE, AWS_CLIENT_POOL_SIZE, AWS_CLIENT_POOLS, AWS_IDENTITY_CACHE_TTL
+from stratustryke.settings import AWS_ASSUME_ROLE_CACHE_SIZE, AWS_ASSUME_ROLE_REFRESH_MARGIN
+from stratustryke.settings import CONNECT_TIMEOUT, READ_TIMEOUT, RETRY_MODE, MAX_ATTEMPTS, TCP_KEEPALIVE, AWS_MAX_POOL_CONNECTIONS
 from stratustryke.lib import StratustrykeException
 from stratustryke.lib.regex import AWS_ROLE_ARN_REGEX
 
+if typing.TYPE_CHECKING: # only for annotations; imported on first use so loading the framework doesn't pay for them
+    import boto3
+    import botocore.config
+    from requests_auth_aws_sigv4 import AWSSigV4
+
+
+def client_options(connect_timeout: float = None, read_timeout: float = None, retry_mode: str = None, max_attempts: int = None,
+                   max_pool_connections: int = None, tcp_keepalive: bool = None) -> dict:
+    '''Build botocore.config.Config keyword args for a timeout / retry policy; arguments left as None are omitted'''
+    options = {}
+    if connect_timeout != None: options['connect_timeout'] = connect_timeout
+    if read_timeout != None: options['read_timeout'] = read_timeout
+    if max_pool_connections != None: options['max_pool_connections'] = max_pool_connections
+    if tcp_keepalive != None: options['tcp_keepalive'] = tcp_keepalive
+
+    retries = {}
+    if retry_mode != None: retries['mode'] = retry_mode
+    if max_attempts != None: retries['total_max_attempts'] = max(1, max_attempts)
+    if len(retries) > 0: options['retries'] = retries
+    return options
+
+
+class AWSClientPool(object):
+    '''Thread-safe cache of boto3 sessions (per region / client options) and clients (per service, region, config) for one set
+    of AWS keys. Every session and client is created with the framework-wide client options (see configure_clients()) as its
+    default config. Clients are evicted least-recently-used once max_clients is exceeded.'''
+
+    def __init__(self, access_key: str, secret_key: str, session_token: str, max_clients: int = AWS_CLIENT_POOL_SIZE) -> None:
+        self._access_key_id = access_key
+        self._secret_key = secret_key
+        self._session_token = session_token
+        self._max_clients = max_clients
+        self._limiter_id = _pool_id(access_key, secret_key, session_token)[:16] # rate limiters are per host / credential
+        self._base_session = None # region-less session clients are created from; its loader caches service models for all regions
+        self._principal = None # caller identity cached API responses are keyed under; see principal()
+        self._principal_lock = threading.Lock()
+        self._sessions = {}
+        self._clients = OrderedDict()
+        self._lock = threading.RLock() # boto3.Session objects are not safe to create clients from concurrently
+
+
+    @staticmethod
+    def config_key(config) -> str:
+        '''Hashable key for a botocore.config.Config object (Config does not implement __eq__ / __hash__)'''
+        if config == None: return None
+        options = getattr(config, '_user_provided_options', None)
+        if options == None: return str(id(config))
+        return repr(sorted(options.items()))
+
+
+    @staticmethod
+    def client_config(options: dict = None) -> 'botocore.config.Config':
+        '''botocore Config for the framework-wide client options, with options (e.g., module overrides) layered on top'''
+        from botocore.config import Config
+        return Config(**{**_CLIENT_OPTIONS, **(options or {})})
+
+
+    def base_session(self) -> 'boto3.Session':
+        '''Returns the region-less boto3 session shared by the pool, creating it if necessary'''
+        import boto3
+
+        with self._lock:
+            if self._base_session == None:
+                self._base_session = boto3.Session(self._access_key_id, self._secret_key, self._session_token)
+                self._base_session._session.set_default_client_config(AWSClientPool.client_config())
+                aws_response_cache().attach_boto_session(self._base_session, self.principal) # first, so cache hits skip the limiter / metrics
+                rate_limiters().attach_boto_session(self._base_session, self._limiter_id)
+                api_metrics().attach_boto_session(self._base_session)
+            return self._base_session
+
+
+    def session(self, region: str, options: dict = None) -> 'boto3.Session':
+        '''Returns the cached boto3 session for the region, creating it if necessary. Clients created from the session default to
+        the framework-wide client options overridden by options (see client_options())'''
+        import boto3
+
+        key = (region, repr(sorted(options.items())) if options else None)
+        with self._lock:
+            session = self._sessions.get(key, None)
+            if session == None:
+                session = boto3.Session(self._access_key_id, self._secret_key, self._session_token, region)
+                # Share the base session's data loader so service models are only parsed once across regions
+                session._session.register_component('data_loader', self.base_session()._session.get_component('data_loader'))
+                session._session.set_default_client_config(AWSClientPool.client_config(options))
+                aws_response_cache().attach_boto_session(session, self.principal)
+                rate_limiters().attach_boto_session(session, self._limiter_id)
+                api_metrics().attach_boto_session(session)
+                self._sessions[key] = session
+            return session
+
+
+    def client(self, service: str, region: str, config = None, options: dict = None):
+        '''Returns a cached boto3 client for the service / region / config, creating it if necessary. The client's config is
+        the framework-wide client options, overridden by options (see client_options()), overridden by config'''
+        if options:
+            from botocore.config import Config
+            config = Config(**options).merge(config) if (config != None) else Config(**options)
+        key = (service, region, AWSClientPool.config_key(config))
+
+        with self._lock:
+            client = self._clients.get(key, None)
+            if client != None:
+                self._clients.move_to_end(key)
+                return client
+
+            client = self.base_session().client(service, region_name=region, config=config)
+            self._clients[key] = client
+            while len(self._clients) > self._max_clients:
+                self._clients.popitem(last=False)
+            return client
+
+
+    def principal(self) -> str:
+        '''Caller identity (sts:GetCallerIdentity ARN) of the pool's keys, resolved once per pool. Assumed-role session names are
+        dropped so that sessions of the same role share cached API responses; if the call fails, a digest of the keys is used'''
+        if self._principal != None: return self._principal
+        with self._principal_lock:
+            if self._principal == None:
+                pool_id = _pool_id(self._access_key_id, self._secret_key, self._session_token)
+                cached = _IDENTITIES.get(pool_id, None)
+                try:
+                    arn = cached[2] if (cached != None) else self.client('sts', AWS_SINGULAR_DEFAULT_REGION).get_caller_identity()['Arn']
+                except Exception:
+                    arn = f'keys:{pool_id[:16]}'
+                self._principal = re_sub(r'^(arn:[^:]+:sts::[0-9]+:assumed-role/[^/]+)/.*$', r'\1', arn)
+            return self._principal
+
+
+    def invalidate(self) -> None:
+        '''Drop all cached sessions and clients'''
+        with self._lock:
+            self._base_session = None
+            self._principal = None
+            self._sessions.clear()
+            self._clients.clear()
+
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+# Pools are keyed by a digest of the key material so that AWSCredential objects rebuilt from the same
+# keys (e.g., AWSModule.get_cred() / the credstore) share sessions and clients
+_POOLS = OrderedDict()
+_POOLS_LOCK = threading.Lock()
+
+
+# Framework-wide botocore Config options (timeouts / retries / connection pooling) for every pooled session and client
+_CLIENT_OPTIONS = client_options(CONNECT_TIMEOUT, READ_TIMEOUT, RETRY_MODE, MAX_ATTEMPTS, AWS_MAX_POOL_CONNECTIONS, TCP_KEEPALIVE)
+
+
+# Verified caller identities (sts:GetCallerIdentity) keyed the same way; pool_id => (expiry, account, arn, user_id)
+_IDENTITIES = {}
+_IDENTITY_LOCKS = {} # pool_id => Lock; one sts:GetCallerIdentity call in flight per set of keys
+_IDENTITIES_LOCK = threading.Lock() # guards the two dicts above; never held across a network call
+
+
+# Assumed-role sessions (sts:AssumeRole) keyed by (source pool_id, role arn, external id, policy digest, duration, session name)
+# => (expires_on epoch, access key, secret key, session token, assumed role arn, account id, expiry string); LRU evicted
+_ASSUMED_ROLES = OrderedDict()
+_ASSUMED_ROLE_LOCKS = {} # key => Lock; one sts:AssumeRole call in flight per key
+_ASSUMED_ROLES_LOCK = threading.Lock() # guards the two dicts above
+
+
+def _identity_lock(pool_id: str) -> threading.Lock:
+    with _IDENTITIES_LOCK:
+        return _IDENTITY_LOCKS.setdefault(pool_id, threading.Lock())
+
+
+def _assumed_role_lock(key: tuple) -> threading.Lock:
+    with _ASSUMED_ROLES_LOCK:
+        return _ASSUMED_ROLE_LOCKS.setdefault(key, threading.Lock())
+
+
+def _pool_id(access_key: str, secret_key: str, session_token: str) -> str:
+    material = f'{access_key}:{secret_key}:{session_token}'.encode()
+    return hashlib.sha256(material).hexdigest()
+
+
+def get_client_pool(access_key: str, secret_key: str, session_token: str) -> AWSClientPool:
+    '''Return the shared AWSClientPool for a set of AWS keys'''
+    pool_id = _pool_id(access_key, secret_key, session_token)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(pool_id, None)
+        if pool != None:
+            _POOLS.move_to_end(pool_id)
+            return pool
+
+        pool = AWSClientPool(access_key, secret_key, session_token)
+        _POOLS[pool_id] = pool
+        while len(_POOLS) > AWS_CLIENT_POOLS:
+            _POOLS.popitem(last=False)[1].invalidate()
+        return pool
+
+
+def configure_clients(options: dict) -> None:
+    '''Set the framework-wide client options (see client_options()). Cached sessions and clients were built with the previous
+    options, so every pool is invalidated if they changed; sessions / clients already handed out keep their old config.'''
+    global _CLIENT_OPTIONS
+    with _POOLS_LOCK:
+        if options == _CLIENT_OPTIONS: return
+        _CLIENT_OPTIONS = dict(options)
+        pools = list(_POOLS.values())
+
+    for pool in pools:
+        pool.invalidate()
+
+
+def invalidate_client_pool(access_key: str, secret_key: str, session_token: str) -> None:
+    '''Drop the shared AWSClientPool (and all cached sessions / clients) for a set of AWS keys'''
+    pool_id = _pool_id(access_key, secret_key, session_token)
+    with _POOLS_LOCK:
+        pool = _POOLS.pop(pool_id, None)
+    with _IDENTITIES_LOCK:
+        _IDENTITIES.pop(pool_id, None)
+    if pool != None:
+        pool.invalidate()
+
 
 class AWSCredential(CloudCredential):
 
     CREDENTIAL_TYPE = 'AWS'
+    FIELDS = ('_access_key_id', '_secret_key', '_session_token', '_default_region', '_arn', '_user_id', '_expiry')
 
     def __init__(self, alias: str, workspace: str = DEFAULT_WORKSPACE, verfied: bool = False, acc_id: str = None, 
         cred_id: str = None, access_key: str = None, secret_key: str = None, session_token: str = None, 
-        default_region: str = AWS_DEFAULT_REGION, arn: str = None, from_dict: dict = None):
+        default_region: str = AWS_DEFAULT_REGION, arn: str = None, expiry: str = None, from_dict: dict = None):
         
         if from_dict != None:
-            return super().__init__(alias,from_dict=from_dict)
+            super().__init__(alias, from_dict=from_dict)
+            self._session = None
+            self.client_options = None
         else:
             super().__init__(alias, workspace, verfied, acc_id, cred_id)
             self._access_key_id = access_key
@@ -27,19 +256,10 @@ class AWSCredential(CloudCredential):
             self._session_token = session_token
             self._default_region = default_region
             self._arn = arn
+            self._user_id = None
+            self._expiry = expiry # UTC 'YYYY-MM-DDTHH:MM:SSZ' for temporary (STS) credentials
             self._session = None
-
-
-    def __str__(self) -> str:
-        tmp = super().__str__()
-        builder = literal_eval(tmp)
-        builder['_access_key_id'] = self._access_key_id
-        builder['_secret_key'] = self._secret_key
-        builder['_session_token'] = self._session_token
-        builder['_default_region'] = self._default_region
-        builder['_arn'] = self._arn
-        builder['_session'] = None # can't really copy a boto3.Session object as a string
-        return str(builder)
+            self.client_options = None # client option overrides for sessions / clients (e.g., module advanced options); not persisted
 
 
     @property
@@ -69,13 +289,13 @@ class AWSCredential(CloudCredential):
             else: return None
 
 
-    def session(self, region = None) -> boto3.Session:
-        '''Returns a botocore session for the creds'''
+    def session(self, region = None) -> 'boto3.Session':
+        '''Returns a botocore session for the creds (cached per region in the credential's client pool)'''
         session_region = region if (region != None) else self._default_region
         if session_region == AWS_DEFAULT_REGION: session_region = AWS_SINGULAR_DEFAULT_REGION # protect against __DEFAULT__ making its way here accidentaly
         # Create botocore session with either specified or default region
         try:
-            self._session = boto3.Session(self._access_key_id, self._secret_key, self._session_token, session_region)
+            self._session = self.client_pool().session(session_region, self.client_options)
         except Exception as err:
             self._session = None
             raise StratustrykeException(f'Unable to get Botocore session for AWS credential \'{self._access_key_id}\'\n{err}')
@@ -83,33 +303,93 @@ class AWSCredential(CloudCredential):
         return self._session
 
 
-    def verify(self) -> bool:
-        '''Performs an STS get-caller-identity call in order to determine the access_key_id, secret_key, and session_token are valid'''
-        session = self.session(AWS_SINGULAR_DEFAULT_REGION) # Might need to hardcode region in case __DEFAULT__ is defaulted to
-        try:
-            client = session.client('sts')
-            res = client.get_caller_identity()
+    def client(self, service: str, region: str = None, config = None):
+        '''Returns a (pooled) boto3 client for the service in the specified region
+        :param service: boto3 service name (e.g., 'ec2', 'sts')
+        :param region: AWS region for the client; uses the credential's default region if not specified
+        :param config: optional botocore.config.Config object'''
+        client_region = region if (region != None) else self._default_region
+        if client_region == AWS_DEFAULT_REGION: client_region = AWS_SINGULAR_DEFAULT_REGION
 
-            self._account_id = res['Account']
-            self._arn = res['Arn']
-            self._user_id = res['UserId']
-            self._verified = True
+        try:
+            return self.client_pool().client(service, client_region, config, self.client_options)
         except Exception as err:
-            raise StratustrykeException(f'Failed to perform sts:GetCallerIdentity for \'{self._access_key_id}\' {err}')
+            raise StratustrykeException(f'Unable to create {service} client for AWS credential \'{self._access_key_id}\'\n{err}')
+
+
+    def client_pool(self) -> AWSClientPool:
+        '''Returns the session / client pool for the credential's current keys. If the keys were changed (rotated)
+        since the pool was last retrieved, the pool for the previous keys is invalidated.'''
+        keys = (self._access_key_id, self._secret_key, self._session_token)
+        previous = getattr(self, '_pool_keys', None)
+        if (previous != None) and (previous != keys):
+            invalidate_client_pool(*previous)
+        self._pool_keys = keys
+        return get_client_pool(*keys)
+
+
+    def invalidate(self) -> None:
+        '''Drop cached boto3 sessions, clients, and caller identity for the credential (call after rotating / revoking keys)'''
+        previous = getattr(self, '_pool_keys', None)
+        if previous != None:
+            invalidate_client_pool(*previous)
+        invalidate_client_pool(self._access_key_id, self._secret_key, self._session_token)
+        self._pool_keys = None
+        self._session = None
+
+
+    def verify(self, use_cache: bool = True) -> bool:
+        '''Performs an STS get-caller-identity call in order to determine the access_key_id, secret_key, and session_token are valid.
+        Results are cached per set of keys for AWS_IDENTITY_CACHE_TTL seconds unless use_cache is False'''
+        pool_id = _pool_id(self._access_key_id, self._secret_key, self._session_token)
+
+        def cached_identity() -> bool:
+            with _IDENTITIES_LOCK:
+                cached = _IDENTITIES.get(pool_id, None)
+            if use_cache and (cached != None) and (cached[0] > time.monotonic()):
+                _, self._account_id, self._arn, self._user_id = cached
+                self._verified = True
+                return True
+            return False
+
+        if cached_identity(): return True
+
+        # Concurrent callers with the same keys wait for one STS call rather than duplicating it
+        with _identity_lock(pool_id):
+            if cached_identity(): return True
+
+            try:
+                client = self.client('sts', AWS_SINGULAR_DEFAULT_REGION) # Might need to hardcode region in case __DEFAULT__ is defaulted to
+                res = client.get_caller_identity()
+
+                self._account_id = res['Account']
+                self._arn = res['Arn']
+                self._user_id = res['UserId']
+                self._verified = True
+            except Exception as err:
+                with _IDENTITIES_LOCK:
+                    _IDENTITIES.pop(pool_id, None)
+                raise StratustrykeException(f'Failed to perform sts:GetCallerIdentity for \'{self._access_key_id}\' {err}')
+
+            with _IDENTITIES_LOCK:
+                _IDENTITIES[pool_id] = (time.monotonic() + AWS_IDENTITY_CACHE_TTL, self._account_id, self._arn, self._user_id)
 
         return True
     
 
     def assume_role(self, role: str, ext_id: str = 'stratustryke', policy: str = None, duration: int = 15,
                     region: str = None, session_name: str = 'stratustryke', workspace: str = DEFAULT_WORKSPACE,
-                    alias: str = 'AssumedRoleCred') -> CloudCredential:
+                    alias: str = 'AssumedRoleCred', use_cache: bool = True) -> CloudCredential:
         '''Performs an STS assume-role call, tuple<bool, CloudCredential> with success status, assumed role credentials.
+        Sessions are cached per source keys / role / external id / policy / duration / session name and reused until they are
+        within AWS_ASSUME_ROLE_REFRESH_MARGIN seconds of expiry (unless use_cache is False)
         :param role: Can be either just the role name (will use current account id to build the target role ARN), or a full role ARN
         :param ext_id: String external id if necessary to assume the role
         :param policy: String (or JSON) policy to use as inline session policy to restrict permissions
         :param duration: Number of minutes to assume the role for [default: 15]
         :param region: Default AWS region for the new AWSCredential object
         :param session_name: String name for the assumed role session [default: stratustryke]
+        :param use_cache: Reuse a cached, unexpired session for identical parameters rather than calling sts:AssumeRole
         :return: AWSCredential object for the assumed role creds
         '''
 
@@ -125,30 +405,54 @@ class AWSCredential(CloudCredential):
         if policy == None: # If policy not supplied, pass one allowing *:*
             policy = '{"Version": "2012-10-17", "Statement": {"Effect": "Allow", "Action": "*", "Resource": "*"} }'
 
-        try: 
-            session = self.session(region if (region != '__DEFAULT__') else AWS_SINGULAR_DEFAULT_REGION)
-            client = session.client('sts')
-            res = client.assume_role(RoleSessionName=session_name, RoleArn=role, DurationSeconds=duration, ExternalId=ext_id, Policy=policy)
+        source_id = _pool_id(self._access_key_id, self._secret_key, self._session_token)
+        key = (source_id, role, ext_id, hashlib.sha256(policy.encode()).hexdigest(), duration, session_name)
 
-            access_key = res.get('Credentials', {}).get('AccessKeyId', False)
-            secret_key = res.get('Credentials', {}).get('SecretAccessKey', False)
-            token = res.get('Credentials', {}).get('SessionToken', False)
+        with _assumed_role_lock(key):
+            with _ASSUMED_ROLES_LOCK:
+                cached = _ASSUMED_ROLES.get(key, None)
+                if cached != None: _ASSUMED_ROLES.move_to_end(key)
 
-            arn = res.get('AssumeRoleUser', {}).get('Arn', None)
-            acc_id = arn.split(':')[4] if (arn != None) else None
+            if (not use_cache) or (cached == None) or (cached[0] - time.time() <= AWS_ASSUME_ROLE_REFRESH_MARGIN):
+                try:
+                    client = self.client('sts', region if (region != '__DEFAULT__') else AWS_SINGULAR_DEFAULT_REGION)
+                    res = client.assume_role(RoleSessionName=session_name, RoleArn=role, DurationSeconds=duration, ExternalId=ext_id, Policy=policy)
 
-            if not all([access_key, secret_key, token]):
-                raise StratustrykeException(f'Did not retrieve all of aws_acess_key_id, aws_secret_access_key, aws_session_token')
+                    access_key = res.get('Credentials', {}).get('AccessKeyId', False)
+                    secret_key = res.get('Credentials', {}).get('SecretAccessKey', False)
+                    token = res.get('Credentials', {}).get('SessionToken', False)
+                    expiration = res.get('Credentials', {}).get('Expiration', None)
+                    expiry = expiration.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ') if (expiration != None) else None
 
-            return AWSCredential(alias, access_key=access_key, secret_key=secret_key, session_token=token,
-                                 default_region=region, workspace=workspace, arn=arn, acc_id=acc_id)
-        
-        except Exception as err:
-            raise StratustrykeException(f'Exception thrown performing sts:AssumeRole for {role}\n{err}')
+                    arn = res.get('AssumeRoleUser', {}).get('Arn', None)
+                    acc_id = arn.split(':')[4] if (arn != None) else None
 
+                    if not all([access_key, secret_key, token]):
+                        raise StratustrykeException(f'Did not retrieve all of aws_acess_key_id, aws_secret_access_key, aws_session_token')
 
-    def sigv4(self, service: str, region: str = None) -> AWSSigV4:
+                except Exception as err:
+                    raise StratustrykeException(f'Exception thrown performing sts:AssumeRole for {role}\n{err}')
+
+                expires_on = expiration.timestamp() if (expiration != None) else time.time() + duration
+                cached = (expires_on, access_key, secret_key, token, arn, acc_id, expiry)
+                with _ASSUMED_ROLES_LOCK:
+                    _ASSUMED_ROLES[key] = cached
+                    _ASSUMED_ROLES.move_to_end(key)
+                    while len(_ASSUMED_ROLES) > AWS_ASSUME_ROLE_CACHE_SIZE:
+                        evicted, _ = _ASSUMED_ROLES.popitem(last=False)
+                        _ASSUMED_ROLE_LOCKS.pop(evicted, None)
+
+        _, access_key, secret_key, token, arn, acc_id, expiry = cached
+        assumed = AWSCredential(alias, access_key=access_key, secret_key=secret_key, session_token=token,
+                                default_region=region, workspace=workspace, arn=arn, acc_id=acc_id, expiry=expiry)
+        assumed.client_options = self.client_options
+        return assumed
+
+
+    def sigv4(self, service: str, region: str = None) -> 'AWSSigV4':
         '''Returns and AWSSigV4 object for the credential that can be used to sign HTTP requests'''
+        from requests_auth_aws_sigv4 import AWSSigV4
+
         if region == None: region = self._default_region
         return AWSSigV4(
             service,
@@ -11,10 +11,7 @@ class GCPCredential(CloudCredential):
         cred_id: str = None, acc_id: str = None, from_dict: dict = None):
 
         if from_dict != None:
-            return super.__init__(alias, from_dict=from_dict)
+            return super().__init__(alias, from_dict=from_dict)
 
         super().__init__(alias, workspace, verified, cred_id, acc_id)
 
-    def __str__(self) -> str:
-        return super().__str__()
-
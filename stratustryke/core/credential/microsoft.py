@@ -1,18 +1,166 @@
 
-import azure.identity
+import hashlib
+import logging
+import threading
+import time
 
 from re import match as regex_match
-from ast import literal_eval
 
 from stratustryke.core.credential import CloudCredential
-from stratustryke.settings import DEFAULT_WORKSPACE
+from stratustryke.settings import DEFAULT_WORKSPACE, MSFT_TOKEN_REFRESH_MARGIN, MSFT_TOKEN_IDLE_TIMEOUT
 from stratustryke.lib import StratustrykeException
 from stratustryke.lib.regex import UUID_LOWERCASE_REGEX
 
 
+class _CachedToken(object):
+    __slots__ = ('token', 'expires_on', 'last_used', 'fetch', 'store')
+
+    def __init__(self, token: str, expires_on: int, fetch = None, store = None) -> None:
+        self.token = token
+        self.expires_on = expires_on
+        self.last_used = time.time()
+        self.fetch = fetch # callable() -> (token, expires_on) used for background renewal
+        self.store = store # optional persistent store (credstore) the renewed token is saved to
+
+
+class MicrosoftTokenCache(object):
+    '''
+    Process-wide cache of Microsoft access tokens, one per (tenant, principal, secret digest, scope) key. The azure.identity
+    credential objects tokens are requested from are cached per identity as well.\n
+    A background thread renews tokens MSFT_TOKEN_REFRESH_MARGIN seconds before they expire, as long as they have been used
+    within the last MSFT_TOKEN_IDLE_TIMEOUT seconds; callers switching between scopes are served from memory.
+    '''
+
+    MIN_VALIDITY = 60 # seconds of remaining lifetime for a cached token to be handed out
+
+    def __init__(self, refresh_margin: int = MSFT_TOKEN_REFRESH_MARGIN, idle_timeout: int = MSFT_TOKEN_IDLE_TIMEOUT) -> None:
+        self._logger = logging.getLogger('stratustryke.credential.microsoft')
+        self._refresh_margin = refresh_margin
+        self._idle_timeout = idle_timeout
+        self._tokens = {} # key => _CachedToken
+        self._identities = {} # identity key => azure.identity credential object
+        self._key_locks = {} # key => Lock; one token request in flight per key
+        self._cond = threading.Condition() # guards the dicts above; notified when the refresh schedule changes
+        self._refresher = None
+
+
+    def identity(self, key: tuple, factory):
+        '''Return the cached azure.identity credential object for an identity, creating it with factory() if necessary'''
+        with self._cond:
+            identity = self._identities.get(key, None)
+            if identity == None:
+                identity = factory()
+                self._identities[key] = identity
+            return identity
+
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        with self._cond:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+
+    def _valid(self, entry: _CachedToken, now: float) -> bool:
+        return (entry != None) and (entry.expires_on - now > MicrosoftTokenCache.MIN_VALIDITY)
+
+
+    def get(self, key: str, fetch, store = None, refresh = None) -> str:
+        '''Return a valid access token for the key, requesting one with fetch() on a miss
+        :param key: cache key (see MicrosoftCredential.token_key())
+        :param fetch: callable() -> tuple(token, expires_on) requesting a new token
+        :param store: optional token store (CredentialStoreConnector) consulted on a miss and updated with new tokens
+        :param refresh: callable used for background renewal instead of fetch (e.g., one that never prompts the user)'''
+        with self._cond:
+            entry = self._tokens.get(key, None)
+            if self._valid(entry, time.time()):
+                entry.last_used = time.time()
+                return entry.token
+
+        with self._key_lock(key):
+            now = time.time()
+            with self._cond:
+                entry = self._tokens.get(key, None)
+            if self._valid(entry, now): # fetched by another thread while we waited
+                entry.last_used = now
+                return entry.token
+
+            persisted = store.load_token(key) if (store != None) else None
+            if persisted != None and persisted[1] - now > MicrosoftTokenCache.MIN_VALIDITY:
+                token, expires_on = persisted
+            else:
+                token, expires_on = fetch()
+                if store != None: store.save_token(key, token, expires_on)
+
+            with self._cond:
+                self._tokens[key] = _CachedToken(token, expires_on, refresh if (refresh != None) else fetch, store)
+                self._start_refresher()
+                self._cond.notify_all()
+
+        return token
+
+
+    def invalidate(self, prefix: str = '') -> None:
+        '''Drop cached tokens whose key starts with prefix (all tokens by default)'''
+        with self._cond:
+            for key in [key for key in self._tokens.keys() if key.startswith(prefix)]:
+                del self._tokens[key]
+
+
+    def _start_refresher(self) -> None:
+        if self._refresher == None or not self._refresher.is_alive():
+            self._refresher = threading.Thread(target=self._refresh_loop, name='stratustryke-msft-tokens', daemon=True)
+            self._refresher.start()
+
+
+    def _refresh_loop(self) -> None:
+        while True:
+            with self._cond:
+                now = time.time()
+                active = [(key, entry) for key, entry in self._tokens.items()
+                          if entry.fetch != None and (now - entry.last_used) < self._idle_timeout]
+                due = [(key, entry) for key, entry in active if entry.expires_on - self._refresh_margin <= now]
+
+                if len(due) == 0:
+                    upcoming = [entry.expires_on - self._refresh_margin for _, entry in active]
+                    # Idle tokens aren't renewed; re-check at least once per idle timeout in case they are used again
+                    wait = (min(upcoming) - now) if (len(upcoming) > 0) else self._idle_timeout
+                    self._cond.wait(timeout=max(1, wait))
+                    continue
+
+            for key, entry in due:
+                with self._key_lock(key):
+                    try:
+                        token, expires_on = entry.fetch()
+                    except Exception as err:
+                        self._logger.warning(f'Background refresh of Microsoft access token failed; it will be requested again on next use: {err}')
+                        entry.fetch = None # don't retry in the background
+                        continue
+
+                    if expires_on <= entry.expires_on: # identity handed back the same token; it will be requested again on next use
+                        entry.fetch = None
+                        continue
+
+                    if entry.store != None:
+                        try:
+                            entry.store.save_token(key, token, expires_on)
+                        except Exception as err:
+                            self._logger.warning(f'Unable to persist refreshed Microsoft access token: {err}')
+
+                    with self._cond:
+                        entry.token, entry.expires_on = token, expires_on
+                self._logger.info(f'Refreshed Microsoft access token for scope {key.rsplit("|", 1)[-1]}')
+
+
+_TOKEN_CACHE = MicrosoftTokenCache()
+
+
+def token_cache() -> MicrosoftTokenCache:
+    return _TOKEN_CACHE
+
+
 class MicrosoftCredential(CloudCredential):
 
     CREDENTIAL_TYPE = 'MSFT'
+    FIELDS = ('_principal', '_secret', '_tenant', '_refresh_token', '_interactive', '_token_scope', '_auth_record')
 
     AZ_CLI_CLIENT_ID = '04b07795-8ddb-461a-bbee-02f9e1bf7b46'
     ARM_TOKEN_SCOPE = 'https://management.azure.com/.default'
@@ -20,6 +168,7 @@ class MicrosoftCredential(CloudCredential):
     KEYVAULT_TOKEN_SCOPE = 'https://vault.azure.net/.default'
     STORAGE_TOKEN_SCOPE = 'https://storage.azure.com/.default'
     ACR_TOKEN_SCOPE = 'https://containerregistry.azure.net/.default'
+    AZ_MGMT_TOKEN_SCOPE = ARM_TOKEN_SCOPE
 
 
     # For AzureCredential, the account_id will indicate the subscription id
@@ -28,6 +177,7 @@ class MicrosoftCredential(CloudCredential):
         tenant: str = None, interactive: bool = False, refresh_token: str = None,
         token_scope: str = GRAPH_TOKEN_SCOPE):
 
+        self.token_store = None # set to the credstore to persist access tokens across restarts (MSFT_PERSIST_TOKENS)
         if from_dict != None:
             return super().__init__(alias, from_dict=from_dict)
         else:
@@ -38,68 +188,102 @@ class MicrosoftCredential(CloudCredential):
             self._refresh_token = refresh_token
             self._interactive = interactive
             self._token_scope = token_scope
+            self._auth_record = None # serialized azure.identity AuthenticationRecord of the interactively signed-in account
 
 
-    def __str__(self) -> str:
-        tmp = super().__str__()
-        builder = literal_eval(tmp)
-        builder['_principal'] = self._principal
-        builder['_secret'] = self._secret
-        builder['_tenant'] = self._tenant
-        builder['_refresh_token'] = self.refresh_token
-        builder['_interactive'] = self._interactive
-        builder['_token_scope'] = self._token_scope
-        return str(builder)
+    def get_refresh_token(self) -> str:
+        if self._refresh_token: return self._refresh_token
 
 
+    def is_interactive(self) -> bool:
+        return (self._interactive) or (self._principal == None and self._secret == None)
 
 
-    def get_refresh_token(self) -> str:
-        if self._refresh_token: return self._refresh_token
+    def signed_in_account(self) -> str:
+        '''home_account_id of the interactively signed-in account (from the auth record), or None before sign in'''
+        if self._auth_record == None: return None
+        from azure.identity import AuthenticationRecord
+        return AuthenticationRecord.deserialize(self._auth_record).home_account_id
 
 
-    def access_token(self, scope: str = None) -> str:
-        '''Retrieve access token for the given scope. NOTE: Cannot overwrite scope if the access token has already been set'''
-        
-        # Scope is unchanged & access token has already been retrieved
-        if (scope == self._token_scope or scope == None) and self._access_token != None:
-            return self._access_token
-        
-        # This might break things but we'll see :|
-        elif (scope != self._token_scope) and self._access_token != None:
-            # raise StratustrykeException('Cannot re-scope existing Microsoft Graph access token')
-            return self._access_token
-        
-        TOKEN_SCOPE = scope if (scope != None) else self._token_scope
-        
-
-        if (self._interactive) or (self._principal == None and self._secret == None):
+    def identity_key(self) -> tuple:
+        '''Key identifying the principal / secret tokens are requested for (the secret is only included as a digest). Interactive
+        credentials are keyed by the signed-in account, or by the credential id / alias until one has signed in, so different
+        users of a tenant never share tokens'''
+        digest = hashlib.sha256(str(self._secret).encode()).hexdigest()[:16] if (self._secret != None) else ''
+        if self.is_interactive():
+            account = self.signed_in_account()
+            principal = f'interactive:{account}' if (account != None) else f'interactive:cred:{self._cred_id or self._alias}'
+            return (str(self._tenant), principal, digest)
+        return (str(self._tenant), str(self._principal), digest)
+
+
+    def token_key(self, scope: str) -> str:
+        return '|'.join([*self.identity_key(), scope])
+
+
+    def build_identity(self):
+        '''Create the azure.identity credential object used to request tokens for this credential'''
+        import azure.identity # deferred; only needed when a token must actually be requested
+
+        if self.is_interactive():
             try:
-                cred = azure.identity.DeviceCodeCredential(client_id=AZ_CLI_CLIENT_ID, tenant_id=self._tenant)
+                record = azure.identity.AuthenticationRecord.deserialize(self._auth_record) if (self._auth_record != None) else None
+                # Never prompt from get_token(); request_token() decides whether a device code sign in may be started
+                return azure.identity.DeviceCodeCredential(client_id=MicrosoftCredential.AZ_CLI_CLIENT_ID, tenant_id=self._tenant, authentication_record=record,
+                                                           disable_automatic_authentication=True)
             except Exception as err:
                 raise StratustrykeException(f'Error getting interactive browser credentials: {err}')
-        
-        else:
 
-            if not all([self._tenant, self._principal, self._secret]): raise StratustrykeException('Missing at least one of AUTH_TENANT, AUTH_PRINCIPAL, and AUTH_SECRET')
+        if not all([self._tenant, self._principal, self._secret]): raise StratustrykeException('Missing at least one of AUTH_TENANT, AUTH_PRINCIPAL, and AUTH_SECRET')
 
-            try:
-                # Likely service principal as this is set as a UUID
-                if regex_match(UUID_LOWERCASE_REGEX, self._principal):
-                    cred = azure.identity.ClientSecretCredential(tenant_id=self._tenant, client_id=self._principal, client_secret=self._secret)
-                else:  # Can't be a service principal; use default client_id for azure CLI
-                    cred = azure.identity.UsernamePasswordCredential(tenant_id=self._tenant, username=self._principal, password=self._secret, client_id=AZ_CLI_CLIENT_ID)
+        try:
+            # Likely service principal as this is set as a UUID
+            if regex_match(UUID_LOWERCASE_REGEX, self._principal):
+                return azure.identity.ClientSecretCredential(tenant_id=self._tenant, client_id=self._principal, client_secret=self._secret)
+            else:  # Can't be a service principal; use default client_id for azure CLI
+                return azure.identity.UsernamePasswordCredential(tenant_id=self._tenant, username=self._principal, password=self._secret, client_id=MicrosoftCredential.AZ_CLI_CLIENT_ID)
 
-            except Exception as err:
-                raise StratustrykeException(f'Error during service principal / user auth: {err}')
+        except Exception as err:
+            raise StratustrykeException(f'Error during service principal / user auth: {err}')
 
-        access_token = cred.get_token(TOKEN_SCOPE)
-        token = str(access_token.token)
 
+    def request_token(self, scope: str, prompt: bool = True) -> tuple:
+        '''Request a new access token for the scope; returns tuple(token, expires_on epoch seconds). For interactive credentials
+        whose session can't be refreshed silently, the device code sign in is run again only if prompt is set; otherwise
+        azure.identity.AuthenticationRequiredError is raised (background renewal leaves the token to be requested on next use)'''
+        import azure.identity
 
-        if token == None: raise StratustrykeException('Unable to obtain Microsoft access token')
-        
-        return token
+        identity = token_cache().identity(self.identity_key(), self.build_identity)
+        try:
+            access_token = identity.get_token(scope)
+        except azure.identity.AuthenticationRequiredError:
+            if not prompt: raise
+            self.sign_in(scope, identity) # session expired / revoked; sign in again on the same identity
+            access_token = identity.get_token(scope)
+        if access_token == None or access_token.token == None: raise StratustrykeException('Unable to obtain Microsoft access token')
+
+        return str(access_token.token), int(access_token.expires_on)
 
 
+    def sign_in(self, scope: str, identity = None) -> None:
+        '''Run the interactive (device code) sign in (on a new identity unless one is given) and record the signed-in account,
+        so tokens are keyed by that account. The identity holding the session is cached under the account's key for later
+        token requests'''
+        if identity == None: identity = self.build_identity()
+        try:
+            record = identity.authenticate(scopes=[scope])
+        except Exception as err:
+            raise StratustrykeException(f'Interactive authentication failed: {err}')
 
+        self._auth_record = record.serialize()
+        token_cache().identity(self.identity_key(), lambda: identity)
+
+
+    def access_token(self, scope: str = None) -> str:
+        '''Retrieve access token for the given scope (default: the credential's token scope). Tokens are cached per
+        tenant / principal / scope and renewed in the background before they expire'''
+        token_scope = scope if (scope != None) else self._token_scope
+        if self.is_interactive() and self._auth_record == None: self.sign_in(token_scope)
+        return token_cache().get(self.token_key(token_scope), lambda: self.request_token(token_scope), self.token_store,
+                                 lambda: self.request_token(token_scope, prompt=False))
@@ -1,11 +1,14 @@
-
+import json
 import sqlite3
 import logging
+import threading
+import time
 import collections.abc
 
+from datetime import datetime, timezone
 from pathlib import Path
 
-from stratustryke.core.credential import Credential, CloudCredential, GenericCredential, APICredential
+from stratustryke.core.credential import Credential, CloudCredential, GenericCredential, APICredential, SERIAL_VERSION
 from stratustryke.core.credential.aws import AWSCredential
 from stratustryke.core.credential.microsoft import MicrosoftCredential
 from stratustryke.core.credential.gcp import GCPCredential
@@ -13,90 +16,173 @@ from stratustryke.core.module.aws import AWSModule
 from stratustryke.core.module.microsoft import MicrosoftModule
 
 
+# Credstore schema version (stored in PRAGMA user_version). Version 0/1 databases hold a single 'stratustryke' table
+# with one serialized 'as_str' column per credential; they are migrated to the 'credentials' table on connect.
+# Version 3 re-encodes legacy str(dict) credential data as JSON (see Credential.serialize()).
+# Version 4 adds the 'tokens' table of persisted access tokens (MSFT_PERSIST_TOKENS).
+SCHEMA_VERSION = 4
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS credentials (
+        alias TEXT PRIMARY KEY,
+        cred_type TEXT NOT NULL,
+        workspace TEXT NOT NULL,
+        account_id TEXT,
+        expiry TEXT,
+        data TEXT NOT NULL
+    )''',
+    'CREATE INDEX IF NOT EXISTS credentials_workspace ON credentials (workspace, alias)',
+    'CREATE INDEX IF NOT EXISTS credentials_type ON credentials (cred_type)',
+    'CREATE INDEX IF NOT EXISTS credentials_account ON credentials (account_id)',
+    'CREATE INDEX IF NOT EXISTS credentials_expiry ON credentials (expiry)',
+    'CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, token TEXT NOT NULL, expires_on INTEGER NOT NULL)'
+]
+
+# cred_type column value => credential class used to hydrate the stored data
+CREDENTIAL_CLASSES = {
+    'Generic': GenericCredential,
+    'API': APICredential,
+    'AWS': AWSCredential,
+    'MSFT': MicrosoftCredential,
+    'GCP': GCPCredential
+}
+
+
 class CredentialStoreConnector(collections.abc.Mapping):
+    '''Mapping of credential alias => credential object backed by the sqlite credstore. Only the indexed metadata columns
+    are read on startup; a credential object is built from its stored data the first time it is accessed.'''
+
     def __init__(self, framework, conn_str: str) -> None:
         self._framework = framework
         self._conn_str = conn_str
         self._logger = logging.getLogger('stratustryke.credstore')
-        self._creds = {}
+        self._lock = threading.RLock() # connection is shared with module worker threads
+        self._index = {} # alias => (cred_type, workspace, account_id, expiry)
+        self._creds = {} # alias => hydrated credential object
 
         self._conn = self.connect_credstore(self._conn_str)
 
-        if self._conn != None:        
-            self.load_credentials()   
+        if self._conn != None:
+            self.load_credentials()
 
     def __getitem__(self, key):
-        return self._creds[key]
+        cred = self._creds.get(key, None)
+        if cred == None:
+            cred = self.hydrate(key) # raises KeyError for unknown aliases
+        return cred
+
+    def __contains__(self, key):
+        return key in self._index # Mapping's default would hydrate the credential via __getitem__
 
     def __iter__(self):
-        return iter(self._creds)
+        return iter(self._index)
 
     def __len__(self):
-        return len(self._creds)
+        return len(self._index)
 
 
     def connect_credstore(self, conn_str: str):
         conn_path = Path(conn_str)
         if conn_path.exists() and conn_path.is_file():
-            # attempt to create the sqlite connection
-            conn = sqlite3.connect(conn_str)
             self._logger.info(f'Connected to sqlite database at: {conn_path}')
         else: # we'll need to initialize it
             self._logger.info(f'Initializing credstore sqlite database at: {conn_path}')
-            conn = sqlite3.connect(conn_str)
-            cursor = conn.cursor()
-            res = cursor.execute('CREATE TABLE stratustryke (alias TEXT PRIMARY KEY, cred_type TEXT NOT NULL, workspace TEXT NOT NULL, as_str TEXT NOT NULL);')
-            cursor.close()
+
+        try:
+            conn = sqlite3.connect(conn_str, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.migrate(conn)
+        except Exception as err:
+            self._logger.error(f'Exception thrown while connecting to credstore {conn_path}: {err}')
+            self._framework.print_warning('Unable to open stratustryke credstore')
+            return None
 
         return conn
 
 
-    def load_credentials(self):
-        '''Read the rows from the database table and create associated credentials objects'''
-        cursor = self._conn.cursor()
+    def migrate(self, conn: sqlite3.Connection) -> None:
+        '''Create or upgrade the credstore schema to SCHEMA_VERSION'''
+        version = conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
 
+        with conn: # single transaction; a failed migration leaves the legacy table untouched
+            for statement in SCHEMA:
+                conn.execute(statement)
+
+            legacy = conn.execute('SELECT name FROM sqlite_master WHERE type = \'table\' AND name = \'stratustryke\'').fetchone()
+            if legacy != None:
+                rows = conn.execute('SELECT alias, cred_type, workspace, as_str FROM stratustryke').fetchall()
+                self._logger.info(f'Migrating {len(rows)} credentials to credstore schema version {SCHEMA_VERSION}')
+
+                migrated = []
+                for alias, cred_type, workspace, as_str in rows:
+                    try:
+                        account_id = Credential.deserialize(as_str).get('_account_id', None)
+                    except Exception:
+                        account_id = None
+                    migrated.append((alias, cred_type, workspace, account_id, None, as_str))
+
+                conn.executemany('INSERT OR IGNORE INTO credentials (alias, cred_type, workspace, account_id, expiry, data) VALUES (?, ?, ?, ?, ?, ?)', migrated)
+                conn.execute('DROP TABLE stratustryke')
+
+            if version < 3:
+                encoded = []
+                for alias, data in conn.execute('SELECT alias, data FROM credentials WHERE data NOT LIKE \'{"%\'').fetchall():
+                    try:
+                        encoded.append((json.dumps({'_v': SERIAL_VERSION, **Credential.deserialize(data)}, separators=(',', ':'), default=str), alias))
+                    except Exception as err: # left in the legacy format; still readable by Credential.deserialize()
+                        self._logger.warning(f'Unable to re-encode stored credential {alias}: {err}')
+                conn.executemany('UPDATE credentials SET data = ? WHERE alias = ?', encoded)
+
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+    def load_credentials(self):
+        '''Read credential metadata (alias, type, workspace, account, expiry) from the database; credential objects are
+        built on first access'''
         try:
-            res = cursor.execute('SELECT alias, cred_type, workspace, as_str FROM stratustryke;')
+            with self._lock:
+                rows = self._conn.execute('SELECT alias, cred_type, workspace, account_id, expiry FROM credentials').fetchall()
         except Exception as err:
             self._logger.error(f'Exception thrown while loading credentials from credstore')
             self._logger.error(f'{err}')
             self._framework.print_warning('Unable to load credentials from stratustryke credstore')
             return {}
-            
-        for result in res.fetchall():
-            if len(result) != 4:
-                continue
-            alias = result[0]
-            cred_type = result[1]
-            workspace = result[2]
-            str_rep = result[3]
-            if cred_type == 'Generic':
-                cred = GenericCredential(alias, workspace, from_dict=str_rep)
-            elif cred_type == 'API':
-                cred = APICredential(alias, workspace, from_dict=str_rep)
-            elif cred_type == 'AWS':
-                cred = AWSCredential(alias, workspace, from_dict=str_rep)
-            elif cred_type == 'MSFT':
-                cred = MicrosoftCredential(alias, workspace, from_dict=str_rep)
-            elif cred_type == 'GCP':
-                cred = GCPCredential(alias, workspace, from_dict=str_rep)
-            else:
-                self._logger.error(f'Could not import credential {alias} due to unsupported credential type: {cred_type}')
-                continue
-            
-            self._creds[alias] = cred
-        
-        cursor.close()
+
+        self._index = {alias: (cred_type, workspace, account_id, expiry) for alias, cred_type, workspace, account_id, expiry in rows}
+        self._creds = {}
+
+
+    def hydrate(self, alias: str) -> Credential:
+        '''Build the credential object for an alias from its stored data'''
+        cred_type, workspace, _, _ = self._index[alias]
+
+        cred_class = CREDENTIAL_CLASSES.get(cred_type, None)
+        if cred_class == None:
+            self._logger.error(f'Could not import credential {alias} due to unsupported credential type: {cred_type}')
+            raise KeyError(alias)
+
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM credentials WHERE alias = ?', (alias,)).fetchone()
+        if row == None: # removed by another stratustryke instance
+            self._index.pop(alias, None)
+            raise KeyError(alias)
+
+        cred = cred_class(alias, workspace, from_dict=row[0])
+        self._creds[alias] = cred
+        return cred
 
 
     def set_module_creds(self, module, cred):
         '''Update module options based off the type of credential'''
         cred_type = self.get_cred_type(cred)
         opts = module._options
-        
+
         if cred_type == Credential.CREDENTIAL_TYPE:
             pass
-        
+
         elif cred_type == APICredential.CREDENTIAL_TYPE:
             pass
 
@@ -107,7 +193,7 @@ class CredentialStoreConnector(collections.abc.Mapping):
             opts.set_opt(AWSModule.OPT_AWS_REGION, cred._default_region)
 
         elif cred_type == 'MSFT':
-            opts.set_opt(MicrosoftModule.OPT_AUTH_TOKEN, cred._access_token)
+            opts.set_opt(MicrosoftModule.OPT_AUTH_TOKEN, cred._refresh_token)
             opts.set_opt(MicrosoftModule.OPT_AUTH_PRINCIPAL, cred._principal)
             opts.set_opt(MicrosoftModule.OPT_AUTH_SECRET, cred._secret)
             opts.set_opt(MicrosoftModule.OPT_AUTH_TENANT, cred._tenant)
@@ -117,6 +203,15 @@ class CredentialStoreConnector(collections.abc.Mapping):
             pass
 
 
+    def module_cred_type(self, module) -> str:
+        '''Return the type of stored credential set_module_creds() can load into the module, or None if it takes none'''
+        if isinstance(module, AWSModule):
+            return AWSCredential.CREDENTIAL_TYPE
+        elif isinstance(module, MicrosoftModule):
+            return MicrosoftCredential.CREDENTIAL_TYPE
+        return None
+
+
     def get_cred_type(self, cred: CloudCredential) -> str:
         '''Return the string representation of the type of credential based of its class'''
         if isinstance(cred, GenericCredential):
@@ -130,7 +225,7 @@ class CredentialStoreConnector(collections.abc.Mapping):
         elif isinstance(cred, GCPCredential):
             cred_type = 'GCP'
         else:
-            self._framework.print_error(f'Unable to store unknown credential type: {cred_type}')
+            self._framework.print_error(f'Unable to store unknown credential type: {type(cred).__name__}')
             cred_type = 'Unknown'
 
         return cred_type
@@ -139,31 +234,30 @@ class CredentialStoreConnector(collections.abc.Mapping):
     def store_credential(self, cred: Credential) -> bool:
         '''Save a CloudCredential object into the sqlite database'''
         cred_type = self.get_cred_type(cred)
+        account_id = getattr(cred, '_account_id', None)
+        expiry = getattr(cred, '_expiry', None)
         try:
-            cursor = self._conn.cursor()
-            query = f'INSERT INTO stratustryke VALUES (\"{cred._alias}\", \"{cred_type}\", \"{cred._workspace}\", \"{str(cred)}\")'
-            cursor.execute(query)
-            self._conn.commit()
-            cursor.close()
+            with self._lock, self._conn:
+                self._conn.execute('INSERT INTO credentials (alias, cred_type, workspace, account_id, expiry, data) VALUES (?, ?, ?, ?, ?, ?)',
+                                   (cred._alias, cred_type, cred._workspace, account_id, expiry, str(cred)))
 
+            self._index[cred._alias] = (cred_type, cred._workspace, account_id, expiry)
             self._creds[cred._alias] = cred
             self._framework.print_status(f'Stored {cred_type} credential with alias: {cred._alias}')
             self._logger.info(f'Stored {cred_type} credential with alias: {cred._alias}')
         except Exception as err:
             self._framework.print_error(f'Exception thrown while storing credential: {cred._alias} - {err}')
             return False
-        
+
         return True
-        
+
 
     def remove_credential(self, alias: str) -> bool:
         try:
-            cursor = self._conn.cursor()
-            query = f'DELETE FROM stratustryke WHERE alias="{alias}"'
-            cursor.execute(query)
-            self._conn.commit()
-            cursor.close()
+            with self._lock, self._conn:
+                self._conn.execute('DELETE FROM credentials WHERE alias = ?', (alias,))
 
+            self._index.pop(alias, None)
             self._creds.pop(alias, None)
             self._framework.print_status(f'Removed credential: {alias}')
         except Exception as err:
@@ -173,20 +267,63 @@ class CredentialStoreConnector(collections.abc.Mapping):
         return True
 
 
+    def query(self, workspace: str = None, cred_type: str = None, account_id: str = None, active: bool = False) -> list:
+        '''Return metadata for stored credentials matching the supplied filters without building credential objects
+        :param workspace: only return credentials in this workspace
+        :param cred_type: only return credentials of this type (e.g., 'AWS', 'MSFT')
+        :param account_id: only return credentials for this account / subscription id
+        :param active: exclude credentials whose expiry has passed
+        :return: list[tuple] of (alias, cred_type, workspace, account_id, expiry) sorted by alias'''
+        clauses, params = [], []
+        if workspace != None:
+            clauses.append('workspace = ?')
+            params.append(workspace)
+        if cred_type != None:
+            clauses.append('cred_type = ?')
+            params.append(cred_type)
+        if account_id != None:
+            clauses.append('account_id = ?')
+            params.append(account_id)
+        if active:
+            clauses.append('(expiry IS NULL OR expiry > ?)')
+            params.append(datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'))
+
+        where = f' WHERE {" AND ".join(clauses)}' if (len(clauses) > 0) else ''
+        with self._lock:
+            return self._conn.execute(f'SELECT alias, cred_type, workspace, account_id, expiry FROM credentials{where} ORDER BY alias', params).fetchall()
+
+
+    def load_token(self, key: str) -> tuple:
+        '''Return a persisted access token as tuple(token, expires_on), or None if there isn't an unexpired one'''
+        try:
+            with self._lock:
+                row = self._conn.execute('SELECT token, expires_on FROM tokens WHERE key = ? AND expires_on > ?', (key, int(time.time()))).fetchone()
+        except Exception as err:
+            self._logger.error(f'Exception thrown while loading access token from credstore: {err}')
+            return None
+
+        return row
+
+
+    def save_token(self, key: str, token: str, expires_on: int) -> None:
+        '''Persist an access token (replacing any previous token for the key); expired tokens are purged'''
+        try:
+            with self._lock, self._conn:
+                self._conn.execute('INSERT OR REPLACE INTO tokens (key, token, expires_on) VALUES (?, ?, ?)', (key, token, int(expires_on)))
+                self._conn.execute('DELETE FROM tokens WHERE expires_on <= ?', (int(time.time()),))
+        except Exception as err:
+            self._logger.error(f'Exception thrown while saving access token to credstore: {err}')
+
+
     def list_aliases(self, workspace: str = None) -> list:
         '''Returns credential aliases for a given workspace.
         :return: list[str]'''
         if workspace == None:
-            return [str(key) for key in self._creds.keys()]
+            return [str(key) for key in self._index.keys()]
 
-        out = []
-        for key in self._creds.keys():
-            cred = self._creds[key]
-            if cred._workspace == workspace:
-                out.append(str(key))
-        return out
+        return [str(alias) for alias, (_, cred_workspace, _, _) in self._index.items() if cred_workspace == workspace]
 
-    # # Todo: Query database and see if a credential entries exists with the supplied alias
-    # def cred_alias_exists(self, alias: str) -> bool:
-    #     return True
 
+    def cred_type(self, alias: str) -> str:
+        '''Return the stored type of a credential without building the credential object'''
+        return self._index[alias][0]
@@ -3,22 +3,32 @@
 # Credit: Heavily inspired by @zeroSteiner's Options class for Termineter
 #
 
-import tldextract
 import datetime
+import time
+
+from botocore.exceptions import ClientError
 
 from stratustryke.core.credential.aws import AWSCredential
 
 
 class FireProx(object):
     '''Class for creation, listing, and deletion of Fireprox APIs'''
+
+    # apigateway:DeleteRestApi allows a small burst, then roughly one call per 30 seconds; bulk deletes are paced rather than
+    # left to the adaptive rate limiter, which would exhaust botocore's retries before adapting to a rate that low
+    DELETE_INTERVAL = 3 # seconds between deletes in 'fireprox clean'
+    DELETE_RETRY_DELAY = 30 # seconds waited after a throttled delete (multiplied by the attempt number)
+    DELETE_MAX_ATTEMPTS = 5
     def __init__(self, cred: AWSCredential, help_msg: str = None) -> None:
         self.help = help_msg
         self.region = cred._default_region
-        self.session = cred.session().client('apigateway')
+        self.session = cred.client('apigateway')
 
 
     def get_template(self, url: str):
         '''Insert target URL into fireprox apigateway deployment template. Return final template.'''
+        import tldextract # deferred; slow to import and only needed when creating APIs
+
         if url[-1] == '/':
             url = url[:-1]
 
@@ -187,14 +197,24 @@ class FireProx(object):
         for item in items:
             item_api_id = item['id']
             if item_api_id == api_id:
-                response = self.session.delete_rest_api(
-                    restApiId=api_id
-                )
+                self.delete_rest_api(api_id)
                 return (True, f'Removed Fireprox API \'{api_id}\'')
             
         return (False, f'Specified API id \'{api_id}\' not found')
     
 
+    def delete_rest_api(self, api_id: str) -> None:
+        '''Delete an API, backing off and retrying while DeleteRestApi is throttled (TooManyRequestsException)'''
+        for attempt in range(1, FireProx.DELETE_MAX_ATTEMPTS + 1):
+            try:
+                self.session.delete_rest_api(restApiId=api_id)
+                return None
+            except ClientError as err:
+                throttled = err.response.get('Error', {}).get('Code', None) == 'TooManyRequestsException'
+                if not throttled or attempt == FireProx.DELETE_MAX_ATTEMPTS: raise
+                time.sleep(FireProx.DELETE_RETRY_DELAY * attempt)
+
+
     def list_api(self, deleted_api_id=None, silenced=False):
         '''Lists fireprox APIs within the account'''
         response = self.session.get_rest_apis()
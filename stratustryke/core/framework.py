@@ -2,16 +2,20 @@
 # Purpose: Stratustryke frameowrk - handles module management, user configs, and I/O
 #
 
+import contextlib
 import importlib
 import logging
 import logging.handlers
 import pathlib
 import sys
 import tabulate
+import threading
 import os
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from termcolor import colored
-from requests import request, Response
+from requests import Response
 from http.client import responses as httpresponses
 
 from stratustryke.core.credstore import CredentialStoreConnector
@@ -19,6 +23,15 @@ from stratustryke.core.module import StratustrykeModule
 from stratustryke.core.option import Options
 from stratustryke.core.fireprox import FireProx
 from stratustryke.core.modmgr import ModManager
+from stratustryke.core.transport import HTTPTransport, request_many
+from stratustryke.core.output import OutputSink
+from stratustryke.core.ratelimit import RateLimiterRegistry, rate_limiters
+from stratustryke.core.metrics import api_metrics
+from stratustryke.core.apicache import AWSResponseCache, aws_response_cache
+from stratustryke.core.credential.aws import client_options, configure_clients
+from stratustryke.core.records import Record, RecordDispatcher, RECORD_WRITERS
+from stratustryke.core.checkpoint import Checkpoint, CheckpointStore, checkpoint_key, STATUS_COMPLETE
+from stratustryke.core.inventory import InventoryStore
 from stratustryke import lib, settings
 from stratustryke import __version__
 
@@ -39,6 +52,25 @@ class StratustrykeFramework(object):
     CONF_HTTP_PROXY = 'HTTP_PROXY'
     CONF_HTTP_VERIFY_SSL = 'HTTP_VERIFY_SSL'
     CONF_HTTP_STSK_HEADER = 'HTTP_STSK_HEADER'
+    CONF_HTTP_POOL_CONNECTIONS = 'HTTP_POOL_CONNECTIONS'
+    CONF_HTTP_POOL_MAXSIZE = 'HTTP_POOL_MAXSIZE'
+    CONF_MAX_REGION_WORKERS = 'MAX_REGION_WORKERS'
+    CONF_RECORD_OUTPUT = 'RECORD_OUTPUT'
+    CONF_RECORD_DIR = 'RECORD_DIR'
+    CONF_MSFT_PERSIST_TOKENS = 'MSFT_PERSIST_TOKENS'
+    CONF_CHECKPOINT = 'CHECKPOINT'
+    CONF_AWS_CACHE = 'AWS_CACHE'
+    CONF_AWS_CACHE_TTL = 'AWS_CACHE_TTL'
+    CONF_INVENTORY = 'INVENTORY'
+    CONF_INVENTORY_MAX_AGE = 'INVENTORY_MAX_AGE'
+    CONF_RATE_LIMIT = 'RATE_LIMIT'
+    CONF_RATE_LIMIT_MAX = 'RATE_LIMIT_MAX'
+    CONF_CONNECT_TIMEOUT = 'CONNECT_TIMEOUT'
+    CONF_READ_TIMEOUT = 'READ_TIMEOUT'
+    CONF_RETRY_MODE = 'RETRY_MODE'
+    CONF_MAX_ATTEMPTS = 'MAX_ATTEMPTS'
+    CONF_TCP_KEEPALIVE = 'TCP_KEEPALIVE'
+    CONF_AWS_MAX_POOL_CONNECTIONS = 'AWS_MAX_POOL_CONNECTIONS'
 
     def __init__(self, stdout = None):
         # Package info
@@ -81,43 +113,132 @@ class StratustrykeFramework(object):
         self._config.add_string(StratustrykeFramework.CONF_HTTP_PROXY, 'Proxy (schema://host:port) for modules to use as an HTTP/S proxy for web traffic', False, None, '(http[s]?|socks[45][h]?)[:]\\/\\/.*[:][0-9]{1,5}')
         self._config.add_boolean(StratustrykeFramework.CONF_HTTP_VERIFY_SSL, 'Enable or disable SSL/TLS verification when modules perform manual HTTP requests', True, settings.HTTP_VERIFY_SSL)
         self._config.add_boolean(StratustrykeFramework.CONF_HTTP_STSK_HEADER, 'Enable / disable submission of X-Stratustryke-Header for custom HTTP requests', True, settings.HTTP_STSK_HEADER)
-
-        # Load modules into framework - get modules dir and all directories below it
+        self._config.add_integer(StratustrykeFramework.CONF_HTTP_POOL_CONNECTIONS, 'Number of hosts to keep pooled (keep-alive) HTTP connections for', True, settings.HTTP_POOL_CONNECTIONS)
+        self._config.add_integer(StratustrykeFramework.CONF_HTTP_POOL_MAXSIZE, 'Maximum pooled HTTP connections kept per host', True, settings.HTTP_POOL_MAXSIZE)
+        self._config.add_integer(StratustrykeFramework.CONF_MAX_REGION_WORKERS, 'Maximum number of AWS regions a module processes concurrently', True, settings.MAX_REGION_WORKERS)
+        self._config.add_string(StratustrykeFramework.CONF_RECORD_OUTPUT, f'Comma-separated structured result writers to enable for module runs ({", ".join(RECORD_WRITERS.keys())})', False, settings.RECORD_OUTPUT, f'^((?:{"|".join(RECORD_WRITERS.keys())})(?:,(?:{"|".join(RECORD_WRITERS.keys())}))*)?$')
+        self._config.add_string(StratustrykeFramework.CONF_RECORD_DIR, 'Directory structured result records are written to', True, str(self._user_data_dir/'records'))
+        self._config.add_boolean(StratustrykeFramework.CONF_RATE_LIMIT, 'Adaptively rate limit AWS API and HTTP requests per host / credential, backing off when throttled', True, settings.RATE_LIMIT_ENABLED)
+        self._config.add_float(StratustrykeFramework.CONF_RATE_LIMIT_MAX, 'Maximum requests per second sent to a single host with one credential when rate limiting', True, settings.RATE_LIMIT_MAX_RATE)
+        self._config.add_float(StratustrykeFramework.CONF_CONNECT_TIMEOUT, 'Seconds to wait for AWS API / HTTP connections to be established', True, settings.CONNECT_TIMEOUT)
+        self._config.add_float(StratustrykeFramework.CONF_READ_TIMEOUT, 'Seconds to wait for AWS API / HTTP responses once connected', True, settings.READ_TIMEOUT)
+        self._config.add_string(StratustrykeFramework.CONF_RETRY_MODE, 'Retry mode for AWS API (and HTTP) requests (legacy, standard, adaptive)', True, settings.RETRY_MODE, '^(legacy|standard|adaptive)$')
+        self._config.add_integer(StratustrykeFramework.CONF_MAX_ATTEMPTS, 'Total attempts (including the first) made for each AWS API / HTTP request', True, settings.MAX_ATTEMPTS)
+        self._config.add_boolean(StratustrykeFramework.CONF_TCP_KEEPALIVE, 'Enable TCP keepalive on AWS API / HTTP connections', True, settings.TCP_KEEPALIVE)
+        self._config.add_integer(StratustrykeFramework.CONF_AWS_MAX_POOL_CONNECTIONS, 'Maximum pooled connections kept per boto3 client', True, settings.AWS_MAX_POOL_CONNECTIONS)
+        self._config.add_boolean(StratustrykeFramework.CONF_MSFT_PERSIST_TOKENS, 'Persist Microsoft access tokens in the credstore so they are reused across sessions', True, settings.MSFT_PERSIST_TOKENS)
+        self._config.add_boolean(StratustrykeFramework.CONF_CHECKPOINT, 'Checkpoint completed work of long-running modules so interrupted runs can be continued with \'run --resume\'', True, settings.CHECKPOINT_ENABLED)
+        self._config.add_boolean(StratustrykeFramework.CONF_AWS_CACHE, 'Serve repeated read-only (Describe / List / Get) AWS API calls from a local cache', True, settings.AWS_CACHE_ENABLED)
+        self._config.add_float(StratustrykeFramework.CONF_AWS_CACHE_TTL, 'Seconds a cached AWS API response is reused when AWS_CACHE is enabled', True, settings.AWS_CACHE_TTL)
+        self._config.add_boolean(StratustrykeFramework.CONF_INVENTORY, 'Record AWS resources enumerated by modules in the workspace inventory (\'inventory\' command)', True, settings.INVENTORY_ENABLED)
+        self._config.add_float(StratustrykeFramework.CONF_INVENTORY_MAX_AGE, 'Seconds a complete regional inventory listing is reused by modules instead of listing again (0 always lists)', True, settings.INVENTORY_MAX_AGE)
+
+        # Load modules into framework - modules are indexed from the manifest and imported on first use
         self.current_module = None
-
-        search_dirs = []
         builtin_modules_dir = (lib.stratustryke_dir()/'modules').absolute()
-        for directory in builtin_modules_dir.glob('**/'):
-            path = str(directory)
-            if not path.endswith('__pycache__'):
-                search_dirs.append(path)
 
-        self.spooler = None # Will hold the I/O handle
-        self.spool_mode = None
+        self._output = OutputSink(self._stdout) # console / spool writer
+        self._output_buffer = threading.local() # per-thread capture buffers; see buffer_output()
+        self.records = RecordDispatcher(self) # structured module results; see StratustrykeModule.emit()
+        self.metrics = api_metrics() # API call metrics for the current / last module run; see the 'stats' command
         self.credentials = CredentialStoreConnector(self, str(lib.sqlite_filepath()))
-        
-        fp_alias = self._config.get_opt(StratustrykeFramework.CONF_FIREPROX_CRED_ALIAS)._value
-        if fp_alias in self.credentials.keys():
-            fp_cred = self.credentials[fp_alias]
-            self.fireprox = FireProx(fp_cred)
-        else:
-            self.print_warning(f'Fireprox manager credential alias \'{fp_alias}\' not found!')
-            self.fireprox = None
-
-        self.modules = ModManager(self, search_dirs)
+        self._fireprox = None # Created on first use; avoids building an apigateway client at startup
+        self._http_transport = None # Created on first HTTP request
+        self._checkpoints = None # Opened the first time a module uses its checkpoint
+        self._inventory = None # Opened the first time a module records / looks up inventory
+        self._inventory_lock = threading.Lock()
+
+        self.modules = ModManager(self, str(builtin_modules_dir))
         self._logger.info(f'Loaded {len(self.modules)} modules into the framework')
 
 
     def __repr__(self) -> str:
         return f'<{self.__class__.__name__} LoadedModules={len(self.modules)} Version=\'stratustryke v{__version__}\'>'
 
+    @property
+    def fireprox(self) -> FireProx:
+        '''Fireprox API manager for the credential set in the FIREPROX_CRED_ALIAS config'''
+        self.aws_client_options # apply the current timeout / retry configs before clients are used
+        if self._fireprox == None:
+            fp_alias = self._config.get_val(StratustrykeFramework.CONF_FIREPROX_CRED_ALIAS)
+            if fp_alias in self.credentials.keys():
+                self._fireprox = FireProx(self.credentials[fp_alias])
+            else:
+                self.print_warning(f'Fireprox manager credential alias \'{fp_alias}\' not found!')
+
+        return self._fireprox
+
+    @property
+    def http_transport(self) -> HTTPTransport:
+        '''Pooled HTTP transport used by http_request(); pools are rebuilt if the pool size / retry / keepalive configs change'''
+        transport_settings = (
+            self._config.get_val(StratustrykeFramework.CONF_HTTP_POOL_CONNECTIONS),
+            self._config.get_val(StratustrykeFramework.CONF_HTTP_POOL_MAXSIZE),
+            self._config.get_val(StratustrykeFramework.CONF_RETRY_MODE),
+            self._config.get_val(StratustrykeFramework.CONF_MAX_ATTEMPTS),
+            self._config.get_val(StratustrykeFramework.CONF_TCP_KEEPALIVE)
+        )
+
+        if self._http_transport == None:
+            self._http_transport = HTTPTransport(*transport_settings)
+        elif self._http_transport.settings != transport_settings:
+            self._http_transport.reconfigure(*transport_settings)
+
+        return self._http_transport
+
+    @property
+    def http_timeout(self) -> tuple:
+        '''Default (connect, read) timeout for http_request() from the CONNECT_TIMEOUT / READ_TIMEOUT configs'''
+        return (self._config.get_val(StratustrykeFramework.CONF_CONNECT_TIMEOUT), self._config.get_val(StratustrykeFramework.CONF_READ_TIMEOUT))
+
+    @property
+    def aws_client_options(self) -> dict:
+        '''botocore Config options from the timeout / retry / pooling configs; applied to every pooled boto3 session and client'''
+        options = client_options(
+            self._config.get_val(StratustrykeFramework.CONF_CONNECT_TIMEOUT),
+            self._config.get_val(StratustrykeFramework.CONF_READ_TIMEOUT),
+            self._config.get_val(StratustrykeFramework.CONF_RETRY_MODE),
+            self._config.get_val(StratustrykeFramework.CONF_MAX_ATTEMPTS),
+            self._config.get_val(StratustrykeFramework.CONF_AWS_MAX_POOL_CONNECTIONS),
+            self._config.get_val(StratustrykeFramework.CONF_TCP_KEEPALIVE)
+        )
+        configure_clients(options)
+        return options
+
+    @property
+    def rate_limiter(self) -> RateLimiterRegistry:
+        '''Shared adaptive rate limiters (used by http_request() and every pooled boto3 client), synced with the RATE_LIMIT configs'''
+        registry = rate_limiters()
+        registry.configure(self._config.get_val(StratustrykeFramework.CONF_RATE_LIMIT), self._config.get_val(StratustrykeFramework.CONF_RATE_LIMIT_MAX))
+        return registry
+
+    @property
+    def api_cache(self) -> AWSResponseCache:
+        '''Shared cache of read-only AWS API responses (used by every pooled boto3 session); enabled per run by record_run()'''
+        return aws_response_cache()
+
+    @property
+    def checkpoints(self) -> CheckpointStore:
+        '''Checkpoint database of module runs (lib.checkpoint_filepath()); see checkpoint_run()'''
+        if self._checkpoints == None:
+            self._checkpoints = CheckpointStore(str(lib.checkpoint_filepath()))
+        return self._checkpoints
+
+    @property
+    def inventory(self) -> InventoryStore:
+        '''Workspace-scoped AWS resource inventory (lib.inventory_filepath()); see AWSModule.record_inventory()'''
+        with self._inventory_lock: # first use may come from concurrent region workers
+            if self._inventory == None:
+                self._inventory = InventoryStore(str(lib.inventory_filepath()))
+        return self._inventory
+
     @property
     def web_proxies(self) -> dict:
-        valid, msg = self.framework._config.get_opt(self.framework.CONF_HTTP_PROXY).validate()
+        valid, msg = self._config.get_opt(StratustrykeFramework.CONF_HTTP_PROXY).validate()
         if not valid:
             raise lib.StratustrykeException(msg)
 
-        proxy = self._config.get_val(self.framework.CONF_HTTP_PROXY)
+        proxy = self._config.get_val(StratustrykeFramework.CONF_HTTP_PROXY)
         if proxy in ['', None]:
             return {}
         
@@ -127,12 +248,145 @@ class StratustrykeFramework(object):
         }
 
 
+    @property
+    def spooler(self) -> pathlib.Path:
+        '''Path of the current spool file (None when not spooling)'''
+        return self._output.spool_path
+
+
+    def start_spool(self, path: pathlib.Path, mode: str = 'a') -> None:
+        '''Begin spooling output to a file (mode 'w' to overwrite, 'a' to append)'''
+        self._output.start_spool(pathlib.Path(path).absolute(), mode)
+
+
+    def stop_spool(self) -> None:
+        '''Stop spooling output and close the spool file'''
+        self._output.stop_spool()
+
+
     def spool_message(self, msg: str) -> None:
+        '''Write a message only to the spool file (e.g., echoed user input)'''
         if self.spooler != None:
-            with open(self.spooler.absolute(), self.spool_mode) as spooler:
-                spooler.write(msg)
+            self._output.write(msg, console=False)
+
+
+    def sync_output(self) -> None:
+        '''Block until all queued output has been written to the console / spool file'''
+        self._output.flush()
+
                 
 
+    def write_output(self, output: str) -> None:
+        '''Write output to stdout and the spool file, or to the calling thread's capture buffer while buffer_output() is active'''
+        lines = getattr(self._output_buffer, 'lines', None)
+        if lines != None:
+            lines.append(output)
+            return
+
+        self._output.write(output)
+
+
+    @contextlib.contextmanager
+    def buffer_output(self):
+        '''Context manager capturing output printed by the calling thread into a list (yielded) rather than writing it.
+        Used to keep output from concurrent workers (e.g., AWSModule.map_regions) grouped; write it with flush_output()'''
+        previous = getattr(self._output_buffer, 'lines', None)
+        lines = []
+        self._output_buffer.lines = lines
+        try:
+            yield lines
+        finally:
+            self._output_buffer.lines = previous
+
+
+    def flush_output(self, lines: list) -> None:
+        '''Write output previously captured by buffer_output() as one block'''
+        if len(lines) > 0:
+            self.write_output(''.join(lines))
+
+
+    @contextlib.contextmanager
+    def record_run(self, module, outputs: list = None, run_id: str = None, writers: list = None):
+        '''Context manager opening the configured (RECORD_OUTPUT) or specified record writers for the duration of a module run.
+        API call metrics are also reset at the start of the run.
+        :param module: StratustrykeModule being run
+        :param outputs: list[str] writer names overriding the RECORD_OUTPUT config
+        :param run_id: identifier stored with each record [default: timestamp + random suffix]
+        :param writers: list[RecordWriter] additional writers opened by the caller; closed when the run ends
+        The AWS API response cache is enabled for the run per the AWS_CACHE config unless the module opts out (CACHE_API_RESPONSES).'''
+        if outputs == None:
+            configured = self._config.get_val(StratustrykeFramework.CONF_RECORD_OUTPUT) or ''
+            outputs = [name.strip().lower() for name in configured.split(',') if name.strip() != '']
+
+        record_dir = self._config.get_val(StratustrykeFramework.CONF_RECORD_DIR)
+        opened = self.records.open(outputs, record_dir, module, run_id)
+        for writer in opened:
+            self._logger.info(f'Writing {module.search_name} records to {writer.path}')
+        for writer in (writers or []):
+            self.records.attach(writer)
+        self.metrics.start(module.search_name)
+        self.api_cache.configure(self._config.get_val(StratustrykeFramework.CONF_AWS_CACHE) and getattr(module, 'CACHE_API_RESPONSES', True),
+                                 self._config.get_val(StratustrykeFramework.CONF_AWS_CACHE_TTL))
+        try:
+            yield self.records.run_id
+        finally:
+            self.metrics.finish()
+            self.records.close()
+
+
+    @contextlib.contextmanager
+    def checkpoint_run(self, module, resume: bool = False):
+        '''Context manager scoping a module run's checkpoint (see StratustrykeModule.checkpoint()). The checkpoint is only
+        opened if the module uses it; it is closed with the run's outcome when the run ends or is interrupted.
+        :param module: StratustrykeModule being run
+        :param resume: (bool) continue from the module's stored checkpoint for its current options rather than starting over'''
+        module._checkpoint_resume = resume
+        finished = False
+        try:
+            yield
+            finished = True
+        finally:
+            checkpoint, module._checkpoint = module._checkpoint, None
+            module._checkpoint_resume = False
+            if checkpoint != None and checkpoint.key != None:
+                status = checkpoint.close(finished)
+                if status != STATUS_COMPLETE:
+                    self.print_status(f'Checkpoint saved ({checkpoint.completed} / {checkpoint.total} units); continue with \'run --resume\'')
+
+
+    def open_checkpoint(self, module):
+        '''Open the checkpoint for a module run started by checkpoint_run(). When resuming, findings stored by previous runs
+        are re-emitted (to the console and any record writers) so the resumed run's results are complete.
+        :return: Checkpoint (in-memory only if checkpointing is disabled by the CHECKPOINT config or the store is unavailable)'''
+        resume = getattr(module, '_checkpoint_resume', False)
+        if not self._config.get_val(StratustrykeFramework.CONF_CHECKPOINT):
+            return Checkpoint(module_name=module.search_name)
+
+        try:
+            key = checkpoint_key(module.search_name, module.checkpoint_scope())
+            checkpoint = self.checkpoints.open(module.search_name, key, resume)
+        except Exception as err:
+            self._logger.error(f'Unable to open checkpoint for {module.search_name}: {err}')
+            self.print_warning('Unable to open checkpoint database; progress of this run will not be saved')
+            return Checkpoint(module_name=module.search_name)
+
+        if resume and not checkpoint.resumed:
+            self.print_warning('No checkpoint found for the current module options; starting from the beginning')
+        elif checkpoint.resumed:
+            findings = self.checkpoints.findings(checkpoint.key)
+            self.print_status(f'Resuming from checkpoint: {checkpoint.completed} units completed, {len(findings)} findings restored')
+            for record_type, message, level, fields in findings:
+                self.emit_record(module, record_type, fields, message, level)
+        return checkpoint
+
+
+    def emit_record(self, module, record_type: str, fields: dict, message: str = None, level: str = 'success', console: bool = True) -> Record:
+        '''Build a Record for a module result and pass it to the console and any open record writers'''
+        record = Record(record_type, fields, module.search_name, self.records.run_id, message, level)
+        self.records.dispatch(record, console)
+        return record
+
+
     # === various logging and print utility methods === #
     def print_error(self, msg: str) -> None:
         '''Prints (magenta) error message: [x] {msg}'''
@@ -142,9 +396,7 @@ class StratustrykeFramework(object):
 
         self._logger.error(output) # errors will always be passed to logger as well
 
-        self._stdout.write(output)
-        self._stdout.flush()
-        return self.spool_message(output)
+        return self.write_output(output)
 
 
     def print_status(self, msg: str) -> None:
@@ -153,9 +405,7 @@ class StratustrykeFramework(object):
         prefix = colored('[*]', 'blue', attrs=('bold',)) if use_color else '[*]'
         output = f'{prefix} {msg}{os.linesep}'
 
-        self._stdout.write(output)
-        self._stdout.flush()
-        return self.spool_message(output)
+        return self.write_output(output)
 
 
     def print_warning(self, msg: str) -> None:
@@ -164,10 +414,7 @@ class StratustrykeFramework(object):
         prefix = colored('[!]', 'yellow', attrs=('bold',)) if use_color else '[!]'
         output = f'{prefix} {msg}{os.linesep}'
 
-        self._stdout.write(output)
-        self._stdout.flush()
-
-        return self.spool_message(output)
+        return self.write_output(output)
 
 
     def print_success(self, msg: str) -> None:
@@ -176,9 +423,7 @@ class StratustrykeFramework(object):
         prefix = colored('[+]', 'green', attrs=('bold',)) if use_color else '[+] '
         output = f'{prefix} {msg}{os.linesep}'
         
-        self._stdout.write(output)
-        self._stdout.flush()
-        return self.spool_message(output)
+        return self.write_output(output)
     
 
     def print_failure(self, msg: str) -> None:
@@ -187,18 +432,14 @@ class StratustrykeFramework(object):
         prefix = colored('[-]', 'red', attrs=('bold',)) if use_color else '[-] '
         output = f'{prefix} {msg}{os.linesep}'
         
-        self._stdout.write(output)
-        self._stdout.flush()
-        return self.spool_message(output)
+        return self.write_output(output)
 
 
     def print_line(self, msg: str) -> None:
         '''Prints line to the stdout with regular text: {msg}'''
         output = f'{msg}{os.linesep}'
         
-        self._stdout.write(output)
-        self._stdout.flush()
-        return self.spool_message(output)
+        return self.write_output(output)
 
 
     def get_module_logger(self, mod_name: str) -> logging.Logger:
@@ -208,38 +449,69 @@ class StratustrykeFramework(object):
 
     def http_request(self, method: str, url: str, **kwargs) -> Response:
         '''
-        Wraps requests.request() while enforcing framework proxy / TLS verification configs\n
+        Performs an HTTP request over the framework's pooled transport while enforcing framework proxy / TLS verification configs\n
         :param method: (str) request method (e.g., GET, POST, PUT, etc)
         :param url: (str) URL for the request
         :param data: (str) non-json request body data
         :param json: (str) JSON request body data
         :param auth: (any) authentication. Support Sigv4
         :param module_name (str): name of the module initating the request
+        :param timeout: (float | tuple) timeout in seconds or (connect, read) tuple [default: CONNECT_TIMEOUT / READ_TIMEOUT configs]
+        :param retry_policy: (tuple) optional (retry_mode, max_attempts) overriding the RETRY_MODE / MAX_ATTEMPTS configs
+        :param expected_status: (set[int]) error status codes that are normal answers, adapting the rate limit like successes
+        :param throttle_status: (set[int]) status codes that indicate throttling in addition to 429 (e.g., 503 from S3)
+        Any other keyword args (params, allow_redirects, stream, etc.) are passed through to requests
         '''
-        proxies = kwargs.get('proxies', self.web_proxies)
-        verify = kwargs.get('verify', self._config.get_val(StratustrykeFramework.CONF_HTTP_VERIFY_SSL))
-        data = kwargs.get('data', None)
-        auth = kwargs.get('auth', None)
-        json = kwargs.get('json', None)
-        headers = kwargs.get('headers', {})
-        module_name = kwargs.get('module_name', 'StratustrykeFramework')
-        if self.framework._config.get_val(StratustrykeFramework.CONF_HTTP_STSK_HEADER):
+        module_name = kwargs.pop('module_name', 'StratustrykeFramework')
+        expected_status = kwargs.pop('expected_status', None)
+        throttle_status = kwargs.pop('throttle_status', None)
+        if kwargs.get('timeout', None) == None: kwargs['timeout'] = self.http_timeout
+        kwargs['proxies'] = kwargs.get('proxies', self.web_proxies)
+        kwargs['verify'] = kwargs.get('verify', self._config.get_val(StratustrykeFramework.CONF_HTTP_VERIFY_SSL))
+        headers = dict(kwargs.get('headers', None) or {}) # copy; callers commonly pass (or default to) a shared dict
+        if self._config.get_val(StratustrykeFramework.CONF_HTTP_STSK_HEADER):
             headers.update({'X-Stratustryke-Module': f'{module_name}'})
+        kwargs['headers'] = headers
 
-        if method == 'GET': json, data = None, None # Ensure GET requests don't contain request body
+        if method == 'GET': kwargs['json'], kwargs['data'] = None, None # Ensure GET requests don't contain request body
         try:
-            res = request(method, url, verify=verify, proxies=proxies, data=data, headers=headers, auth=auth, json=json)
-            
-            # res = request(method, url, verify=verify, proxies=proxies, params=params, data=data, headers=headers, cookies=cookies, auth=auth,
-            #               files=files, timeout=timeout, allow_redirects=allow_redirects, hooks=hooks, stream=stream, cert=cert, json=json)
+            transport = self.http_transport
+            send = lambda: self.metrics.send_http(method, url, lambda: transport.request(method, url, **kwargs), kwargs.get('stream', False))
+            res = self.rate_limiter.send_http(url, send, expected_status, throttle_status)
         except Exception as err:
             self.print_error(f'Exception thrown ({type(err).__name__}) during HTTP/S request: {err}')
-            self.framework._logger.error(f'Exception thrown ({type(err).__name__}) during HTTP/S request: {err}')
+            self._logger.error(f'Exception thrown ({type(err).__name__}) during HTTP/S request: {err}')
             return None
         
         return res
 
 
+    def http_request_many(self, requests_iterable, concurrency: int = None, per_host: int = None, timeout: float = None, module_name: str = 'StratustrykeFramework',
+                          request_defaults: dict = None):
+        '''
+        Performs a batch of HTTP requests concurrently over the pooled transport, yielding (request, response) tuples as they
+        complete (completion order, not submission order). Each request is sent via http_request(), so proxy / TLS verification /
+        header configs are applied identically and response is None for requests that raised an exception.\n
+        :param requests_iterable: iterable of (method, url), (method, url, kwargs) tuples or dicts with 'method', 'url', and any http_request() kwargs; consumed lazily
+        :param concurrency: (int) max requests in flight [default: settings.HTTP_BATCH_CONCURRENCY]
+        :param per_host: (int) max requests in flight to a single host [default: HTTP_POOL_MAXSIZE config]
+        :param timeout: (float) per-request timeout in seconds unless set on the request itself
+        :param module_name: (str) name of the module initating the requests
+        :param request_defaults: (dict) http_request() kwargs applied to each request unless set on the request itself
+        '''
+        concurrency = concurrency if (concurrency != None) else settings.HTTP_BATCH_CONCURRENCY
+        per_host = per_host if (per_host != None) else self._config.get_val(StratustrykeFramework.CONF_HTTP_POOL_MAXSIZE)
+
+        def send(method: str, url: str, **kwargs) -> Response:
+            if timeout != None: kwargs.setdefault('timeout', timeout)
+            for key, val in (request_defaults or {}).items(): kwargs.setdefault(key, val)
+            kwargs.setdefault('module_name', module_name)
+            return self.http_request(method, url, **kwargs)
+
+        self.http_transport # build (or resize) the transport before dispatching from worker threads
+        return request_many(send, requests_iterable, concurrency, per_host)
+
+
     def http_record(self, response: Response, outfile: str = None) -> list:
         '''Returns a list[str] containing raw HTTP request / response content. If ourfile is specified, will (over)write the lines to the file
         :param response: requests.Response object from a HTTP request
@@ -271,7 +543,7 @@ class StratustrykeFramework(object):
         lines.append(f'\n\n')
 
         if outfile != None:
-            self.framework._logger.info(f'Recording HTTP request/response to {outfile}')
+            self._logger.info(f'Recording HTTP request/response to {outfile}')
             with open(outfile, 'w') as file:
                 file.writelines(lines)
 
@@ -314,7 +586,7 @@ class StratustrykeFramework(object):
 
         self._logger.info(f'Reloading \'{mod_path}\' module')
 
-        instance = self.load_module(mod_path, True)
+        instance = self.modules.reload(mod_path) # ModManager re-imports and stores the new instance
         # Ensure Module class instance has required attributes
         if not isinstance(instance, StratustrykeModule): # Modules must inherit StratustrykeModule
             self._logger.error(f'Module: \'{mod_path}\' does not inherit from stratustryke.core.module.StratustrykeModule class')
@@ -328,11 +600,6 @@ class StratustrykeFramework(object):
         if not hasattr(instance, 'run'): # Modules must implement run() method
             self._logger.error(f'Module: \'{mod_path}\' does not implement run() method')
             raise lib.FrameworkRuntimeError(f'Module: {mod_path} does not implement run() method')
-        
-        # Set name, path, and store the instance
-        instance.name = mod_path.split('/')[-1]
-        instance.path = mod_path
-        self.modules[mod_path] = instance
 
         # If we just reloaded the current module, reset it's instance of the Module
         if self.current_module != None and self.current_module.path == instance.path:
@@ -364,6 +631,69 @@ class StratustrykeFramework(object):
         return res
 
 
+    def run_all_creds(self, module, workspace: str = None, parallel: int = None, resume: bool = False) -> dict:
+        '''
+        Run a module once per stored credential it accepts (AWS or MSFT) in a workspace. Each run uses an isolated clone of the
+        module with the same options and the credential loaded as with the 'creds' command; clones run concurrently and their
+        records are tagged with a 'cred_alias' field. Console output of each clone is written as one block as it completes.
+        Expired credentials are skipped.\n
+        :param module: StratustrykeModule whose options are cloned
+        :param workspace: credstore workspace to take credentials from [default: WORKSPACE config]
+        :param parallel: max clones run concurrently [default: settings.FANOUT_PARALLEL]
+        :param resume: (bool) continue each clone from its stored checkpoint (see checkpoint_run())
+        :return: dict[str, bool] mapping each credential alias to whether its run completed without raising
+        '''
+        cred_type = self.credentials.module_cred_type(module)
+        if cred_type == None:
+            raise lib.StratustrykeException(f'Module \'{module.search_name}\' does not accept stored credentials')
+
+        workspace = workspace if (workspace != None) else self._config.get_val(StratustrykeFramework.CONF_WORKSPACE)
+        parallel = parallel if (parallel != None) else settings.FANOUT_PARALLEL
+        aliases = [row[0] for row in self.credentials.query(workspace, cred_type, active=True)]
+        if len(aliases) == 0:
+            self.print_warning(f'No active {cred_type} credentials found in workspace \'{workspace}\'')
+            return {}
+
+        force_validate = self._config.get_val(StratustrykeFramework.CONF_FORCE_VALIDATE_OPTIONS)
+        self._logger.info(f'Running \'{module.search_name}\' with {len(aliases)} {cred_type} credentials from workspace \'{workspace}\'')
+
+        def run_clone(alias: str) -> tuple:
+            with self.buffer_output() as lines:
+                self.print_status(f'Results for credential \'{alias}\'')
+                try:
+                    clone = module.clone()
+                    self.credentials.set_module_creds(clone, self.credentials[alias])
+                    clone.record_tags = {'cred_alias': alias}
+                    if force_validate:
+                        valid, msg = clone.validate_options()
+                        if not valid: raise lib.StratustrykeException(msg)
+                    with self.checkpoint_run(clone, resume):
+                        clone.run()
+                    success = True
+                except Exception as err:
+                    self.print_error(f'Exception thrown running module \'{module.name}\' with credential \'{alias}\': {err}')
+                    self._logger.error(f'Exception thrown running module \'{module.search_name}\' with credential \'{alias}\': {err}')
+                    success = False
+                self.print_line('')
+            return success, lines
+
+        results = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, min(parallel, len(aliases))), thread_name_prefix='stratustryke-fanout')
+        try:
+            futures = {executor.submit(run_clone, alias): alias for alias in aliases}
+            for future in as_completed(futures):
+                success, lines = future.result()
+                self.flush_output(lines)
+                results[futures[future]] = success
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        failed = [alias for alias, success in results.items() if not success]
+        self.print_status(f'Completed {len(results)} runs ({len(results) - len(failed)} succeeded, {len(failed)} failed)')
+        if len(failed) > 0: self.print_failure(f'Failed credentials: {", ".join(sorted(failed))}')
+        return results
+
+
     def print_table(self, rows: list, headers: list, prefix: str = '  ', table_format: str = None):
         '''
         Prints a table to the framework
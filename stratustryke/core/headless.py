@@ -0,0 +1,174 @@
+# Author: @vexance
+# Purpose: Non-interactive (one-shot) module execution for scripts, cron jobs, and CI pipelines
+#
+
+import logging
+import sys
+
+from contextlib import nullcontext
+
+from stratustryke.core.framework import StratustrykeFramework
+from stratustryke.core.profiling import ModuleProfiler
+from stratustryke.core.records import JSONLRecordWriter
+
+
+# Process exit statuses for headless runs
+EXIT_SUCCESS = 0 # module ran to completion (with every credential for --all-creds runs)
+EXIT_MODULE_ERROR = 1 # module raised an exception (with any credential for --all-creds runs)
+EXIT_USAGE_ERROR = 2 # bad module / credential / option / config, option validation failed, or no credentials to fan out to
+EXIT_INTERRUPTED = 130 # interrupted (SIGINT)
+
+# text: console output to stdout; jsonl: module result records as JSON lines to stdout, console output to stderr
+HEADLESS_OUTPUTS = ('text', 'jsonl')
+
+
+def parse_assignment(value: str) -> tuple:
+    '''Split a NAME=VALUE command line argument into (NAME, VALUE)'''
+    name, sep, val = value.partition('=')
+    if sep == '' or name.strip() == '':
+        raise ValueError(f'Expected NAME=VALUE but got \'{value}\'')
+    return (name.strip().upper(), val)
+
+
+class HeadlessRunner(object):
+    '''Runs a single module without the interactive interpreter (no banner, readline, or history) and maps the outcome to a
+    process exit status. Only the target module is imported.'''
+
+    def __init__(self, output: str = 'text', stdout = None, stderr = None) -> None:
+        if output not in HEADLESS_OUTPUTS:
+            raise ValueError(f'Unsupported output \'{output}\' (supported: {", ".join(HEADLESS_OUTPUTS)})')
+
+        self._logger = logging.getLogger('stratustryke.headless')
+        self.output = output
+        self.stdout = sys.stdout if (stdout == None) else stdout
+        self.stderr = sys.stderr if (stderr == None) else stderr
+        console = self.stderr if (output == 'jsonl') else self.stdout
+        self.framework = StratustrykeFramework(stdout=console)
+
+        # Don't write color escape codes into pipes / log files unless asked to (--config COLORED_OUTPUT=true)
+        if not (hasattr(console, 'isatty') and console.isatty()):
+            self.framework._config.set_opt(StratustrykeFramework.CONF_COLORED_OUTPUT, False)
+
+
+    def usage_error(self, msg: str) -> int:
+        self.framework.print_error(msg)
+        self._logger.error(msg)
+        return EXIT_USAGE_ERROR
+
+
+    def configure(self, configs: list) -> int:
+        '''Apply (NAME, VALUE) framework config assignments; returns an exit status (EXIT_SUCCESS if all were applied)'''
+        for name, val in configs:
+            try:
+                if not self.framework._config.set_opt(name, val):
+                    return self.usage_error(f'Unknown framework config \'{name}\'')
+            except (TypeError, ValueError) as err:
+                return self.usage_error(f'{err}')
+
+            valid, msg = self.framework._config.get_opt(name).validate()
+            if not valid:
+                return self.usage_error(msg)
+
+        return EXIT_SUCCESS
+
+
+    def prepare(self, module_path: str, cred_alias: str = None, options: list = None):
+        '''Select the module, load credentials, and apply (NAME, VALUE) option assignments
+        :return: tuple(exit status, module | None)'''
+        if module_path not in self.framework.modules:
+            return (self.usage_error(f'Could not find module: \'{module_path}\', ensure the full module path is specified'), None)
+
+        try:
+            module = self.framework.modules[module_path]
+        except Exception as err:
+            return (self.usage_error(f'Failed to load module \'{module_path}\': {err}'), None)
+        self.framework.current_module = module
+
+        if cred_alias != None:
+            if cred_alias not in self.framework.credentials:
+                return (self.usage_error(f'Credential alias \'{cred_alias}\' not found in the credstore'), None)
+            try:
+                self.framework.credentials.set_module_creds(module, self.framework.credentials[cred_alias])
+            except Exception as err:
+                return (self.usage_error(f'Error loading credential \'{cred_alias}\' into module: {err}'), None)
+
+        for name, val in (options or []):
+            container = module._options if (name in module._options.keys()) else module._advanced
+            try:
+                if not container.set_opt(name, val):
+                    return (self.usage_error(f'Unknown option \'{name}\' for module \'{module_path}\''), None)
+            except (TypeError, ValueError) as err:
+                return (self.usage_error(f'{err}'), None)
+
+        return (EXIT_SUCCESS, module)
+
+
+    def run(self, module_path: str, cred_alias: str = None, options: list = None, configs: list = None, all_creds: bool = False,
+            workspace: str = None, parallel: int = None, profile: bool = False, resume: bool = False) -> int:
+        '''Run the module once (or once per stored credential in the workspace if all_creds is set; see
+        StratustrykeFramework.run_all_creds()) and return the process exit status. If profile is set, the run is profiled
+        as with the interactive 'profile run' command and the report directory is printed to the console. If resume is set, the
+        run continues from the module's checkpoint as with 'run --resume'.'''
+        profiler = None
+        try:
+            status = self.configure(configs or [])
+            if status != EXIT_SUCCESS: return status
+
+            status, module = self.prepare(module_path, cred_alias, options)
+            if status != EXIT_SUCCESS: return status
+
+            profiler = ModuleProfiler(module.search_name) if profile else None
+            with (profiler if (profiler != None) else nullcontext()):
+                return self.execute(module, all_creds, workspace, parallel, resume)
+
+        finally:
+            if profiler != None and profiler.wall > 0: self.report_profile(profiler)
+            self.framework.sync_output()
+            self.stdout.flush()
+
+
+    def execute(self, module, all_creds: bool = False, workspace: str = None, parallel: int = None, resume: bool = False) -> int:
+        '''Run a prepared module and return the process exit status'''
+        if all_creds: return self.run_all_creds(module, workspace, parallel, resume)
+
+        if self.framework._config.get_val(StratustrykeFramework.CONF_FORCE_VALIDATE_OPTIONS):
+            valid, msg = module.validate_options()
+            if not valid: return self.usage_error(msg)
+
+        writers = [JSONLRecordWriter(stream=self.stdout)] if (self.output == 'jsonl') else []
+        self._logger.info(f'Running module \'{module.search_name}\' headless')
+        try:
+            with self.framework.record_run(module, writers=writers), self.framework.checkpoint_run(module, resume):
+                module.run()
+        except KeyboardInterrupt:
+            return EXIT_INTERRUPTED
+        except Exception as err:
+            self.framework.print_error(f'Exception thrown while running module \'{module.name}\'')
+            self.framework.print_error(f'{err}')
+            self._logger.error(f'Exception thrown while running module \'{module.search_name}\': {err}')
+            return EXIT_MODULE_ERROR
+
+        return EXIT_SUCCESS
+
+
+    def report_profile(self, profiler: ModuleProfiler) -> None:
+        '''Save profile reports and print where they were written'''
+        self.framework.print_status(profiler.summary())
+        try:
+            self.framework.print_status(f'Profile reports saved to {profiler.save()}')
+        except OSError as err:
+            self.framework.print_error(f'Failed to save profile reports: {err}')
+
+
+    def run_all_creds(self, module, workspace: str = None, parallel: int = None, resume: bool = False) -> int:
+        writers = [JSONLRecordWriter(stream=self.stdout)] if (self.output == 'jsonl') else []
+        try:
+            with self.framework.record_run(module, writers=writers):
+                results = self.framework.run_all_creds(module, workspace, parallel, resume)
+        except KeyboardInterrupt:
+            return EXIT_INTERRUPTED
+        except Exception as err:
+            return self.usage_error(f'{err}')
+
+        if len(results) == 0: return EXIT_USAGE_ERROR
+        return EXIT_SUCCESS if all(results.values()) else EXIT_MODULE_ERROR
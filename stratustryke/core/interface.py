@@ -9,15 +9,18 @@ import logging
 import stratustryke
 
 from re import match as regex_match
+from datetime import datetime
 from termcolor import colored
-from time import sleep
 from pathlib import Path
+from time import sleep
 
 from stratustryke import settings
 # import stratustryke.settings as settings
 from stratustryke.core.command import Command, command, argument
 # import stratustryke.core.command
 from stratustryke.core.framework import StratustrykeFramework
+from stratustryke.core.fireprox import FireProx
+from stratustryke.core.profiling import ModuleProfiler, format_bytes
 from stratustryke.core.credential.aws import AWSCredential
 from stratustryke.core.credential.microsoft import MicrosoftCredential
 from stratustryke.core.helper import microsoft
@@ -200,12 +203,20 @@ class InteractiveInterpreter(Command):
 
 
     def precmd(self, line):
-        if self.framework.spooler != None:
-            with open(self.framework.spooler.absolute(), self.framework.spool_mode) as spooler:
-                spooler.write(f'{self.prompt}{line}\n')
+        self.framework.spool_message(f'{self.prompt}{line}\n')
         return super().precmd(line)
 
 
+    def postcmd(self, stop, line):
+        self.framework.sync_output() # make sure command output is written before the next prompt
+        return super().postcmd(stop, line)
+
+
+    def preloop(self):
+        self.framework.sync_output()
+        return super().preloop()
+
+
     # ================================================ #
     #                Framework Commands                #
     # ================================================ #
@@ -352,9 +363,7 @@ class InteractiveInterpreter(Command):
         self._logger.info('Recevied exit command')
         # Add closing quotes here?
         
-        if self.framework.spooler != None:
-            self.framework.spooler = None
-            self.framework.spool_mode = None
+        self.framework.stop_spool()
 
         try: # Try to copy command history to 'home/<user>/.local/strautsryke/history.txt
             import readline
@@ -637,17 +646,18 @@ class InteractiveInterpreter(Command):
         
         # Now receive the paste input
         self.framework.print_status(f'Receiving paste for {args.option_name.upper()}; Enter ^C to quit')
-        paste = ''
+        lines = [] # joined once the paste ends; repeated string concatenation is quadratic for large pastes
         try:
             while True:
                 line = input()
                 self.framework.spool_message(f'{line}\n')
-                paste += f'{line}\\n'
+                lines.append(f'{line}\\n')
         except KeyboardInterrupt:
             self.framework.print_status(f'Stopped receiving paste value')
         except Exception as err:
             self.framework.print_error(f'Exception thrown during paste command: {err}')
             return
+        paste = ''.join(lines)
         
         # Now try to set the value with pated flag set to true
         try:
@@ -683,8 +693,8 @@ class InteractiveInterpreter(Command):
                 return
             mod = self.framework.current_module
 
-        elif args.module in self.framework.modules: # module specified is loaded
-            mod = self.framework.modules[args.module]
+        elif args.module in self.framework.modules: # module specified is indexed; options come from the manifest
+            mod = self.framework.modules.get_entry(args.module)
         
         else: # module specified doesn't exist / isn't loaded
             self.print_line(f'Module: \'{args.module}\' not found')
@@ -716,8 +726,8 @@ class InteractiveInterpreter(Command):
                 return
             mod = self.framework.current_module
 
-        elif args.module in self.framework.modules: # module specified is loaded
-            mod = self.framework.modules[args.module]
+        elif args.module in self.framework.modules: # module specified is indexed; options come from the manifest
+            mod = self.framework.modules.get_entry(args.module)
         
         else: # module specified doesn't exist / isn't loaded
             self.print_line(f'Module: \'{args.module}\' not found')
@@ -769,7 +779,7 @@ class InteractiveInterpreter(Command):
         # list modules in the framework
         if choice == 'modules': 
             self.print_line(f'  Displaying framework modules...\n')
-            rows = [[module.search_name, module.desc] for module in self.framework.modules.values()]
+            rows = [[entry.search_name, entry.desc] for entry in self.framework.modules.entries()] # manifest entries; avoids importing every module
             headers = ['Module Name', 'Description']
         
         # show framework config options
@@ -901,9 +911,7 @@ class InteractiveInterpreter(Command):
             headers = ['Cred Type', 'Alias']
             rows = []
             for entry in aliases:
-                cred = self.framework.credentials[entry]
-                cred_type = self.framework.credentials.get_cred_type(cred)
-                rows.append([cred_type, entry])
+                rows.append([self.framework.credentials.cred_type(entry), entry])
             
             self.print_line(f'Listing credentials stored for the current workspace...\n')
             self.framework.print_table(rows, headers, prefix='  ')
@@ -1066,9 +1074,7 @@ class InteractiveInterpreter(Command):
     @argument('path', help = '\'off\' or file to enable / switch spooling to')
     def do_spool(self, args):
         if args.path.lower() == 'off':
-            if self.framework.spooler != None:
-                self.framework.spooler = None
-                self.framework.spool_mode = None
+            self.framework.stop_spool()
             
             self.print_status('Spooling of stratustryke output disabled')
         
@@ -1092,13 +1098,11 @@ class InteractiveInterpreter(Command):
                     self.print_status(f'Appending to file: {path.absolute()}')
 
             try:
-                self.framework.spooler = path.absolute()
-                self.framework.spool_mode = mode
+                self.framework.start_spool(path.absolute(), mode)
                 self.print_status(f'Spooling to {path.absolute()}')
             except Exception as err:
                 self.print_error(f'{err}')
-                self.framework.spooler = None
-                self.framework.spool_mode = None
+                self.framework.stop_spool()
                 return
 
     def complete_spool(self, text, line, begidx, endidx):
@@ -1110,14 +1114,33 @@ class InteractiveInterpreter(Command):
 
     # Command: 'run'
     # Action: Runs the current module with the option values specified
-    # Syntax: 'run'
+    # Syntax: 'run [--resume] [--all-creds [--workspace WORKSPACE] [--parallel N]]'
     # Aliases: 'execute'
     # Todo: error in validate_options()
 
     @command('Execute the currently selected module')
+    @argument('--all-creds', dest='all_creds', action='store_true', help='Run the module once per stored credential it accepts in the workspace')
+    @argument('--workspace', dest='workspace', default=None, help='Workspace to take credentials from with --all-creds (default: WORKSPACE config)')
+    @argument('--parallel', dest='parallel', type=int, default=None, help='Max module instances run concurrently with --all-creds')
+    @argument('--resume', dest='resume', action='store_true', help='Continue from the checkpoint of a previous run with the same options, skipping completed work')
     def do_run(self, args):
         if self.framework.current_module == None:
             self.print_line('No module currently selected')
+            return
+
+        self.run_module(args.all_creds, args.workspace, args.parallel, args.resume)
+
+    def run_module(self, all_creds: bool = False, workspace: str = None, parallel: int = None, resume: bool = False) -> None:
+        '''Run the current module (once per stored credential if all_creds is set) as the 'run' command does'''
+        if all_creds:
+            try:
+                with self.framework.record_run(self.framework.current_module):
+                    self.framework.run_all_creds(self.framework.current_module, workspace, parallel, resume)
+            except KeyboardInterrupt:
+                self.print_line('')
+            except Exception as err:
+                self.print_error(f'{err}')
+            return
 
         force_validate = self.framework._config.get_val(self.framework.CONF_FORCE_VALIDATE_OPTIONS)
         if force_validate:
@@ -1131,7 +1154,8 @@ class InteractiveInterpreter(Command):
         self.print_status(f'Running module...\n')
 
         try:
-            res = self.framework.current_module.run()
+            with self.framework.record_run(self.framework.current_module), self.framework.checkpoint_run(self.framework.current_module, resume):
+                res = self.framework.current_module.run()
         except KeyboardInterrupt:
             self.print_line('')
             return
@@ -1140,7 +1164,244 @@ class InteractiveInterpreter(Command):
             self.print_error(f'{err}')
             res = None
 
+    # Command: 'profile'
+    # Action: Runs the current module under cProfile / tracemalloc and reports CPU hotspots and peak memory allocations
+    # Syntax: 'profile run [--top N] [--no-cpu] [--no-memory] [--frames N] [--all-creds [--workspace WORKSPACE] [--parallel N]]'
+
+    @command('Run the current module with CPU / memory profiling and report hotspots and peak allocations')
+    @argument('action', choices=('run',), help='Command to profile')
+    @argument('--top', dest='top', type=int, default=settings.PROFILE_TOP, help=f'Number of hotspots / allocation sites to display [default: {settings.PROFILE_TOP}]')
+    @argument('--no-cpu', dest='cpu', action='store_false', help='Skip cProfile CPU profiling')
+    @argument('--no-memory', dest='memory', action='store_false', help='Skip tracemalloc memory profiling (tracing slows allocation heavy modules)')
+    @argument('--frames', dest='frames', type=int, default=settings.PROFILE_TRACEMALLOC_FRAMES, help=f'Stack frames recorded per allocation; more frames give fuller tracebacks in memory.txt but slow the run [default: {settings.PROFILE_TRACEMALLOC_FRAMES}]')
+    @argument('--all-creds', dest='all_creds', action='store_true', help='Profile a run with each stored credential the module accepts (see run --all-creds)')
+    @argument('--workspace', dest='workspace', default=None, help='Workspace to take credentials from with --all-creds (default: WORKSPACE config)')
+    @argument('--parallel', dest='parallel', type=int, default=None, help='Max module instances run concurrently with --all-creds')
+    def do_profile(self, args):
+        if self.framework.current_module == None:
+            self.print_line('No module currently selected')
+            return
+
+        module = self.framework.current_module
+        self.print_status(f'Profiling module (CPU: {args.cpu}, memory: {args.memory})')
+        profiler = ModuleProfiler(module.search_name, args.top, args.frames, cpu=args.cpu, memory=args.memory)
+        with profiler:
+            self.run_module(args.all_creds, args.workspace, args.parallel)
+        self.framework.sync_output()
+
+        try:
+            path = profiler.save()
+        except OSError as err:
+            self.print_error(f'Failed to save profile reports: {err}')
+            path = None
+
+        self.print_line('')
+        self.print_line(f'  {profiler.summary()}\n')
+        if args.cpu:
+            rows = [[func, calls, f'{tottime:.3f}', f'{cumtime:.3f}'] for func, calls, tottime, cumtime in profiler.hotspots()]
+            self.print_line(f'  Top {args.top} functions by own time:\n')
+            self.framework.print_table(rows, ['Function', 'Calls', 'Own (s)', 'Cumulative (s)'], '  ')
+            self.print_line('')
+
+        if args.memory:
+            rows = [[site, format_bytes(size), count] for site, size, count in profiler.allocations()]
+            self.print_line(f'  Peak traced memory: {format_bytes(profiler.peak)}; top {args.top} allocation sites at peak:\n')
+            self.framework.print_table(rows, ['Allocated at', 'Size', 'Blocks'], '  ')
+            self.print_line('')
+
+        if path != None:
+            self.print_status(f'Profile reports saved to {path}')
+
+    def complete_profile(self, text, line, begidx, endidx):
+        return [i for i in ['run'] if i.startswith(text.lower())]
         
+    # Command: 'stats'
+    # Action: Displays API call metrics collected during the current / last module run, or adaptive rate limiter state
+    # Syntax: 'stats', 'stats calls', 'stats errors', 'stats limiters'
+
+    @command('Show API call metrics (calls, errors, bytes, latency) for the last module run, or rate limiter state')
+    @argument('what', nargs='?', choices=('calls', 'errors', 'limiters'), default='calls', help = 'Metrics to display [default: calls]')
+    def do_stats(self, args):
+        metrics = self.framework.metrics
+        self.print_line('')
+
+        if args.what == 'limiters':
+            rows = [[key[0], key[1] if (key[1] != None) else '-', f'{rate:.2f}', throttles] for key, rate, throttles in self.framework.rate_limiter.stats()]
+            self.print_line('  Adaptive rate limiters:\n')
+            self.framework.print_table(sorted(rows), ['Host', 'Credential', 'Rate (req/s)', 'Throttles'], '  ')
+            self.print_line('')
+            return
+
+        if metrics.module == None:
+            self.print_line('No module runs recorded yet\n')
+            return
+
+        calls, errors, nbytes = metrics.totals()
+        elapsed = metrics.elapsed
+        state = 'running' if (metrics.finished == None) else 'finished'
+        self.print_line(f'  Module: {metrics.module} ({state}, {elapsed:.1f}s elapsed)')
+        self.print_line(f'  Calls: {calls} ({calls / max(elapsed, 1e-6):.1f}/s), errors: {errors}, received: {nbytes} bytes\n')
+
+        ops = metrics.snapshot()
+        if args.what == 'errors':
+            rows = [[kind, target, operation, code, count] for (kind, target, operation), op in ops.items() for code, count in op.errors.items()]
+            rows = sorted(rows, key = lambda row: row[4], reverse=True)
+            self.framework.print_table(rows, ['Type', 'Service / Host', 'Operation', 'Error', 'Count'], '  ')
+        else:
+            rows = []
+            for (kind, target, operation), op in sorted(ops.items(), key = lambda item: item[1].latency.total, reverse=True): # most total time first
+                hist = op.latency
+                rows.append([kind, target, operation, op.calls, sum(op.errors.values()), op.bytes, f'{hist.mean:.1f}',
+                             f'{hist.percentile(50):.0f}', f'{hist.percentile(95):.0f}', f'{hist.percentile(99):.0f}', f'{hist.max:.0f}'])
+            self.framework.print_table(rows, ['Type', 'Service / Host', 'Operation', 'Calls', 'Errors', 'Bytes', 'Avg (ms)', 'p50', 'p95', 'p99', 'Max'], '  ')
+        self.print_line('')
+
+    def complete_stats(self, text, line, begidx, endidx):
+        return [i for i in ['calls', 'errors', 'limiters'] if i.startswith(text.lower())]
+
+
+    # Command: 'cache'
+    # Action: Shows statistics for, or clears, the AWS API response cache (AWS_CACHE config)
+    # Syntax: 'cache stats', 'cache clear [--service SERVICE] [--expired]'
+
+    @command('Show statistics for or clear the AWS API response cache (enabled with the AWS_CACHE config)')
+    @argument('action', nargs='?', choices=('stats', 'clear'), default='stats', help='Action to perform [default: stats]')
+    @argument('--service', dest='service', default=None, help='Only clear cached responses for this service (boto3 name, e.g., ec2)')
+    @argument('--expired', dest='expired', action='store_true', help='Only clear expired responses')
+    def do_cache(self, args):
+        cache = self.framework.api_cache
+        try:
+            if args.action == 'clear':
+                count = cache.clear(args.service, args.expired)
+                self.print_status(f'Deleted {count} cached response(s)')
+                return
+            stats = cache.stats()
+        except Exception as err:
+            self.print_error(f'Unable to read AWS API response cache: {err}')
+            return
+
+        enabled = self.framework._config.get_val(self.framework.CONF_AWS_CACHE)
+        entries, nbytes = sum(row[2] for row in stats), sum(row[4] or 0 for row in stats)
+        hits, misses = sum(row[5] for row in stats), sum(row[6] for row in stats)
+        self.print_line('')
+        self.print_line(f'  AWS API response cache: {"enabled" if enabled else "disabled"} ({cache.path})')
+        self.print_line(f'  Entries: {entries} ({nbytes} bytes), hits: {hits}, misses: {misses} (this session)\n')
+        rows = [[service, operation, count, expired or 0, size or 0, hit, miss] for service, operation, count, expired, size, hit, miss in stats]
+        if len(rows) > 0:
+            self.framework.print_table(rows, ['Service', 'Operation', 'Entries', 'Expired', 'Bytes', 'Hits', 'Misses'], '  ')
+            self.print_line('')
+
+    def complete_cache(self, text, line, begidx, endidx):
+        return [i for i in ['stats', 'clear'] if i.startswith(text.lower())]
+
+
+    # Command: 'checkpoints'
+    # Action: Lists or deletes stored module run checkpoints used by 'run --resume'
+    # Syntax: 'checkpoints [list|clear] [--module MODULE]'
+
+    @command('List or delete stored module run checkpoints (resumed with \'run --resume\')')
+    @argument('action', nargs='?', choices=('list', 'clear'), default='list', help='Action to perform [default: list]')
+    @argument('--module', dest='module', default=None, help='Only list / clear checkpoints for this module (full module path)')
+    def do_checkpoints(self, args):
+        try:
+            if args.action == 'clear':
+                count = self.framework.checkpoints.clear(args.module)
+                self.print_status(f'Deleted {count} checkpoint(s)')
+                return
+
+            rows = [[module, key[:12], status, completed if (total == None) else f'{completed} / {total}', findings, updated]
+                    for key, module, status, completed, total, findings, updated in self.framework.checkpoints.list(args.module)]
+        except Exception as err:
+            self.print_error(f'Unable to read checkpoint database: {err}')
+            return
+
+        self.print_line('')
+        if len(rows) == 0:
+            self.print_line('  No checkpoints stored\n')
+            return
+        self.framework.print_table(rows, ['Module', 'Key', 'Status', 'Completed', 'Findings', 'Updated'], '  ')
+        self.print_line('')
+
+    def complete_checkpoints(self, text, line, begidx, endidx):
+        return [i for i in ['list', 'clear'] if i.startswith(text.lower())]
+
+
+    # Command: 'inventory'
+    # Action: Shows, queries, or clears the workspace's AWS resource inventory (INVENTORY config)
+    # Syntax: 'inventory stats', 'inventory query TYPE [--where COLUMN=VALUE ...]', 'inventory clear [TYPE]' [--region REGION] [--account ACCOUNT] [--workspace WORKSPACE]
+
+    INVENTORY_COLUMNS = {
+        'instances': ['account', 'region', 'instance_id', 'name', 'state', 'key_name', 'instance_profile', 'addresses', 'security_groups'],
+        'stacks': ['account', 'region', 'name', 'status', 'role_arn', 'parameters'],
+        'functions': ['account', 'region', 'name', 'runtime', 'role', 'environment'],
+        'key_pairs': ['account', 'region', 'name', 'key_type', 'fingerprint']
+    }
+
+    @command('Show, query, or clear the AWS resources modules have recorded in the workspace inventory')
+    @argument('action', nargs='?', choices=('stats', 'query', 'clear'), default='stats', help='Action to perform [default: stats]')
+    @argument('resource_type', nargs='?', choices=tuple(INVENTORY_COLUMNS.keys()), default=None, help='Resource type to query / clear (required for query)')
+    @argument('--where', dest='where', action='append', default=[], help='COLUMN=VALUE resources must match (repeatable; e.g., key_name=prod, role=ROLE_ARN, group_id=sg-..., address=10.0.0.1)')
+    @argument('--region', dest='region', default=None, help='Only include resources in this region')
+    @argument('--account', dest='account', default=None, help='Only include resources in this account')
+    @argument('--workspace', dest='workspace', default=None, help='Inventory workspace (default: WORKSPACE config)')
+    def do_inventory(self, args):
+        inventory = self.framework.inventory
+        workspace = args.workspace if (args.workspace != None) else self.framework._config.get_val(self.framework.CONF_WORKSPACE)
+
+        try:
+            if args.action == 'clear':
+                count = inventory.clear(workspace, args.resource_type, args.account, args.region)
+                self.print_status(f'Deleted {count} inventory resource(s) from workspace \'{workspace}\'')
+                return
+
+            if args.action == 'query':
+                if args.resource_type == None:
+                    self.print_error(f'Resource type required for query ({", ".join(self.INVENTORY_COLUMNS.keys())})')
+                    return
+                filters = {}
+                for where in args.where:
+                    col, sep, val = where.partition('=')
+                    if sep == '':
+                        self.print_error(f'Invalid --where \'{where}\' (expected COLUMN=VALUE)')
+                        return
+                    filters[col.strip()] = val.strip()
+                resources = inventory.query(workspace, args.resource_type, args.account, args.region, **filters)
+            else:
+                stats = inventory.stats(workspace)
+        except Exception as err:
+            self.print_error(f'Unable to read AWS resource inventory: {err}')
+            return
+
+        self.print_line('')
+        if args.action == 'query':
+            columns = self.INVENTORY_COLUMNS[args.resource_type]
+            display = lambda val: ', '.join(val) if isinstance(val, list) else (', '.join(f'{k}={v}' for k, v in val.items()) if isinstance(val, dict) else val)
+            rows = [[display(resource.get(col, None)) for col in columns] for resource in resources]
+            if len(rows) == 0:
+                self.print_line(f'  No {args.resource_type} found in workspace \'{workspace}\'\n')
+                return
+            self.framework.print_table(rows, [col.replace('_', ' ').title() for col in columns], '  ')
+            self.print_line(f'\n  {len(rows)} {args.resource_type} found\n')
+            return
+
+        enabled = self.framework._config.get_val(self.framework.CONF_INVENTORY)
+        self.print_line(f'  AWS resource inventory: {"enabled" if enabled else "disabled"} ({inventory.path}), workspace \'{workspace}\'\n')
+        rows = [[resource_type, account, region, count, 'never' if (refreshed == None) else datetime.fromtimestamp(refreshed).isoformat(sep=' ', timespec='seconds')]
+                for resource_type, account, region, count, refreshed in stats
+                if (args.resource_type in [None, resource_type]) and (args.region in [None, region]) and (args.account in [None, account])]
+        if len(rows) == 0:
+            self.print_line('  No resources recorded\n')
+            return
+        self.framework.print_table(rows, ['Type', 'Account', 'Region', 'Resources', 'Last Full Refresh'], '  ')
+        self.print_line('')
+
+    def complete_inventory(self, text, line, begidx, endidx):
+        words = line.split()
+        if len(words) - (0 if (text == '') else 1) >= 2 and words[1] in ['query', 'clear']:
+            return [i for i in self.INVENTORY_COLUMNS.keys() if i.startswith(text.lower())]
+        return [i for i in ['stats', 'query', 'clear'] if i.startswith(text.lower())]
+
+
     # Command: 'fireprox'
     # Action: CRUD operations upon fireprox APIs
     # Syntax: 'fireprox create <URL>', 'fireprox delete <alias>', 'fireprox clean', 'fireprox list'
@@ -1197,15 +1458,19 @@ class InteractiveInterpreter(Command):
                 self.framework.print_error('Error listing fireprox APIs for cleaning')
                 return
             
-            try:
-                for api in api_list:
+            # apigateway:DeleteRestApi is heavily throttled; deletes are paced and throttled deletes retried with backoff
+            removed = 0
+            for index, api in enumerate(api_list):
+                if index > 0: sleep(FireProx.DELETE_INTERVAL)
+                try:
                     status, msg = self.framework.fireprox.delete_api(api)
                     self.framework.print_status(f'Removed fireprox API: \'{api}\'')
-                    sleep(3)
+                    removed += 1
+                except Exception as err:
+                    self.framework.print_error(f'Failed to remove fireprox API \'{api}\': {err}')
+
+            if removed == len(api_list):
                 self.framework.print_status(f'Removed all fireprox APIs')
-            except Exception as err:
-                self.framework.print_error(f'{err}')
-                return
             
         return None # End do_fireprox()
             
@@ -0,0 +1,343 @@
+# Author: @vexance
+# Purpose: Workspace-scoped inventory of AWS resources discovered by modules, queryable by indexed attributes ('inventory' command)
+#
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+
+
+# Inventory database schema version (stored in PRAGMA user_version)
+SCHEMA_VERSION = 1
+
+# resource type => (table, identifier column, attribute columns, JSON-encoded columns)
+RESOURCE_TYPES = {
+    'instances': ('instances', 'instance_id',
+                  ('arn', 'name', 'state', 'platform', 'key_name', 'instance_profile', 'vpc_id', 'subnet_id', 'private_ip', 'public_ip', 'addresses', 'security_groups', 'tags'),
+                  ('addresses', 'security_groups', 'tags')),
+    'stacks': ('stacks', 'stack_id',
+               ('name', 'status', 'description', 'role_arn', 'parameters', 'outputs', 'tags'),
+               ('parameters', 'outputs', 'tags')),
+    'functions': ('functions', 'arn',
+                  ('name', 'role', 'runtime', 'handler', 'version', 'description', 'environment'),
+                  ('environment',)),
+    'key_pairs': ('key_pairs', 'name',
+                  ('key_pair_id', 'fingerprint', 'key_type'),
+                  ())
+}
+
+# resource type => {index table: (indexed column, list-valued resource column)}; one index row per list entry
+RESOURCE_INDEXES = {
+    'instances': {'instance_addresses': ('address', 'addresses'), 'instance_security_groups': ('group_id', 'security_groups')}
+}
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS instances (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, instance_id TEXT NOT NULL,
+        arn TEXT, name TEXT, state TEXT, platform TEXT, key_name TEXT, instance_profile TEXT, vpc_id TEXT, subnet_id TEXT,
+        private_ip TEXT, public_ip TEXT, addresses TEXT, security_groups TEXT, tags TEXT, updated REAL NOT NULL,
+        PRIMARY KEY (workspace, account, region, instance_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS instances_key_name ON instances (workspace, key_name)',
+    'CREATE INDEX IF NOT EXISTS instances_profile ON instances (workspace, instance_profile)',
+    '''CREATE TABLE IF NOT EXISTS instance_addresses (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, instance_id TEXT NOT NULL, address TEXT NOT NULL,
+        PRIMARY KEY (workspace, account, region, instance_id, address)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS instance_addresses_address ON instance_addresses (workspace, address)',
+    '''CREATE TABLE IF NOT EXISTS instance_security_groups (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, instance_id TEXT NOT NULL, group_id TEXT NOT NULL,
+        PRIMARY KEY (workspace, account, region, instance_id, group_id)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS instance_security_groups_group ON instance_security_groups (workspace, group_id)',
+    '''CREATE TABLE IF NOT EXISTS stacks (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, stack_id TEXT NOT NULL,
+        name TEXT, status TEXT, description TEXT, role_arn TEXT, parameters TEXT, outputs TEXT, tags TEXT, updated REAL NOT NULL,
+        PRIMARY KEY (workspace, account, region, stack_id)
+    )''',
+    'CREATE INDEX IF NOT EXISTS stacks_name ON stacks (workspace, name)',
+    '''CREATE TABLE IF NOT EXISTS functions (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, arn TEXT NOT NULL,
+        name TEXT, role TEXT, runtime TEXT, handler TEXT, version TEXT, description TEXT, environment TEXT, updated REAL NOT NULL,
+        PRIMARY KEY (workspace, account, region, arn)
+    )''',
+    'CREATE INDEX IF NOT EXISTS functions_role ON functions (workspace, role)',
+    'CREATE INDEX IF NOT EXISTS functions_name ON functions (workspace, name)',
+    '''CREATE TABLE IF NOT EXISTS key_pairs (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, name TEXT NOT NULL,
+        key_pair_id TEXT, fingerprint TEXT, key_type TEXT, updated REAL NOT NULL,
+        PRIMARY KEY (workspace, account, region, name)
+    )''',
+    'CREATE INDEX IF NOT EXISTS key_pairs_fingerprint ON key_pairs (workspace, fingerprint)',
+    '''CREATE TABLE IF NOT EXISTS refreshes (
+        workspace TEXT NOT NULL, account TEXT NOT NULL, region TEXT NOT NULL, resource_type TEXT NOT NULL, refreshed REAL NOT NULL,
+        PRIMARY KEY (workspace, account, region, resource_type)
+    ) WITHOUT ROWID'''
+]
+
+
+def format_tags(tags: list) -> dict:
+    '''Convert an AWS [{'Key': str, 'Value': str}] tag list into a dict'''
+    return {tag.get('Key', None): tag.get('Value', None) for tag in (tags or [])}
+
+
+def instance_addresses(instance: dict) -> list:
+    '''Return every unique IP address of an ec2:DescribeInstances instance (top-level, network interface, and association addresses)'''
+    ips = [instance.get('PrivateIpAddress', None), instance.get('PublicIpAddress', None), instance.get('Ipv6Address', None)]
+
+    for ni in instance.get('NetworkInterfaces', []) or []:
+        ips.append(ni.get('PrivateIpAddress', None))
+        assoc = ni.get('Association', {}) or {}
+        ips.extend([assoc.get('PublicIp', None), assoc.get('CarrierIp', None), assoc.get('CustomerOwnedIp', None)])
+
+        for pip in ni.get('PrivateIpAddresses', []) or []:
+            ips.append(pip.get('PrivateIpAddress', None))
+            private_assoc = pip.get('Association', {}) or {}
+            ips.extend([private_assoc.get('PublicIp', None), private_assoc.get('CarrierIp', None), private_assoc.get('CustomerOwnedIp', None)])
+
+        for ipv6 in ni.get('Ipv6Addresses', []) or []:
+            ips.append(ipv6.get('Ipv6Address', None))
+
+    return [ip for ip in dict.fromkeys(ips) if ip != None]
+
+
+def normalize_instance(instance: dict, region: str, account: str) -> dict:
+    '''Inventory row for an ec2:DescribeInstances instance'''
+    instance_id = instance.get('InstanceId', None)
+    tags = format_tags(instance.get('Tags', []))
+    return {
+        'instance_id': instance_id,
+        'arn': f'arn:aws:ec2:{region}:{account}:instance/{instance_id}',
+        'name': tags.get('Name', None),
+        'state': instance.get('State', {}).get('Name', 'unknown'),
+        'platform': instance.get('Platform', 'Linux'), # 'Windows' or None as per docs
+        'key_name': instance.get('KeyName', None),
+        'instance_profile': (instance.get('IamInstanceProfile', None) or {}).get('Arn', None),
+        'vpc_id': instance.get('VpcId', None),
+        'subnet_id': instance.get('SubnetId', None),
+        'private_ip': instance.get('PrivateIpAddress', None),
+        'public_ip': instance.get('PublicIpAddress', None),
+        'addresses': instance_addresses(instance),
+        'security_groups': [sg.get('GroupId', None) for sg in instance.get('SecurityGroups', []) or [] if sg.get('GroupId', None) != None],
+        'tags': tags
+    }
+
+
+def normalize_stack(stack: dict) -> dict:
+    '''Inventory row for a cloudformation:DescribeStacks stack'''
+    parameters = {}
+    for param in stack.get('Parameters', []) or []:
+        val, resolved = param.get('ParameterValue', None), param.get('ResolvedValue', None)
+        parameters[param.get('ParameterKey', None)] = val if (resolved == None) else f'{val} (ResolvedValue: {resolved})'
+
+    return {
+        'stack_id': stack.get('StackId', None),
+        'name': stack.get('StackName', None),
+        'status': stack.get('StackStatus', None),
+        'description': stack.get('Description', None),
+        'role_arn': stack.get('RoleARN', None),
+        'parameters': parameters,
+        'outputs': {output.get('OutputKey', None): output.get('OutputValue', None) for output in stack.get('Outputs', []) or []},
+        'tags': format_tags(stack.get('Tags', []))
+    }
+
+
+def normalize_function(function: dict) -> dict:
+    '''Inventory row for a lambda:ListFunctions function'''
+    return {
+        'arn': function.get('FunctionArn', None),
+        'name': function.get('FunctionName', None),
+        'role': function.get('Role', None),
+        'runtime': function.get('Runtime', None),
+        'handler': function.get('Handler', None),
+        'version': function.get('Version', None),
+        'description': function.get('Description', None),
+        'environment': (function.get('Environment', None) or {}).get('Variables', None)
+    }
+
+
+def normalize_key_pair(key_pair: dict) -> dict:
+    '''Inventory row for an ec2:DescribeKeyPairs key pair'''
+    return {
+        'name': key_pair.get('KeyName', None),
+        'key_pair_id': key_pair.get('KeyPairId', None),
+        'fingerprint': key_pair.get('KeyFingerprint', None),
+        'key_type': key_pair.get('KeyType', None)
+    }
+
+
+class InventoryStore(object):
+    '''
+    SQLite database (lib.inventory_filepath()) of AWS resources discovered by modules. Resources are stored per workspace /
+    account / region in one table per resource type (RESOURCE_TYPES) with indexes on the attributes modules look resources up
+    by (e.g., instances by key pair, security group, or address; functions by execution role; key pairs by fingerprint). A
+    module that lists every resource of a type in a region replaces that region's rows and records the refresh time, so later
+    runs can query the inventory instead of listing again while it is fresh (see refreshed()).
+    '''
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+        self._logger = logging.getLogger('stratustryke.inventory')
+        self._lock = threading.RLock() # connection is shared with module worker threads
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self.migrate()
+
+
+    def migrate(self) -> None:
+        '''Create or upgrade the inventory schema to SCHEMA_VERSION'''
+        with self._lock:
+            version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= SCHEMA_VERSION: return
+            with self._conn:
+                for statement in SCHEMA:
+                    self._conn.execute(statement)
+                self._conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+
+    @staticmethod
+    def resource_type(resource_type: str) -> tuple:
+        if resource_type not in RESOURCE_TYPES:
+            raise ValueError(f'Unknown inventory resource type \'{resource_type}\' (expected one of {", ".join(RESOURCE_TYPES)})')
+        return RESOURCE_TYPES[resource_type]
+
+
+    def _write(self, workspace: str, account: str, region: str, resource_type: str, rows: list) -> int:
+        '''Insert / replace rows and their index entries; caller holds the lock and an open transaction'''
+        table, ident, columns, encoded = InventoryStore.resource_type(resource_type)
+        indexes = RESOURCE_INDEXES.get(resource_type, {})
+        names = ('workspace', 'account', 'region', ident) + columns + ('updated',)
+        insert = f'INSERT OR REPLACE INTO {table} ({", ".join(names)}) VALUES ({", ".join("?" * len(names))})'
+        now = time.time()
+
+        values, entries = [], {index: [] for index in indexes}
+        for row in rows:
+            if row.get(ident, None) == None: continue
+            values.append((workspace, account, region, row[ident],
+                           *[json.dumps(row.get(col, None), default=str) if (col in encoded) else row.get(col, None) for col in columns], now))
+            for index, (index_col, source) in indexes.items():
+                entries[index].extend((workspace, account, region, row[ident], entry) for entry in dict.fromkeys(row.get(source, None) or []))
+
+        self._conn.executemany(insert, values)
+        for index, (index_col, source) in indexes.items():
+            self._conn.executemany(f'DELETE FROM {index} WHERE workspace = ? AND account = ? AND region = ? AND {ident} = ?', (value[:4] for value in values))
+            self._conn.executemany(f'INSERT OR IGNORE INTO {index} (workspace, account, region, {ident}, {index_col}) VALUES (?, ?, ?, ?, ?)', entries[index])
+        return len(values)
+
+
+    def upsert(self, workspace: str, account: str, region: str, resource_type: str, rows: list) -> int:
+        '''Insert or update resources without removing others in the region (e.g., the results of a filtered / partial listing)
+        :param rows: list[dict] normalized resources (see normalize_*())
+        :return: int number of resources written'''
+        with self._lock, self._conn:
+            return self._write(workspace, account, region, resource_type, rows)
+
+
+    def replace(self, workspace: str, account: str, region: str, resource_type: str, rows: list) -> int:
+        '''Replace every resource of a type in a region with the results of a complete listing and record the refresh time
+        :param rows: list[dict] normalized resources (see normalize_*())
+        :return: int number of resources written'''
+        with self._lock, self._conn:
+            self._delete(workspace, resource_type, account, region)
+            count = self._write(workspace, account, region, resource_type, rows)
+            self._conn.execute('INSERT OR REPLACE INTO refreshes (workspace, account, region, resource_type, refreshed) VALUES (?, ?, ?, ?, ?)',
+                               (workspace, account, region, resource_type, time.time()))
+        return count
+
+
+    def refreshed(self, workspace: str, account: str, region: str, resource_type: str) -> float:
+        ''':return: float epoch time a resource type was last completely listed in a region (None if never)'''
+        with self._lock:
+            row = self._conn.execute('SELECT refreshed FROM refreshes WHERE workspace = ? AND account = ? AND region = ? AND resource_type = ?',
+                                     (workspace, account, region, resource_type)).fetchone()
+        return row[0] if (row != None) else None
+
+
+    def query(self, workspace: str, resource_type: str, account: str = None, region: str = None, **filters) -> list:
+        '''Return resources matching every filter (resource column = value). Index tables of the resource type are filtered by
+        their indexed column name (e.g., address= / group_id= for instances).
+        :return: list[dict] resources with workspace, account, region, and decoded column values'''
+        table, ident, columns, encoded = InventoryStore.resource_type(resource_type)
+        indexes = {index_col: index for index, (index_col, source) in RESOURCE_INDEXES.get(resource_type, {}).items()}
+        clauses, params = ['workspace = ?'], [workspace]
+        if account != None: clauses, params = clauses + ['account = ?'], params + [account]
+        if region != None: clauses, params = clauses + ['region = ?'], params + [region]
+
+        for col, val in filters.items():
+            if col in indexes:
+                clauses.append(f'''EXISTS (SELECT 1 FROM {indexes[col]} i WHERE i.workspace = {table}.workspace AND i.account = {table}.account
+                                   AND i.region = {table}.region AND i.{ident} = {table}.{ident} AND i.{col} = ?)''')
+            elif col in (ident,) + columns and col not in encoded:
+                clauses.append(f'{col} = ?')
+            else:
+                raise ValueError(f'Cannot filter {resource_type} inventory by \'{col}\'')
+            params.append(val)
+
+        names = ('workspace', 'account', 'region', ident) + columns + ('updated',)
+        with self._lock:
+            rows = self._conn.execute(f'SELECT {", ".join(names)} FROM {table} WHERE {" AND ".join(clauses)} ORDER BY account, region, {ident}', params).fetchall()
+
+        return [{name: (json.loads(val) if (name in encoded and val != None) else val) for name, val in zip(names, row)} for row in rows]
+
+
+    def instances_with_key(self, workspace: str, key_name: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'instances', account, region, key_name=key_name)
+
+
+    def instances_with_profile(self, workspace: str, profile_arn: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'instances', account, region, instance_profile=profile_arn)
+
+
+    def instances_in_security_group(self, workspace: str, group_id: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'instances', account, region, group_id=group_id)
+
+
+    def instances_with_address(self, workspace: str, address: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'instances', account, region, address=address)
+
+
+    def functions_with_role(self, workspace: str, role_arn: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'functions', account, region, role=role_arn)
+
+
+    def key_pairs_with_fingerprint(self, workspace: str, fingerprint: str, account: str = None, region: str = None) -> list:
+        return self.query(workspace, 'key_pairs', account, region, fingerprint=fingerprint)
+
+
+    def stats(self, workspace: str) -> list:
+        ''':return: list[tuple] of (resource type, account, region, resources, refreshed) for a workspace'''
+        counts = {}
+        with self._lock:
+            for resource_type, (table, ident, columns, encoded) in RESOURCE_TYPES.items():
+                for account, region, count in self._conn.execute(f'SELECT account, region, COUNT(*) FROM {table} WHERE workspace = ? GROUP BY account, region', (workspace,)):
+                    counts[(resource_type, account, region)] = [count, None]
+            for account, region, resource_type, refreshed in self._conn.execute('SELECT account, region, resource_type, refreshed FROM refreshes WHERE workspace = ?', (workspace,)):
+                counts.setdefault((resource_type, account, region), [0, None])[1] = refreshed
+        return sorted((*key, count, refreshed) for key, (count, refreshed) in counts.items())
+
+
+    def _delete(self, workspace: str, resource_type: str, account: str = None, region: str = None) -> int:
+        '''Remove a resource type's rows / index entries / refresh times; caller holds the lock and an open transaction'''
+        table = InventoryStore.resource_type(resource_type)[0]
+        clauses, params = ['workspace = ?'], [workspace]
+        if account != None: clauses, params = clauses + ['account = ?'], params + [account]
+        if region != None: clauses, params = clauses + ['region = ?'], params + [region]
+        where = ' AND '.join(clauses)
+
+        for index in RESOURCE_INDEXES.get(resource_type, {}):
+            self._conn.execute(f'DELETE FROM {index} WHERE {where}', params)
+        self._conn.execute(f'DELETE FROM refreshes WHERE {where} AND resource_type = ?', params + [resource_type])
+        return self._conn.execute(f'DELETE FROM {table} WHERE {where}', params).rowcount
+
+
+    def clear(self, workspace: str, resource_type: str = None, account: str = None, region: str = None) -> int:
+        '''Delete stored resources of a workspace (only of one type / account / region, if specified)
+        :return: int number of resources deleted'''
+        resource_types = list(RESOURCE_TYPES) if (resource_type == None) else [resource_type]
+        with self._lock, self._conn:
+            return sum(self._delete(workspace, name, account, region) for name in resource_types)
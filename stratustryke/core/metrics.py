@@ -0,0 +1,249 @@
+# Author: @vexance
+# Purpose: Per-run API call metrics (boto3 operations / framework HTTP requests) and progress reporting for long loops
+#
+
+import threading
+import time
+
+from bisect import bisect_left
+from collections import Counter
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from stratustryke.settings import PROGRESS_INTERVAL
+
+
+# Upper bounds (milliseconds) of latency histogram buckets; slower calls land in a final overflow bucket
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+
+class LatencyHistogram(object):
+    '''Fixed-bucket latency histogram; percentiles are reported as the upper bound of the bucket they fall in'''
+
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+
+    def add(self, latency_ms: float) -> None:
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.count += 1
+        self.total += latency_ms
+        self.max = max(self.max, latency_ms)
+
+
+    def merge(self, other) -> None:
+        '''Add another histogram's counts into this one'''
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+
+    @property
+    def mean(self) -> float:
+        return (self.total / self.count) if (self.count > 0) else 0.0
+
+
+    def percentile(self, pct: float) -> float:
+        '''Approximate latency (ms) at or below which pct percent of calls completed'''
+        if self.count == 0: return 0.0
+        target = max(1, round(self.count * pct / 100))
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(LATENCY_BUCKETS_MS[idx], self.max) if (idx < len(LATENCY_BUCKETS_MS)) else self.max
+        return self.max
+
+
+class OperationStats(object):
+    '''Counters for one (kind, target, operation) key, e.g. ('aws', 'ec2', 'DescribeInstances') or ('http', host, 'GET')'''
+
+    __slots__ = ('calls', 'errors', 'bytes', 'latency')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = Counter() # error code / HTTP status / exception name => count
+        self.bytes = 0 # response bytes received
+        self.latency = LatencyHistogram()
+
+
+class APIMetrics(object):
+    '''
+    Collects call counts, error codes, response sizes and latency histograms for boto3 operations (via botocore
+    before-call / after-call events on pooled sessions) and framework HTTP requests. Counters are reset at the start of each
+    module run (see StratustrykeFramework.record_run()) and kept afterwards for the 'stats' command.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._ops = {}
+        self.module = None
+        self.started = None
+        self.finished = None
+
+
+    def start(self, module_name: str) -> None:
+        '''Reset counters for a new module run'''
+        with self._lock:
+            self._ops = {}
+            self.module = module_name
+            self.started = time.time()
+            self.finished = None
+
+
+    def finish(self) -> None:
+        self.finished = time.time()
+
+
+    @property
+    def elapsed(self) -> float:
+        if self.started == None: return 0.0
+        return (self.finished if (self.finished != None) else time.time()) - self.started
+
+
+    def record(self, kind: str, target: str, operation: str, latency: float, error: str = None, nbytes: int = 0) -> None:
+        '''Record one completed call; latency is in seconds'''
+        key = (kind, target, operation)
+        with self._lock:
+            stats = self._ops.get(key, None)
+            if stats == None:
+                stats = self._ops[key] = OperationStats()
+            stats.calls += 1
+            stats.bytes += nbytes
+            stats.latency.add(latency * 1000)
+            if error != None: stats.errors[error] += 1
+
+
+    def snapshot(self) -> dict:
+        ''':return: dict[tuple, OperationStats] copy of the current counters keyed by (kind, target, operation)'''
+        with self._lock:
+            return dict(self._ops)
+
+
+    def totals(self) -> tuple:
+        ''':return: tuple(calls, errors, bytes) across all operations'''
+        ops = self.snapshot().values()
+        return (sum(op.calls for op in ops), sum(sum(op.errors.values()) for op in ops), sum(op.bytes for op in ops))
+
+
+    def latency(self, kind: str = None) -> LatencyHistogram:
+        ''':return: LatencyHistogram combining every operation (of the given kind, e.g., 'aws' or 'http', if specified)'''
+        combined = LatencyHistogram()
+        for (op_kind, target, operation), stats in self.snapshot().items():
+            if kind == None or op_kind == kind: combined.merge(stats.latency)
+        return combined
+
+
+    def attach_boto_session(self, session) -> None:
+        '''Register event handlers on a boto3 session so calls from every client it creates are recorded. Latency covers the
+        whole call including botocore retries (and rate limiter waits).'''
+        def before_call(model = None, context = None, **kwargs):
+            if context != None: context['stratustryke_metrics'] = (time.monotonic(), model.service_model.service_name, model.name)
+
+        def after_call(http_response = None, parsed = None, context = None, **kwargs):
+            started = context.get('stratustryke_metrics', None) if (context != None) else None
+            if started == None: return
+            error = None
+            if http_response.status_code >= 300:
+                error = (parsed.get('Error', {}).get('Code', None) if isinstance(parsed, dict) else None) or str(http_response.status_code)
+            try:
+                nbytes = int(http_response.headers.get('content-length', 0))
+            except (TypeError, ValueError):
+                nbytes = 0
+            self.record('aws', started[1], started[2], time.monotonic() - started[0], error, nbytes)
+
+        def after_call_error(exception = None, context = None, **kwargs):
+            started = context.get('stratustryke_metrics', None) if (context != None) else None
+            if started == None: return
+            self.record('aws', started[1], started[2], time.monotonic() - started[0], type(exception).__name__)
+
+        session.events.register('before-call', before_call)
+        session.events.register('after-call', after_call)
+        session.events.register('after-call-error', after_call_error)
+
+
+    def send_http(self, method: str, url: str, send, stream: bool = False):
+        '''Time an HTTP request; send() returns a requests.Response. Exceptions are recorded by type and re-raised.'''
+        host = urlsplit(url).netloc.lower()
+        started = time.monotonic()
+        try:
+            res = send()
+        except Exception as err:
+            self.record('http', host, method, time.monotonic() - started, type(err).__name__)
+            raise
+
+        if res == None: return res
+        error = str(res.status_code) if (res.status_code >= 400) else None
+        try:
+            nbytes = int(res.headers.get('Content-Length', 0)) if stream else len(res.content)
+        except (TypeError, ValueError):
+            nbytes = 0
+        self.record('http', host, method, time.monotonic() - started, error, nbytes)
+        return res
+
+
+_METRICS = APIMetrics()
+
+
+def api_metrics() -> APIMetrics:
+    return _METRICS
+
+
+class Progress(object):
+    '''
+    Tracks completed iterations of a long-running loop and reports '[done / total]' with throughput and ETA each time another
+    1/steps of the total completes, or every interval seconds, whichever comes first. Safe to advance from worker threads.
+    '''
+
+    def __init__(self, total: int, report, label: str = 'requests', steps: int = 10, interval: float = PROGRESS_INTERVAL) -> None:
+        self._lock = threading.Lock()
+        self.total = total
+        self.done = 0
+        self._report = report
+        self._label = label
+        self._step = max(1, total // max(1, steps)) if (total != None) else None
+        self._interval = interval
+        self._started = time.monotonic()
+        self._last_report = self._started
+        self._next_step = self._step
+
+
+    @staticmethod
+    def format_eta(seconds: float) -> str:
+        return str(timedelta(seconds=int(seconds)))
+
+
+    def message(self) -> str:
+        elapsed = max(time.monotonic() - self._started, 1e-6)
+        rate = self.done / elapsed
+        if self.total == None:
+            return f'[{self.done}] {self._label} completed ({rate:.1f}/s)'
+
+        remaining = max(0, self.total - self.done)
+        eta = Progress.format_eta(remaining / rate) if (rate > 0) else 'unknown'
+        return f'[{self.done} / {self.total}] {self._label} completed ({rate:.1f}/s, ETA {eta})'
+
+
+    def advance(self, count: int = 1) -> None:
+        with self._lock:
+            self.done += count
+            now = time.monotonic()
+            due = (self._step != None and self.done >= self._next_step) or (now - self._last_report >= self._interval)
+            if not due or (self.total != None and self.done >= self.total): return # the final count is reported by finish()
+            while self._step != None and self._next_step <= self.done: self._next_step += self._step
+            self._last_report = now
+            msg = self.message()
+        self._report(msg)
+
+
+    def finish(self) -> None:
+        '''Report the final count and overall throughput'''
+        with self._lock:
+            msg = self.message()
+        self._report(msg)
@@ -1,34 +1,141 @@
 # Author: @vexance
 # Purpose: Handles the loading of stratustryke modules
-# 
+#
 
-import collections
 import collections.abc
-import logging
+import hashlib
 import importlib
+import json
+import logging
+import os
 
-from pluginbase import PluginBase
-from stratustryke.core.module import StratustrykeModule
+from pathlib import Path
 
+from stratustryke import __version__
+from stratustryke.core.module import StratustrykeModule
 from stratustryke.core.option import Options
+from stratustryke.lib import module_index_filepath, stratustryke_dir
+
+
+MANIFEST_VERSION = 1 # Bump when the structure of manifest records changes
+
+
+def _file_digest(path: Path) -> str:
+    '''Return sha256 hex digest of a file's contents'''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _core_fingerprint() -> list:
+    '''Stat the base module / option classes and the settings / regex constants they use for option defaults; option schemas
+    in the manifest are stale if any of these change
+    :return: list[list] containing [path, mtime_ns, size] entries (paths relative to the stratustryke package)'''
+    package_dir = stratustryke_dir()
+    core_dir = package_dir/'core'
+    files = sorted((core_dir/'module').glob('*.py')) + [core_dir/'option.py', package_dir/'settings.py', package_dir/'lib'/'regex.py']
+    fingerprint = []
+    for path in files:
+        stat = path.stat()
+        fingerprint.append([path.relative_to(package_dir).as_posix(), stat.st_mtime_ns, stat.st_size])
+    return fingerprint
+
+
+def _option_schema(options: Options) -> list:
+    '''Serialize an Options container into a list of JSON compatible dicts'''
+    schema = []
+    for opt in options.get_all():
+        default = opt._default
+        if not isinstance(default, (str, int, float, bool, type(None))):
+            default = str(default) # e.g., Path objects from module_data_dir()
+        regex = opt._regex.pattern if hasattr(opt._regex, 'pattern') else opt._regex # compiled patterns from lib.regex
+
+        schema.append({
+            'name': opt._name,
+            'type': opt._opt_type,
+            'desc': opt._desc,
+            'required': opt._is_required,
+            'default': default,
+            'regex': regex,
+            'sensitive': opt._sensitive
+        })
+    return schema
+
+
+def _options_from_schema(schema: list) -> Options:
+    '''Rebuild an Options container from a serialized option schema'''
+    options = Options()
+    for opt in schema:
+        if opt['type'] == 'str':
+            options.add_string(opt['name'], opt['desc'], opt['required'], opt['default'], opt['regex'] or '', opt['sensitive'])
+        elif opt['type'] == 'int':
+            options.add_integer(opt['name'], opt['desc'], opt['required'], opt['default'])
+        elif opt['type'] == 'flt':
+            options.add_float(opt['name'], opt['desc'], opt['required'], opt['default'])
+        elif opt['type'] == 'bool':
+            options.add_boolean(opt['name'], opt['desc'], opt['required'], opt['default'])
+    return options
+
+
+class _ModuleEntry(object):
+    '''Manifest record for a module file. The module is only imported / instantiated when the instance is requested'''
 
-_ModuleReference = collections.namedtuple('_ModuleReference', ('instance', 'module'))
+    def __init__(self, record: dict) -> None:
+        self.record = record
+        self.module = None
+        self.instance = None
+
+    @property
+    def search_name(self) -> str:
+        return self.record['search_name']
+
+    @property
+    def desc(self) -> str:
+        return self.record['description']
+
+    @property
+    def package(self) -> str:
+        return self.record['package']
+
+    def show_options(self, mask: bool = False, truncate: bool = True) -> list:
+        ''':return: list[list[str]] containing rows of column values'''
+        if self.instance != None:
+            return self.instance.show_options(mask, truncate)
+        return _options_from_schema(self.record['options']).show_options(mask, truncate)
+
+    def show_advanced(self, mask: bool = False, truncate: bool = True) -> list:
+        ''':return: list[list[str]] containing rows of column values'''
+        if self.instance != None:
+            return self.instance.show_advanced(mask, truncate)
+        return _options_from_schema(self.record['advanced']).show_options(mask, truncate)
 
 
 class ModManager(collections.abc.Mapping):
+    '''Module index keyed by search name. Module metadata is served from a persisted manifest which is revalidated
+    against file stats on startup; modules are only imported when an instance is requested (use, info, run)'''
+
     def __init__(self, framework, search: str) -> None:
         super().__init__()
         self._logger = logging.getLogger('stratustryke.mod_manager')
         self.framework = framework
-        self.source = PluginBase(package='stratustryke.modules').make_plugin_source(searchpath=search)
+        self.search_dir = Path(search).absolute()
+        self.manifest_path = module_index_filepath()
         self._modules = {}
 
-        for mod_id in self.source.list_plugins():
-            self.init_module(self.source.load_plugin(mod_id))
+        self.load_manifest()
 
 
     def __getitem__(self, key):
-        return self._modules[key].instance
+        entry = self._modules[key]
+        if entry.instance == None:
+            self.import_entry(entry)
+        return entry.instance
+
+
+    def __contains__(self, key):
+        return key in self._modules # Mapping's default would import the module via __getitem__
 
 
     def __iter__(self):
@@ -39,17 +146,174 @@ class ModManager(collections.abc.Mapping):
         return len(self._modules)
 
 
+    def entries(self) -> list:
+        '''Return manifest entries for all indexed modules without importing them
+        :return: list[_ModuleEntry]'''
+        return list(self._modules.values())
+
+
+    def get_entry(self, key: str) -> _ModuleEntry:
+        '''Return the manifest entry for a module without importing it'''
+        return self._modules.get(key, None)
+
+
+    def read_manifest(self) -> dict:
+        '''Read the persisted manifest; returns an empty manifest if missing, unreadable, or from another version'''
+        empty = {'manifest_version': MANIFEST_VERSION, 'stratustryke_version': __version__, 'core': [], 'files': {}}
+        try:
+            with open(self.manifest_path, 'r') as handle:
+                manifest = json.load(handle)
+        except FileNotFoundError:
+            return empty
+        except Exception as err:
+            self._logger.warning(f'Unable to read module manifest {self.manifest_path}: {err}')
+            return empty
+
+        if manifest.get('manifest_version') != MANIFEST_VERSION or manifest.get('stratustryke_version') != __version__:
+            self._logger.info('Module manifest version mismatch; rebuilding')
+            return empty
+
+        return manifest
+
+
+    def write_manifest(self, manifest: dict) -> None:
+        '''Persist the manifest (write to a temp file and swap it in to avoid torn reads by concurrent launches)'''
+        tmp_path = self.manifest_path.with_name(f'{self.manifest_path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w') as handle:
+                json.dump(manifest, handle)
+            os.replace(tmp_path, self.manifest_path)
+        except Exception as err:
+            self._logger.warning(f'Unable to write module manifest {self.manifest_path}: {err}')
+            tmp_path.unlink(missing_ok=True)
+
+
+    def load_manifest(self) -> None:
+        '''Revalidate the manifest against module files on disk, (re)indexing any new or modified files'''
+        manifest = self.read_manifest()
+        dirty = False
+
+        core = _core_fingerprint()
+        if manifest['core'] != core: # Base classes changed; inherited option schemas may be stale
+            manifest['core'] = core
+            manifest['files'] = {}
+            dirty = True
+
+        cached = manifest['files']
+        current = {}
+
+        for path in sorted(self.search_dir.glob('**/*.py')):
+            if path.name == '__init__.py' or '__pycache__' in path.parts:
+                continue
+
+            rel_path = path.relative_to(self.search_dir).as_posix()
+            stat = path.stat()
+            record = cached.get(rel_path, None)
+
+            if record != None and record['mtime_ns'] == stat.st_mtime_ns and record['size'] == stat.st_size:
+                current[rel_path] = record
+                continue
+
+            digest = _file_digest(path)
+            if record != None and record['sha256'] == digest: # touched but not modified
+                record['mtime_ns'], record['size'] = stat.st_mtime_ns, stat.st_size
+                current[rel_path] = record
+                dirty = True
+                continue
+
+            current[rel_path] = self.index_file(rel_path, stat, digest)
+            dirty = True
+
+        if set(current.keys()) != set(cached.keys()):
+            dirty = True # files were removed
+
+        manifest['files'] = current
+        if dirty:
+            self.write_manifest(manifest)
+
+        # Build the search name => entry mapping (keeping any entries already instantiated during indexing)
+        for rel_path, record in current.items():
+            if not record.get('valid', False):
+                continue
+
+            if record['search_name'] in self._modules:
+                if self._modules[record['search_name']].record is not record:
+                    self._logger.error(f'Duplicate module search name \'{record["search_name"]}\' in {rel_path}; skipping')
+                continue
+
+            self._modules[record['search_name']] = _ModuleEntry(record)
+
+
+    def index_file(self, rel_path: str, stat: os.stat_result, digest: str) -> dict:
+        '''Import a module file and record its metadata in a manifest record'''
+        package = 'stratustryke.modules.' + '.'.join(Path(rel_path).with_suffix('').parts)
+        record = {
+            'package': package,
+            'mtime_ns': stat.st_mtime_ns,
+            'size': stat.st_size,
+            'sha256': digest,
+            'valid': False
+        }
+
+        self._logger.info(f'Indexing module file: {rel_path}')
+        try:
+            module = importlib.import_module(package)
+        except Exception as err:
+            self._logger.error(f'Failed to import module file \'{rel_path}\': {err}')
+            return record
+
+        instance = self.init_module(module)
+        if instance == None:
+            return record
+
+        record.update({
+            'valid': True,
+            'search_name': instance.search_name,
+            'description': instance.desc,
+            'options': _option_schema(instance._options),
+            'advanced': _option_schema(instance._advanced)
+        })
+
+        # Keep what we've already paid to instantiate
+        if instance.search_name not in self._modules:
+            entry = _ModuleEntry(record)
+            entry.module, entry.instance = module, instance
+            self._modules[instance.search_name] = entry
+
+        return record
+
+
+    def import_entry(self, entry: _ModuleEntry):
+        '''Import and instantiate the Module class for a manifest entry'''
+        try:
+            entry.module = importlib.import_module(entry.package)
+        except Exception: # logged with the traceback
+            self._logger.error(f'Failed to import module \'{entry.search_name}\'', exc_info=True)
+            raise KeyError(entry.search_name)
+
+        instance = self.init_module(entry.module)
+        if instance == None:
+            raise KeyError(entry.search_name)
+
+        entry.instance = instance
+        return instance
+
+
     def init_module(self, module):
         '''Creates an instance of the module's Module class and checks attributes'''
         mod_id = module.__name__.split('.')[-1]
-        
+
         # Check module implements Module class
         if not hasattr(module, 'Module'): # Module must override class Module
             self._logger.error(f'Module: \'{mod_id}\' does not implement Module class')
             return
 
         # Check instances of the Module class have required attributes - inherit StratustrykeModule, use Options, specify _info
-        instance = module.Module(self.framework)
+        try:
+            instance = module.Module(self.framework)
+        except Exception as err:
+            self._logger.error(f'Module: \'{mod_id}\' raised exception during instantiation: {err}')
+            return
         if not isinstance(instance, StratustrykeModule): # Modules must inherit StratustrykeModule
             self._logger.error(f'Module: \'{mod_id}\' does not inherit from StratustrykeModule class')
             return
@@ -59,15 +323,18 @@ class ModManager(collections.abc.Mapping):
         if not(instance._info.get('Authors', False) and instance._info.get('Details', False) and instance._info.get('References', False) and (instance.desc != False)):
             self._logger.error(f'Module: {mod_id} does not designate necessary info - Author, Details, References, Description')
             return
-        
-        # we'll keep a reference to the instance to preserve option configurations
-        self._modules[instance.search_name] = _ModuleReference(instance, module) 
+
         return instance
 
 
     def reload(self, mod: str):
         '''Reloads a module and resets the instance'''
-        reference = self._modules[mod]
-        importlib.reload(reference.module)
-        return self.init_module(reference.module)
+        entry = self._modules[mod]
+        if entry.module == None:
+            return self.import_entry(entry)
 
+        importlib.reload(entry.module)
+        instance = self.init_module(entry.module)
+        if instance != None:
+            entry.instance = instance
+        return instance
@@ -7,16 +7,31 @@ import urllib3
 
 from os import linesep
 from http.client import responses as httpresponses
-from requests import request, Response
+from requests import Response
 from pathlib import Path
 
 from stratustryke.core.option import Options
+from stratustryke.core.metrics import Progress
+from stratustryke.core.checkpoint import Checkpoint
+from stratustryke.core.records import Record
 from stratustryke.lib import StratustrykeException
+from stratustryke.lib.dedupe import UniqueFilter
 
 
 class StratustrykeModule(object):
 
     OPT_VERBOSE = 'VERBOSE'
+    OPT_CONNECT_TIMEOUT = 'CONNECT_TIMEOUT'
+    OPT_READ_TIMEOUT = 'READ_TIMEOUT'
+    OPT_RETRY_MODE = 'RETRY_MODE'
+    OPT_MAX_ATTEMPTS = 'MAX_ATTEMPTS'
+    OPT_AWS_MAX_POOL_CONNECTIONS = 'AWS_MAX_POOL_CONNECTIONS'
+    OPT_TCP_KEEPALIVE = 'TCP_KEEPALIVE'
+
+    # Options tuning how a run works (verbosity, concurrency, pacing) rather than what it covers; changing them (e.g., lowering
+    # THREADS after being throttled) still resumes the same checkpoint
+    CHECKPOINT_EXCLUDED_OPTIONS = ('VERBOSE', 'THREADS')
+    CHECKPOINT_ADVANCED_OPTIONS = () # advanced options that change the work a run covers; part of the checkpoint scope
 
     def __init__(self, framework) -> None:
         self.framework = framework
@@ -30,6 +45,16 @@ class StratustrykeModule(object):
         self._options.add_boolean(StratustrykeModule.OPT_VERBOSE, 'When enabled, increases verbosity of module output', False, False)
 
         self._advanced = Options()
+        self.record_tags = {} # fields added to every record the module emits (e.g., the credential alias of a fan-out run)
+        self._checkpoint = None # Checkpoint of the current run; see checkpoint()
+        self._checkpoint_resume = False # set by StratustrykeFramework.checkpoint_run() for 'run --resume'
+        # Unset values defer to the framework config of the same name
+        self._advanced.add_float(StratustrykeModule.OPT_CONNECT_TIMEOUT, 'Override the CONNECT_TIMEOUT framework config for this module', False, None)
+        self._advanced.add_float(StratustrykeModule.OPT_READ_TIMEOUT, 'Override the READ_TIMEOUT framework config for this module', False, None)
+        self._advanced.add_string(StratustrykeModule.OPT_RETRY_MODE, 'Override the RETRY_MODE framework config for this module', False, None, '^(legacy|standard|adaptive)$')
+        self._advanced.add_integer(StratustrykeModule.OPT_MAX_ATTEMPTS, 'Override the MAX_ATTEMPTS framework config for this module', False, None)
+        self._advanced.add_integer(StratustrykeModule.OPT_AWS_MAX_POOL_CONNECTIONS, 'Override the AWS_MAX_POOL_CONNECTIONS framework config for this module\'s boto3 clients', False, None)
+        self._advanced.add_boolean(StratustrykeModule.OPT_TCP_KEEPALIVE, 'Override the TCP_KEEPALIVE framework config for this module\'s boto3 clients', False, None)
 
         urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -96,71 +121,163 @@ class StratustrykeModule(object):
             return base_opt_valid, msg
 
 
-    def load_strings(self, file: str, is_paste: bool = False) -> list:
+    def iter_strings(self, file: str, is_paste: bool = False):
         '''
-        Parse file lines from either a file (default) or pasted option value (when is_pasted = True).\n
+        Lazily yield lines from either a file (default) or pasted option value (when is_paste = True) without reading the
+        whole input into memory. Errors reading the file are printed and end the iteration.\n
         :param file: Path to the file OR raw pasted option value when is_paste = True
         :param is_paste: boolean flag indicating whether we're reading from file or parsing a string with line seperators
-        :return: list[str] | None'''
+        :return: Iterator[str]'''
+        if is_paste:
+            # Pasted option values have \\n between each pasted line
+            start = 0
+            while True:
+                end = file.find('\\n', start)
+                if end < 0:
+                    yield file[start:]
+                    return
+                yield file[start:end]
+                start = end + 2
+
         try:
-            if not is_paste:
-                file = Path(file)
-                with open(file, 'r') as handle:
-                    return [line.strip(f'{linesep}') for line in handle.readlines()]
+            with open(Path(file), 'r') as handle:
+                for line in handle:
+                    yield line.rstrip('\r\n')
 
-            # Otherwise we're parsing a pasted option value which has \\n between each pasted line
-            else: return file.split('\\n')
-        
         except Exception as err:
+            self.print_error(f'Error reading contents of file: {file}')
+            if self.verbose: self.print_error(str(err))
+
+
+    def load_strings(self, file: str, is_paste: bool = False) -> list:
+        '''
+        Parse file lines from either a file (default) or pasted option value (when is_pasted = True).\n
+        :param file: Path to the file OR raw pasted option value when is_paste = True
+        :param is_paste: boolean flag indicating whether we're reading from file or parsing a string with line seperators
+        :return: list[str] | None'''
+        if not (is_paste or Path(file).is_file()):
             self.print_error(f'Error reading contents of file: {file}')
             return None
+        return list(self.iter_strings(file, is_paste))
 
 
-    def get_opt_multiline(self, opt_name: str, **kwargs) -> list:
+    def iter_opt_lines(self, opt_name: str, **kwargs):
         '''
-        Returns list[str] containing lines from an option file/paste or an individual value\n
-        :param opt_name: (str) Option name to retrieve list value for
+        Lazily yield lines from an option file/paste or an individual value, streaming files line by line so very large
+        wordlists aren't held in memory\n
+        :param opt_name: (str) Option name to retrieve lines for
         :param delimiter: (str) Character to seperate value on if 'set' command was used
-        :param unique: (bool) Flag which removes duplicate entries from the list (default: False)
-        :return: list[str] parsed option string values
+        :param unique: (bool) Flag which drops duplicate and blank entries, keeping the first occurrence order (default: False)
+        :param dedupe: (UniqueFilter) Filter to dedupe with when unique is set; inspect it afterwards for unique / duplicate counts
+        :return: Iterator[str] option string values (nothing if the option is unset)
         '''
         delim = kwargs.get('delimiter', None)
         unique = kwargs.get('unique', False)
         value = self.get_opt(opt_name)
 
         if value == None or value == '':
-            return None
-        
-        is_pasted = self._options.get_opt(opt_name)._pasted
+            return
+
+        option = self._options.get_opt(opt_name) if (opt_name in self._options.keys()) else self._advanced.get_opt(opt_name)
+        is_pasted = option._pasted
         if is_pasted:
-            parsed = self.load_strings(value, is_paste=True)
+            lines = self.iter_strings(value, is_paste=True)
         elif Path.exists(Path(value)):
-            parsed = self.load_strings(value, is_paste=False)
+            lines = self.iter_strings(value, is_paste=False)
+        elif delim != None:
+            lines = iter(value.split(delim))
         else:
-            if delim != None:
-                parsed = value.split(delim)
-            else: parsed = [value]
+            lines = iter([value])
 
         if unique:
-            if len(parsed) > 1:
-                # Example duplicate removal if order should be preserved
-                parsed = sorted(set(parsed), key=lambda idx: parsed.index(idx))
-                # lines = list(set(lines)) # Otherwise, more simply if order does not matter
-                parsed.remove('') # remove blank lines if necessary
+            dedupe = kwargs.get('dedupe', None) or UniqueFilter()
+            lines = dedupe.filter(line for line in lines if line != '')
+
+        yield from lines
+
+
+    def count_opt_lines(self, opt_name: str, **kwargs) -> int:
+        '''
+        Count the lines iter_opt_lines() yields for an option without building a list of them\n
+        :param opt_name: (str) Option name to count lines for
+        :return: int number of (unique, if unique=True) lines
+        '''
+        return sum(1 for _ in self.iter_opt_lines(opt_name, **kwargs))
+
+
+    def get_opt_multiline(self, opt_name: str, **kwargs) -> list:
+        '''
+        Returns list[str] containing lines from an option file/paste or an individual value (see iter_opt_lines() to stream
+        large inputs instead)\n
+        :param opt_name: (str) Option name to retrieve list value for
+        :param delimiter: (str) Character to seperate value on if 'set' command was used
+        :param unique: (bool) Flag which removes duplicate and blank entries from the list (default: False)
+        :return: list[str] parsed option string values
+        '''
+        value = self.get_opt(opt_name)
+        if value == None or value == '':
+            return None
 
-        return parsed
+        return list(self.iter_opt_lines(opt_name, **kwargs))
 
 
     def http_request(self, method: str, url: str, **kwargs) -> Response:
         '''
-        Wraps requests.request() while enforcing framework proxy / TLS verification configs\n
+        Performs an HTTP request via the framework's pooled transport while enforcing framework proxy / TLS verification configs\n
         :param method: (str) request method (e.g., GET, POST, PUT, etc)
         :param url: (str) URL for the request
         :param data: (str) non-json request body data
         :param json: (str) JSON request body data
         :param auth: (any) authentication. Support Sigv4
         '''
-        return self.framework.http_request(**kwargs)
+        kwargs.setdefault('module_name', self.search_name)
+        for key, val in self.http_overrides().items(): kwargs.setdefault(key, val)
+        return self.framework.http_request(method, url, **kwargs)
+
+
+    def network_overrides(self) -> dict:
+        '''
+        Network overrides from the module's advanced options as {connect_timeout, read_timeout, retry_mode, max_attempts,
+        max_pool_connections, tcp_keepalive} (client_options() keyword args); unset options are omitted. If either retry option
+        is set, both retry keys are present (the other from framework configs)
+        '''
+        overrides = {}
+        names = {'connect_timeout': StratustrykeModule.OPT_CONNECT_TIMEOUT, 'read_timeout': StratustrykeModule.OPT_READ_TIMEOUT,
+                 'retry_mode': StratustrykeModule.OPT_RETRY_MODE, 'max_attempts': StratustrykeModule.OPT_MAX_ATTEMPTS,
+                 'max_pool_connections': StratustrykeModule.OPT_AWS_MAX_POOL_CONNECTIONS, 'tcp_keepalive': StratustrykeModule.OPT_TCP_KEEPALIVE}
+        for key, name in names.items():
+            val = self._advanced.get_val(name)
+            if val != None: overrides[key] = val
+
+        if ('retry_mode' in overrides) or ('max_attempts' in overrides):
+            overrides.setdefault('retry_mode', self.framework._config.get_val(self.framework.CONF_RETRY_MODE))
+            overrides.setdefault('max_attempts', self.framework._config.get_val(self.framework.CONF_MAX_ATTEMPTS))
+        return overrides
+
+
+    def http_overrides(self) -> dict:
+        '''http_request() keyword args (timeout / retry_policy) applying the module's timeout / retry overrides. The pool size /
+        keepalive overrides only apply to boto3 clients; HTTP requests share the framework's connection pools'''
+        overrides = self.network_overrides()
+        kwargs = {}
+        if ('connect_timeout' in overrides) or ('read_timeout' in overrides):
+            connect, read = self.framework.http_timeout
+            kwargs['timeout'] = (overrides.get('connect_timeout', connect), overrides.get('read_timeout', read))
+        if 'retry_mode' in overrides:
+            kwargs['retry_policy'] = (overrides['retry_mode'], overrides['max_attempts'])
+        return kwargs
+
+
+    def http_request_many(self, requests_iterable, concurrency: int = None, per_host: int = None, timeout: float = None):
+        '''
+        Performs a batch of HTTP requests concurrently via the framework, yielding (request, response) tuples as they complete\n
+        :param requests_iterable: iterable of (method, url), (method, url, kwargs) tuples or dicts with 'method', 'url', and any http_request() kwargs
+        :param concurrency: (int) max requests in flight
+        :param per_host: (int) max requests in flight to a single host
+        :param timeout: (float) per-request timeout in seconds
+        '''
+        return self.framework.http_request_many(requests_iterable, concurrency, per_host, timeout, module_name=self.search_name,
+                                                request_defaults=self.http_overrides())
 
 
     def http_record(self, response: Response, outfile: str = None) -> list:
@@ -219,6 +336,17 @@ class StratustrykeModule(object):
         return output
 
 
+    def clone(self) -> 'StratustrykeModule':
+        '''Return a new, independent instance of the module with the same option and advanced option values'''
+        clone = type(self)(self.framework)
+        for source, target in ((self._options, clone._options), (self._advanced, clone._advanced)):
+            for opt in source.get_all():
+                copy = target.get_opt(opt._name)
+                if copy != None:
+                    copy._value, copy._pasted = opt._value, opt._pasted
+        return clone
+
+
     def get_opt(self, name: str) -> typing.Any:
         '''Return the current value for the option; Pass to Options.get_val() NOTE: returns value, not the option object'''
         if name in self._options.keys():
@@ -233,7 +361,7 @@ class StratustrykeModule(object):
         if name in self._options.keys():
             self._options.set_opt(name, val)
         elif name in self._advanced.keys():
-            self._options.set_opt(name, val)
+            self._advanced.set_opt(name, val)
         else: return None # Not a valid option
 
 
@@ -242,7 +370,7 @@ class StratustrykeModule(object):
         if name in self._options.keys():
             self._options.unset_opt(name)
         elif name in self._advanced.keys():
-            self._options.unset_opt(name)
+            self._advanced.unset_opt(name)
         else: return None # Not a valid option
 
 
@@ -251,12 +379,63 @@ class StratustrykeModule(object):
         if name in self._options.keys():
             self._options.reset_opt(name)
         elif name in self._advanced.keys():
-            self._options.reset_opt(name)
+            self._advanced.reset_opt(name)
         else: return None # Not a valid option
 
 
     ##### Framework output helpers #####
 
+    def emit(self, record_type: str, message: str = None, level: str = 'success', console: bool = True, **fields):
+        '''
+        Emit a structured result record. The record is rendered to the console (message, or its fields if no message is given)
+        and streamed to any record writers enabled for the run (RECORD_OUTPUT config)\n
+        :param record_type: (str) kind of result, e.g. 'bucket', 'arn'; persisted writers group records by type
+        :param message: (str) console text for the record
+        :param level: (str) console print level: success, status, warning, failure, error, or line
+        :param console: (bool) set False to persist the record without printing it
+        :param fields: record field values; names may not collide with the record metadata (record_type, module, run_id, timestamp)
+        '''
+        reserved = Record.reserved_fields(fields)
+        if len(reserved) > 0: raise StratustrykeException(f'Record field name(s) reserved for record metadata: {", ".join(reserved)}')
+
+        if len(self.record_tags) > 0: fields = {**self.record_tags, **fields}
+        if self._checkpoint != None: self._checkpoint.add_finding(record_type, message, level, fields)
+        return self.framework.emit_record(self, record_type, fields, message, level, console)
+
+
+    def checkpoint(self) -> Checkpoint:
+        '''
+        Checkpoint for the current run, so an interrupted run can skip completed work with 'run --resume'. Filter the run's
+        work units (e.g., wordlist entries) through pending() and call complete() once each unit is finished; results passed
+        to emit() are stored and replayed on resume. Call from run() before starting any worker threads.
+        '''
+        if self._checkpoint == None:
+            self._checkpoint = self.framework.open_checkpoint(self)
+        return self._checkpoint
+
+
+    def checkpoint_scope(self) -> dict:
+        '''Values identifying the work a run covers; runs share a checkpoint only when their module and scope match. Defaults
+        to every option value except CHECKPOINT_EXCLUDED_OPTIONS, the advanced options listed in CHECKPOINT_ADVANCED_OPTIONS,
+        and the record tags, which keep 'run --all-creds' clones apart (values are hashed, never stored)'''
+        excluded = self.CHECKPOINT_EXCLUDED_OPTIONS
+        scope = {opt._name: opt.str_val() for opt in self._options.get_all() if opt._name not in excluded}
+        scope.update({opt._name: opt.str_val() for opt in self._advanced.get_all() if opt._name in self.CHECKPOINT_ADVANCED_OPTIONS})
+        scope.update({f'tag:{name}': val for name, val in self.record_tags.items()})
+        return scope
+
+
+    def progress(self, total: int, label: str = 'requests', steps: int = 10) -> Progress:
+        '''
+        Progress tracker for a long-running loop; call advance() per completed item and finish() at the end. Prints
+        '[done / total] label completed' with throughput and ETA every 1/steps of the total (or PROGRESS_INTERVAL seconds)\n
+        :param total: (int) number of items the loop will process (None if unknown)
+        :param label: (str) what is being counted
+        :param steps: (int) number of evenly spaced reports over the whole loop
+        '''
+        return Progress(total, self.print_status, label, steps)
+
+
     def print_error(self, msg: str) -> None:
         '''Prints (magenta) error message: [x] {msg}'''
         return self.framework.print_error(msg)
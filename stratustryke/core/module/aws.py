@@ -1,9 +1,14 @@
 # Author: @vexance
 # Purpose: Modules to interact with AWS cloud resources / services
 
+import hashlib
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
 from stratustryke.core.module import StratustrykeModule
 from stratustryke.settings import AWS_DEFAULT_REGION, AWS_DEFAULT_ENABLED_REGIONS, AWS_SINGULAR_DEFAULT_REGION
-from stratustryke.core.credential.aws import AWSCredential
+from stratustryke.core.credential.aws import AWSCredential, client_options
 from stratustryke.lib.regex import AWS_ACCESS_KEY_REGEX, AWS_SECRET_KEY_REGEX, AWS_SESSION_TOKEN_REGEX
 
 
@@ -15,13 +20,15 @@ class AWSModule(StratustrykeModule):
     OPT_SESSION_TOKEN = 'AUTH_SESSION_TOKEN'
     OPT_AWS_REGION = 'AWS_REGION'
 
+    CACHE_API_RESPONSES = True # Serve read-only calls from the AWS_CACHE response cache; disable for modules probing permissions
+
     def __init__(self, framework) -> None:
         super().__init__(framework)
         self._options.add_string(AWSModule.OPT_ACCESS_KEY, 'AWS access key id for authentication', True, regex=AWS_ACCESS_KEY_REGEX)
         self._options.add_string(AWSModule.OPT_SECRET_KEY, 'AWS secret key to use for authentication', True, regex=AWS_SECRET_KEY_REGEX, sensitive=True)
         self._options.add_string(AWSModule.OPT_SESSION_TOKEN, 'AWS session token for temporary credential authentication', regex=AWS_SESSION_TOKEN_REGEX, sensitive=True)
         self._options.add_string(AWSModule.OPT_AWS_REGION, 'AWS region(s) to specify within calls', False, AWS_DEFAULT_REGION)
-        self._cred = None
+        self._creds = {} # memoized AWSCredential objects; see get_cred()
 
 
     @property
@@ -45,15 +52,85 @@ class AWSModule(StratustrykeModule):
         return (True, None)
 
 
-    def get_cred(self, region: str = None):
+    def get_cred(self, region: str = None) -> AWSCredential:
+        '''Return the AWSCredential for the module's auth options. Credentials are memoized per option set / region so
+        that repeated calls share one object (and its cached caller identity) rather than rebuilding it. Sessions / clients from
+        the credential apply the module's timeout / retry advanced options over the framework configs'''
         access_key = self.get_opt(AWSModule.OPT_ACCESS_KEY)
         secret = self.get_opt(AWSModule.OPT_SECRET_KEY)
         token = self.get_opt(AWSModule.OPT_SESSION_TOKEN)
         cred_region = region if (region != None) else self.get_opt(AWSModule.OPT_AWS_REGION)
 
-        return AWSCredential(self.name, access_key=access_key, secret_key=secret, session_token=token, default_region=cred_region)
+        key_hash = lambda val: hashlib.sha256(str(val).encode()).hexdigest()
+        keys = (access_key, key_hash(secret), key_hash(token))
+
+        self.framework.rate_limiter # apply the current RATE_LIMIT configs before clients are used
+        self.framework.aws_client_options # likewise the timeout / retry configs
+        cred = self._creds.get((keys, cred_region), None)
+        if cred == None:
+            if any(cached_keys != keys for cached_keys, _ in list(self._creds)):
+                self._creds = {} # auth options changed; drop creds for the previous keys
+            cred = AWSCredential(self.name, access_key=access_key, secret_key=secret, session_token=token, default_region=cred_region)
+            cred = self._creds.setdefault((keys, cred_region), cred)
+
+        cred.client_options = client_options(**self.network_overrides()) or None
+        return cred
         
 
+    def checkpoint_scope(self) -> dict:
+        '''Excludes the AUTH_* options; temporary credentials rotate during long runs without changing the work covered'''
+        auth = (AWSModule.OPT_ACCESS_KEY, AWSModule.OPT_SECRET_KEY, AWSModule.OPT_SESSION_TOKEN)
+        return {name: val for name, val in super().checkpoint_scope().items() if name not in auth}
+
+
+    def inventory_scope(self, account: str = None) -> tuple:
+        '''Return (workspace, account) inventory entries are stored under; account defaults to the credential's account id'''
+        workspace = self.framework._config.get_val(self.framework.CONF_WORKSPACE)
+        if account == None: account = self.get_cred().account_id
+        return (workspace, account)
+
+
+    def record_inventory(self, resource_type: str, region: str, rows: list, complete: bool = True, account: str = None) -> None:
+        '''
+        Store resources enumerated in a region in the workspace inventory (when the INVENTORY config is enabled). Failures
+        are logged and never interrupt the module.\n
+        :param resource_type: str inventory resource type (see inventory.RESOURCE_TYPES)
+        :param rows: list[dict] normalized resources (see inventory.normalize_*())
+        :param complete: (bool) rows are every resource of the type in the region; replaces the region's stored resources
+        :param account: str account id the resources belong to [default: the credential's account id]
+        '''
+        if not self.framework._config.get_val(self.framework.CONF_INVENTORY): return None
+        try:
+            workspace, account = self.inventory_scope(account)
+            if complete: self.framework.inventory.replace(workspace, account, region, resource_type, rows)
+            else: self.framework.inventory.upsert(workspace, account, region, resource_type, rows)
+        except Exception as err:
+            self.log_error(f'Unable to record {resource_type} inventory for {region}: {err}')
+        return None
+
+
+    def query_inventory(self, resource_type: str, region: str, account: str = None, **filters) -> list | None:
+        '''
+        Look up resources in the workspace inventory instead of listing them again. Only answers when the resource type was
+        completely listed in the region within the INVENTORY_MAX_AGE config (disabled when 0).\n
+        :param filters: column / index values resources must match (see InventoryStore.query())
+        :return: list[dict] matching resources, or None if the region must be listed
+        '''
+        max_age = self.framework._config.get_val(self.framework.CONF_INVENTORY_MAX_AGE)
+        if not self.framework._config.get_val(self.framework.CONF_INVENTORY) or not max_age: return None
+        try:
+            workspace, account = self.inventory_scope(account)
+            refreshed = self.framework.inventory.refreshed(workspace, account, region, resource_type)
+            if refreshed == None or (time.time() - refreshed) > max_age: return None
+            rows = self.framework.inventory.query(workspace, resource_type, account, region, **filters)
+        except Exception as err:
+            self.log_error(f'Unable to query {resource_type} inventory for {region}: {err}')
+            return None
+
+        if self.verbose: self.print_status(f'Using {resource_type} inventory of {region} from {int(time.time() - refreshed)} seconds ago')
+        return rows
+
+
     def get_regions(self, multi_support: bool = True) -> list[str]:
         '''Return the list of regions to run the module in'''
         regions = self.get_opt_multiline(AWSModule.OPT_AWS_REGION)
@@ -65,3 +142,46 @@ class AWSModule(StratustrykeModule):
         # Do we need to do input validation? For now leaving as-is
         return regions
 
+
+    def map_regions(self, fn, regions: list = None, max_workers: int = None) -> dict:
+        '''
+        Run fn(region) for each region concurrently and return {region: result} in the order regions were given.\n
+        Output printed by each region is buffered and written as one block per region (also in region order) so that
+        lines from different regions don't interleave. Exceptions raised by fn are reported and yield a None result.\n
+        :param fn: callable(region: str) performing the per-region work
+        :param regions: list[str] regions to run in [default: get_regions()]
+        :param max_workers: max regions processed concurrently [default: MAX_REGION_WORKERS framework config]
+        :return: dict[str, Any] mapping each region to fn's return value
+        '''
+        regions = regions if (regions != None) else self.get_regions()
+        if max_workers == None: max_workers = self.framework._config.get_val(self.framework.CONF_MAX_REGION_WORKERS)
+        workers = max(1, min(max_workers, len(regions)))
+
+        def run_region(region: str):
+            try:
+                return fn(region)
+            except Exception as err:
+                self.print_error(f'Exception thrown processing region {region}: {err}')
+                self.log_error(f'Exception thrown processing region {region}: {err}')
+                return None
+
+        results = {}
+        if workers == 1: # nothing to interleave with; stream output as it happens
+            for region in regions: results[region] = run_region(region)
+            return results
+
+        def run_buffered(region: str):
+            with self.framework.buffer_output() as lines:
+                return run_region(region), lines
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f'stratustryke-{self.name}')
+        try:
+            futures = [(region, executor.submit(run_buffered, region)) for region in regions]
+            for region, future in futures:
+                result, lines = future.result()
+                self.framework.flush_output(lines)
+                results[region] = result
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+        return results
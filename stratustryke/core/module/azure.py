@@ -58,6 +58,7 @@ class AzureModule(MicrosoftModule):
 
         try:
             res = self.http_request('GET', endpoint, headers=request_headers)
+            if res == None: return 'HTTP request failed', -1
 
             try:
                 res_body = res.json()
@@ -111,6 +112,7 @@ class AzureModule(MicrosoftModule):
 
         try:
             res = self.http_request(method, endpoint, headers=request_headers, data = req_data, json = req_json)
+            if res == None: return 'HTTP request failed', -1
 
             try:
                 res_body = res.json()
@@ -2,7 +2,6 @@
 # Purpose: Microsoft365 Modules to interact with M365 or Entra
 
 import time
-import jwt
 
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
@@ -58,7 +57,10 @@ class MicrosoftModule(StratustrykeModule):
         if Path(secret).exists() and Path(secret).is_file():
             with open(secret, 'r') as file: secret = file.read()
 
-        return MicrosoftCredential(self.name, principal=principal, secret=secret, tenant=tenant, refresh_token=refresh_token)
+        cred = MicrosoftCredential(self.name, principal=principal, secret=secret, tenant=tenant, refresh_token=refresh_token)
+        if self.framework._config.get_val(self.framework.CONF_MSFT_PERSIST_TOKENS):
+            cred.token_store = self.framework.credentials
+        return cred
 
     ##### AuthN helpers for interactive / device code auth #####
     def get_openid_config(self, tenant: str = 'organizations') -> dict | None:
@@ -171,6 +173,8 @@ class MicrosoftModule(StratustrykeModule):
     ##### AuthN helpers for service princiapl auth #####
     def build_client_assertion(self, tenant: str, client_id: str, key_pem: str) -> str:
         '''Build a JWT client asseertation for service-principal certificate based auth'''
+        import jwt # deferred; pulls in cryptography
+
         # If called, this means that princpal, secret, and tenant are already ingested
         token_endpoint = f'https://{MSFT_LOGIN_ENDPOINT}/{tenant}/oauth2/v2.0/token'
         now = datetime.now(timezone.utc)
@@ -53,13 +53,13 @@ class Option:
         Six - Eight character strings show the first two and last two characters.
         Nine - Nineteen character strings show the first and last three characters.
         20+ character strings show the first and last four characters'''
+        if self._value == None:
+            return ''
+
         if self._opt_type == 'bool':
             return 'True' if (self._value) else 'False'
         if not self._opt_type == 'str':
             return str(self._value) # cast ints and floats to string
-        
-        if self._value == None:
-            return ''
             
         length = len(self._value)
         if length < 3 or self._value == None: # 0-2 character strings; no point masking really
@@ -183,8 +183,11 @@ class Options:
             return False # option not found
         
         if value == '': value = None # e.g., set OPTION_NAME '' or set OPTION_NAME ""
-        
-        if option._opt_type == 'str': # String or readable file
+
+        if value == None and option._opt_type != 'str': # same as unset for bool / int / float options
+            option.unset()
+
+        elif option._opt_type == 'str': # String or readable file
             option._pasted = pasted
             option._value = value
 
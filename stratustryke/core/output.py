@@ -0,0 +1,139 @@
+# Author: @vexance
+# Purpose: Framework output sink - serializes console / spool file output through a single background writer
+#
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from pathlib import Path
+
+from stratustryke.settings import OUTPUT_FLUSH_INTERVAL, OUTPUT_FLUSH_BYTES, OUTPUT_QUEUE_SIZE
+
+
+class OutputSink(object):
+    '''
+    Single writer for framework output. Callers enqueue whole messages which a background thread writes to the console
+    stream and (when spooling) a persistent spool file handle. Each message is written in one piece so lines from
+    concurrent workers never interleave.\n
+    Writes are flushed as soon as the queue goes idle (so interactive output is not delayed), otherwise at most every
+    OUTPUT_FLUSH_INTERVAL seconds or OUTPUT_FLUSH_BYTES bytes while output is streaming in.
+    '''
+
+    _STOP = object()
+
+    def __init__(self, stream, flush_interval: float = OUTPUT_FLUSH_INTERVAL, flush_bytes: int = OUTPUT_FLUSH_BYTES) -> None:
+        self._logger = logging.getLogger('stratustryke.output')
+        self._stream = stream
+        self._flush_interval = flush_interval
+        self._flush_bytes = flush_bytes
+        self._queue = queue.Queue(maxsize=OUTPUT_QUEUE_SIZE) # bounded; producers block rather than buffering unbounded output
+        self._io_lock = threading.Lock() # held by the writer while writing a batch; also guards spool open / close
+        self._spool_path = None
+        self._spool_handle = None
+        self._closed = False
+
+        self._writer = threading.Thread(target=self._write_loop, name='stratustryke-output', daemon=True)
+        self._writer.start()
+        atexit.register(self.close) # the writer is a daemon thread; make sure queued output is written at interpreter exit
+
+
+    @property
+    def spool_path(self) -> Path:
+        return self._spool_path
+
+
+    def write(self, text: str, console: bool = True) -> None:
+        '''Queue text to be written to the console (unless console is False) and the spool file if spooling'''
+        if self._closed or not self._writer.is_alive():
+            return self._write_batch([(text, console)], flush=True)
+        self._queue.put((text, console))
+
+
+    def flush(self) -> None:
+        '''Block until all queued output has been written and flushed'''
+        if self._writer.is_alive() and threading.current_thread() is not self._writer:
+            self._queue.join()
+
+
+    def start_spool(self, path: Path, mode: str = 'a') -> None:
+        '''Open (or switch) the spool file; output already queued goes to the previous spool target'''
+        self.flush()
+        handle = open(path, mode) # raise to the caller if the file can't be opened
+        with self._io_lock:
+            if self._spool_handle != None: self._spool_handle.close()
+            self._spool_path, self._spool_handle = Path(path), handle
+
+
+    def stop_spool(self) -> None:
+        '''Flush pending output and close the spool file'''
+        self.flush()
+        with self._io_lock:
+            if self._spool_handle != None: self._spool_handle.close()
+            self._spool_path, self._spool_handle = None, None
+
+
+    def close(self) -> None:
+        '''Flush pending output, stop the writer thread, and close the spool file'''
+        if self._closed: return
+        self.flush()
+        self._closed = True
+        if self._writer.is_alive():
+            self._queue.put((OutputSink._STOP, False))
+            self._writer.join(timeout=5)
+        self.stop_spool()
+
+
+    def _write_batch(self, batch: list, flush: bool) -> None:
+        with self._io_lock:
+            console = ''.join(text for text, to_console in batch if to_console)
+            try:
+                if console:
+                    self._stream.write(console)
+                    if flush: self._stream.flush()
+            except Exception as err:
+                self._logger.error(f'Error writing to output stream: {err}')
+
+            if self._spool_handle != None:
+                try:
+                    self._spool_handle.write(''.join(text for text, _ in batch))
+                    if flush: self._spool_handle.flush()
+                except Exception as err:
+                    self._logger.error(f'Error writing to spool file {self._spool_path}; disabling spooling: {err}')
+                    self._spool_handle, self._spool_path = None, None
+
+
+    def _write_loop(self) -> None:
+        last_flush = time.monotonic()
+        pending_bytes = 0
+
+        while True:
+            batch = [self._queue.get()]
+            size = len(batch[0][0]) if batch[0][0] is not OutputSink._STOP else 0
+
+            # Drain whatever else is already queued (up to the size threshold) into one write
+            while size < self._flush_bytes:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                batch.append(item)
+                if item[0] is not OutputSink._STOP: size += len(item[0])
+
+            stop = any(text is OutputSink._STOP for text, _ in batch)
+            batch = [item for item in batch if item[0] is not OutputSink._STOP]
+
+            pending_bytes += size
+            now = time.monotonic()
+            idle = self._queue.empty()
+            flush = idle or stop or (pending_bytes >= self._flush_bytes) or (now - last_flush >= self._flush_interval)
+
+            self._write_batch(batch, flush)
+            if flush: last_flush, pending_bytes = now, 0
+
+            for _ in range(len(batch) + (1 if stop else 0)):
+                self._queue.task_done()
+
+            if stop: return
@@ -0,0 +1,258 @@
+# Author: @vexance
+# Purpose: CPU (cProfile) and memory (tracemalloc) profiling of module runs for the 'profile run' command
+#
+
+import cProfile
+import ctypes
+import io
+import logging
+import os
+import pstats
+import sys
+import sysconfig
+import threading
+import time
+import tracemalloc
+
+from datetime import datetime
+from pathlib import Path
+
+from stratustryke.lib import profile_dir
+from stratustryke.settings import PROFILE_TOP, PROFILE_TRACEMALLOC_FRAMES
+
+
+def format_bytes(size: int) -> str:
+    '''Format a byte count as a human readable string, e.g., 1.5 MiB'''
+    value = float(size)
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(value) < 1024 or unit == 'GiB':
+            return f'{value:.0f} {unit}' if (unit == 'B') else f'{value:.1f} {unit}'
+        value /= 1024
+
+
+def short_path(filename: str) -> str:
+    '''Shorten a source path to its package-relative form (e.g., botocore/endpoint.py, stratustryke/core/framework.py)'''
+    stdlib = sysconfig.get_paths()['stdlib']
+    if filename.startswith(stdlib + os.sep) and 'site-packages' not in filename:
+        return os.path.relpath(filename, stdlib)
+    parts = Path(filename).parts
+    for anchor in ('site-packages', 'stratustryke'):
+        if anchor in parts:
+            idx = len(parts) - 1 - parts[::-1].index(anchor)
+            return os.path.join(*parts[idx + (1 if (anchor == 'site-packages') else 0):])
+    return filename
+
+
+def format_function(key: tuple) -> str:
+    '''Format a pstats (filename, line, function) key as function (file:line)'''
+    filename, line, func = key
+    if filename == '~': return func # built-in, e.g., <method 'read' of '_ssl._SSLSocket' objects>
+    return f'{func} ({short_path(filename)}:{line})'
+
+
+# From Python 3.12 cProfile is built on sys.monitoring: a single profiler records calls in every thread, and enabling a
+# second one while it is active raises ValueError. Earlier versions profile per thread.
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+
+def clear_thread_profilers() -> bool:
+    '''
+    Remove the profile function of every thread. A cProfile profiler can only be disabled from the thread it runs in, so
+    per-thread profilers of threads still running (e.g., idle pool workers, daemon threads) would otherwise keep collecting
+    after the run. Python 3.12+ provides threading.setprofile_all_threads(); on earlier CPython versions each thread state is
+    cleared through the C API (ctypes), which other interpreters don't expose.
+    :return: (bool) False if profile functions couldn't be cleared on this interpreter
+    '''
+    if sys.version_info >= (3, 12):
+        threading.setprofile_all_threads(None)
+        return True
+
+    if sys.implementation.name != 'cpython': return False
+    try:
+        api = ctypes.pythonapi
+        api.PyInterpreterState_Get.restype = ctypes.c_void_p
+        api.PyInterpreterState_ThreadHead.argtypes, api.PyInterpreterState_ThreadHead.restype = [ctypes.c_void_p], ctypes.c_void_p
+        api.PyThreadState_Next.argtypes, api.PyThreadState_Next.restype = [ctypes.c_void_p], ctypes.c_void_p
+        api._PyEval_SetProfile.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_void_p]
+    except AttributeError:
+        return False
+
+    tstate = api.PyInterpreterState_ThreadHead(api.PyInterpreterState_Get())
+    while tstate: # the GIL is held for the whole loop, so no thread state is created / destroyed meanwhile
+        api._PyEval_SetProfile(tstate, None, None)
+        tstate = api.PyThreadState_Next(tstate)
+    return True
+
+
+# Allocations made by the profilers themselves are excluded from memory reports
+PROFILER_TRACE_FILTERS = (
+    tracemalloc.Filter(False, cProfile.__file__),
+    tracemalloc.Filter(False, pstats.__file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__)
+)
+
+
+class ModuleProfiler(object):
+    '''
+    Context manager profiling everything that runs while it is active. CPU time is collected with cProfile in the calling
+    thread and in every thread started during the run (e.g., module / region / fan-out worker pools): by one profiler from
+    Python 3.12, otherwise by a profiler per thread that is merged (and every one disabled) when the run ends. Memory is
+    traced with tracemalloc; the allocation sites at the highest traced memory observed (sampled every memory_interval
+    seconds) are reported alongside those still allocated when the run ends.
+    '''
+
+    def __init__(self, module_name: str, top: int = PROFILE_TOP, frames: int = PROFILE_TRACEMALLOC_FRAMES, cpu: bool = True,
+                 memory: bool = True, memory_interval: float = 1.0) -> None:
+        self.module_name = module_name
+        self.top = top
+        self.frames = frames
+        self.cpu = cpu
+        self.memory = memory
+        self.memory_interval = memory_interval
+        self.stats = None # pstats.Stats once the run ends (cpu profiling only)
+        self.peak = 0 # peak traced memory in bytes (memory profiling only)
+        self.wall = 0.0
+        self.cpu_time = 0.0
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._baseline = None
+        self._peak_snapshot = None
+        self._peak_sampled = 0
+        self._final_snapshot = None
+        self._stop = threading.Event()
+        self._sampler = None
+        self._started_tracing = False
+
+
+    def _thread_hook(self, frame, event, arg) -> None:
+        '''Installed with threading.setprofile(); swaps itself for a per-thread cProfile profiler on the thread's first call'''
+        prof = cProfile.Profile()
+        with self._lock:
+            self._profiles.append(prof)
+        prof.enable()
+
+
+    def _sample_memory(self) -> None:
+        while not self._stop.wait(self.memory_interval):
+            current, peak = tracemalloc.get_traced_memory()
+            if current > self._peak_sampled:
+                self._peak_sampled = current
+                self._peak_snapshot = tracemalloc.take_snapshot().filter_traces(PROFILER_TRACE_FILTERS)
+
+
+    def __enter__(self):
+        if self.memory:
+            self._started_tracing = not tracemalloc.is_tracing()
+            if self._started_tracing: tracemalloc.start(self.frames)
+            tracemalloc.reset_peak()
+            self._baseline = tracemalloc.take_snapshot().filter_traces(PROFILER_TRACE_FILTERS)
+            self._peak_sampled = tracemalloc.get_traced_memory()[0]
+            self._sampler = threading.Thread(target=self._sample_memory, name='stratustryke-profile-memory', daemon=True)
+            self._sampler.start()
+
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+        if self.cpu:
+            if not PROFILES_ALL_THREADS: threading.setprofile(self._thread_hook)
+            main = cProfile.Profile()
+            self._profiles.append(main)
+            main.enable()
+        return self
+
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if self.cpu:
+            self._profiles[0].disable()
+            if not PROFILES_ALL_THREADS: threading.setprofile(None)
+            if not clear_thread_profilers():
+                logging.getLogger('stratustryke.profiling').warning('Unable to stop per-thread profilers of threads still running')
+
+        self.wall = time.perf_counter() - self._wall_start
+        self.cpu_time = time.process_time() - self._cpu_start
+
+        if self.cpu:
+            with self._lock:
+                profiles = list(self._profiles)
+            self.stats = pstats.Stats(profiles[0])
+            for prof in profiles[1:]:
+                try:
+                    self.stats.add(prof)
+                except TypeError: # a thread that never made a profiled call
+                    continue
+
+        if self.memory:
+            self._stop.set()
+            self._sampler.join()
+            current, self.peak = tracemalloc.get_traced_memory()
+            self._final_snapshot = tracemalloc.take_snapshot().filter_traces(PROFILER_TRACE_FILTERS)
+            if self._peak_snapshot == None or current >= self._peak_sampled:
+                self._peak_snapshot = self._final_snapshot
+            if self._started_tracing: tracemalloc.stop()
+
+        return False # never suppress exceptions from the module
+
+
+    def hotspots(self, sort: str = 'tottime', limit: int = None) -> list:
+        ''':return: list[tuple] of (function, calls, tottime, cumtime) for the most expensive functions'''
+        if self.stats == None: return []
+        idx = 2 if (sort == 'tottime') else 3
+        entries = sorted(self.stats.stats.items(), key = lambda item: item[1][idx], reverse=True)
+        return [(format_function(key), nc, tt, ct) for key, (cc, nc, tt, ct, callers) in entries[:(limit or self.top)]]
+
+
+    def allocations(self, at_peak: bool = True, limit: int = None) -> list:
+        ''':return: list[tuple] of (site, size, count) allocation sites (relative to the start of the run), largest first'''
+        snapshot = self._peak_snapshot if at_peak else self._final_snapshot
+        if snapshot == None: return []
+        diffs = snapshot.compare_to(self._baseline, 'lineno')
+        rows = []
+        for stat in diffs[:(limit or self.top)]:
+            if stat.size_diff <= 0: break
+            frame = stat.traceback[0]
+            rows.append((f'{short_path(frame.filename)}:{frame.lineno}', stat.size_diff, stat.count_diff))
+        return rows
+
+
+    def summary(self) -> str:
+        busy = (self.cpu_time / self.wall * 100) if (self.wall > 0) else 0.0
+        return f'Wall time {self.wall:.2f}s, CPU time {self.cpu_time:.2f}s ({busy:.0f}% of wall; low values indicate time spent waiting on network / I/O)'
+
+
+    def save(self, directory: Path = None) -> Path:
+        '''Write cpu.pstats (loadable with pstats / snakeviz), cpu.txt, and memory.txt reports
+        :return: Path to the report directory [default: lib.home_dir()/profiles/<module>/<timestamp>]'''
+        if directory == None:
+            base = profile_dir(self.module_name)
+            stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            directory, suffix = base/stamp, 1
+            while directory.exists(): # multiple profiled runs within the same second
+                directory, suffix = base/f'{stamp}_{suffix}', suffix + 1
+        os.makedirs(directory, exist_ok=True)
+
+        with open(directory/'summary.txt', 'w') as file:
+            file.write(f'Module: {self.module_name}\n{self.summary()}\n')
+            if self.memory: file.write(f'Peak traced memory: {format_bytes(self.peak)}\n')
+
+        if self.stats != None:
+            self.stats.dump_stats(str(directory/'cpu.pstats'))
+            with open(directory/'cpu.txt', 'w') as file:
+                for sort in ('tottime', 'cumulative'):
+                    buffer = io.StringIO()
+                    pstats.Stats(str(directory/'cpu.pstats'), stream=buffer).sort_stats(sort).print_stats()
+                    file.write(f'=== Sorted by {sort} ===\n{buffer.getvalue()}\n')
+
+        if self._final_snapshot != None:
+            with open(directory/'memory.txt', 'w') as file:
+                file.write(f'Peak traced memory: {format_bytes(self.peak)}\n\n')
+                for label, snapshot in (('at peak', self._peak_snapshot), ('at end of run', self._final_snapshot)):
+                    file.write(f'=== Allocations {label} (growth since start of run) ===\n')
+                    for stat in snapshot.compare_to(self._baseline, 'traceback')[:100]:
+                        if stat.size_diff <= 0: break
+                        file.write(f'{format_bytes(stat.size_diff)} in {stat.count_diff} blocks\n')
+                        for line in stat.traceback.format(most_recent_first=True):
+                            file.write(f'    {line}\n')
+                    file.write('\n')
+
+        return directory
@@ -0,0 +1,224 @@
+# Author: @vexance
+# Purpose: Adaptive (AIMD) token bucket rate limiting shared by boto3 clients and framework HTTP requests
+#
+
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+from stratustryke.settings import RATE_LIMIT_ENABLED, RATE_LIMIT_INITIAL_RATE, RATE_LIMIT_MIN_RATE, RATE_LIMIT_MAX_RATE
+from stratustryke.settings import RATE_LIMIT_INCREASE, RATE_LIMIT_DECREASE, RATE_LIMIT_MAX_LIMITERS
+
+
+# AWS error codes / HTTP status codes indicating the caller is being throttled
+THROTTLE_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException', 'RequestThrottled',
+    'TooManyRequestsException', 'RequestLimitExceeded', 'SlowDown', 'BandwidthLimitExceeded', 'EC2ThrottledException',
+    'ProvisionedThroughputExceededException', 'TransactionInProgressException', 'PriorRequestNotComplete'
+}
+THROTTLE_STATUS_CODES = {429}
+
+
+def is_throttle(status_code: int = None, error_code: str = None) -> bool:
+    '''Return whether an HTTP status code / AWS error code indicates throttling'''
+    return (status_code in THROTTLE_STATUS_CODES) or (error_code in THROTTLE_ERROR_CODES)
+
+
+def retry_after(headers) -> float:
+    '''Parse a Retry-After header (seconds form only); returns None if absent or not numeric'''
+    value = headers.get('Retry-After', None) if (headers != None) else None
+    try:
+        return float(value) if (value != None) else None
+    except ValueError:
+        return None
+
+
+class AdaptiveRateLimiter(object):
+    '''
+    Token bucket whose fill rate is adjusted additive-increase / multiplicative-decrease (AIMD) style. Until the first
+    throttle the rate grows by one request/sec per success (roughly doubling each second of traffic); afterwards it grows by
+    'increase' requests/sec per second of successful traffic. A throttle sets the rate to 'decrease' times the lower of the
+    current and measured send rates (at most once per second, so in-flight requests sent at the old rate don't compound
+    the cut) and empties the bucket.
+    '''
+
+    def __init__(self, rate: float = RATE_LIMIT_INITIAL_RATE, min_rate: float = RATE_LIMIT_MIN_RATE, max_rate: float = RATE_LIMIT_MAX_RATE,
+                 increase: float = RATE_LIMIT_INCREASE, decrease: float = RATE_LIMIT_DECREASE) -> None:
+        self._lock = threading.Lock()
+        self._min_rate = min_rate
+        self._max_rate = max_rate
+        self._increase = increase
+        self._decrease = decrease
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.throttles = 0
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._last_decrease = 0.0
+        self._slow_start = True
+        self._measured = None # smoothed observed send rate (requests/sec)
+        self._window_start = self._updated
+        self._window_count = 0
+
+
+    def _refill(self, now: float) -> None:
+        capacity = max(1.0, self.rate) # allow up to one second of burst
+        self._tokens = min(capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+
+    def acquire(self) -> None:
+        '''Block until a request may be sent'''
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._measure(now)
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+
+    def _measure(self, now: float) -> None:
+        self._window_count += 1
+        elapsed = now - self._window_start
+        if elapsed >= 1.0:
+            if elapsed <= 5.0: # a window spanning an idle period says nothing about the sustainable rate
+                sample = self._window_count / elapsed
+                self._measured = sample if (self._measured == None) else (0.8 * self._measured + 0.2 * sample)
+            self._window_start, self._window_count = now, 0
+
+
+    def on_success(self) -> None:
+        with self._lock:
+            step = 1.0 if self._slow_start else (self._increase / max(self.rate, 1.0))
+            self.rate = min(self._max_rate, self.rate + step)
+
+
+    def on_throttle(self, pause: float = None) -> None:
+        '''Cut the rate after a throttled response; pause (e.g., from Retry-After) stops all sends for that many seconds'''
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            self._slow_start = False
+            if now - self._last_decrease >= 1.0:
+                base = min(self.rate, self._measured) if (self._measured != None) else self.rate
+                self.rate = max(self._min_rate, base * self._decrease)
+                self._last_decrease = now
+                self._refill(now)
+                self._tokens = 0.0
+            if pause != None and pause > 0:
+                self._paused_until = max(self._paused_until, now + pause)
+
+
+    def set_max_rate(self, max_rate: float) -> None:
+        with self._lock:
+            self._max_rate = max(max_rate, self._min_rate)
+            self.rate = min(self.rate, self._max_rate)
+
+
+class RateLimiterRegistry(object):
+    '''Adaptive limiters keyed by (host, credential id); the host identifies the service / region (e.g., ec2.us-east-1.amazonaws.com).
+    Limiters are created on first use and evicted least-recently-used beyond max_limiters.'''
+
+    def __init__(self, enabled: bool = RATE_LIMIT_ENABLED, max_rate: float = RATE_LIMIT_MAX_RATE, max_limiters: int = RATE_LIMIT_MAX_LIMITERS) -> None:
+        self._logger = logging.getLogger('stratustryke.ratelimit')
+        self._lock = threading.Lock()
+        self._limiters = OrderedDict()
+        self._max_limiters = max_limiters
+        self.enabled = enabled
+        self.max_rate = max_rate
+
+
+    def configure(self, enabled: bool, max_rate: float) -> None:
+        '''Apply framework configs (RATE_LIMIT / RATE_LIMIT_MAX)'''
+        self.enabled = enabled
+        if max_rate != self.max_rate:
+            self.max_rate = max_rate
+            with self._lock:
+                for limiter in self._limiters.values(): limiter.set_max_rate(max_rate)
+
+
+    def limiter(self, key: tuple) -> AdaptiveRateLimiter:
+        with self._lock:
+            limiter = self._limiters.get(key, None)
+            if limiter != None:
+                self._limiters.move_to_end(key)
+                return limiter
+
+            limiter = AdaptiveRateLimiter(max_rate=self.max_rate)
+            self._limiters[key] = limiter
+            while len(self._limiters) > self._max_limiters:
+                self._limiters.popitem(last=False)
+            return limiter
+
+
+    def acquire(self, key: tuple) -> None:
+        '''Block until a request for the key may be sent (no-op while rate limiting is disabled)'''
+        if self.enabled: self.limiter(key).acquire()
+
+
+    def record(self, key: tuple, throttled: bool, pause: float = None) -> None:
+        '''Report the outcome of a request for the key'''
+        if not self.enabled: return
+        limiter = self.limiter(key)
+        if throttled:
+            limiter.on_throttle(pause)
+            self._logger.info(f'Throttled by {key[0]}; reducing request rate to {limiter.rate:.2f}/sec')
+        else:
+            limiter.on_success()
+
+
+    def stats(self) -> list:
+        ''':return: list[tuple] of (key, current rate, throttle count) for each active limiter'''
+        with self._lock:
+            return [(key, limiter.rate, limiter.throttles) for key, limiter in self._limiters.items()]
+
+
+    def attach_boto_session(self, session, cred_id: str) -> None:
+        '''Register event handlers on a boto3 session so every client it creates sends through the limiter for (host, cred_id).
+        Handlers run for each attempt, including botocore's own retries.'''
+        def before_send(request = None, **kwargs):
+            self.acquire((urlsplit(request.url).netloc, cred_id))
+
+        def needs_retry(response = None, request_dict = None, caught_exception = None, **kwargs):
+            if response == None or request_dict == None: return None # connection errors aren't throttling signals
+            http_response, parsed = response
+            error_code = parsed.get('Error', {}).get('Code', None) if isinstance(parsed, dict) else None
+            throttled = is_throttle(http_response.status_code, error_code)
+            if throttled or http_response.status_code < 400:
+                self.record((urlsplit(request_dict['url']).netloc, cred_id), throttled, retry_after(http_response.headers))
+            return None # never changes botocore's retry decision
+
+        session.events.register('before-send', before_send)
+        session.events.register('needs-retry', needs_retry)
+
+
+    def send_http(self, url: str, send, expected_status: set = None, throttle_status: set = None):
+        '''
+        Send an HTTP request through the limiter for the URL's host; send() returns a requests.Response or None
+
+        :param expected_status: status codes >= 400 that are normal answers for the request (e.g., 404 when probing whether a
+            resource exists); counted as successes rather than ignored
+        :param throttle_status: status codes indicating throttling in addition to THROTTLE_STATUS_CODES (e.g., S3's 503 SlowDown)
+        '''
+        key = (urlsplit(url).netloc.lower(), None)
+        self.acquire(key)
+        res = send()
+        if res != None and self.enabled:
+            throttled = is_throttle(res.status_code) or (res.status_code in (throttle_status or ()))
+            if throttled or res.status_code < 400 or (res.status_code in (expected_status or ())):
+                self.record(key, throttled, retry_after(res.headers))
+        return res
+
+
+_REGISTRY = RateLimiterRegistry()
+
+
+def rate_limiters() -> RateLimiterRegistry:
+    return _REGISTRY
@@ -0,0 +1,251 @@
+# Author: @vexance
+# Purpose: Structured module result records and the streaming writers that persist / render them
+#
+
+import datetime
+import json
+import logging
+import re
+import sqlite3
+import threading
+import uuid
+
+from pathlib import Path
+
+from stratustryke.settings import RECORD_BATCH_SIZE
+
+
+class Record(object):
+    '''Single structured result emitted by a module (see StratustrykeModule.emit())'''
+
+    __slots__ = ('record_type', 'fields', 'module', 'run_id', 'timestamp', 'message', 'level')
+
+    METADATA = ('record_type', 'module', 'run_id', 'timestamp') # persisted alongside the fields; fields can't use these names
+
+    def __init__(self, record_type: str, fields: dict, module: str, run_id: str, message: str = None, level: str = 'success') -> None:
+        self.record_type = record_type
+        self.fields = fields
+        self.module = module
+        self.run_id = run_id
+        self.timestamp = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        self.message = message # console rendering only; not persisted
+        self.level = level # console print level (success, status, warning, failure, error, line)
+
+
+    @staticmethod
+    def reserved_fields(fields: dict) -> list:
+        '''Field names that would overwrite a metadata column once persisted (compared as SQLite column identifiers)'''
+        return [key for key in fields.keys() if SQLiteRecordWriter.identifier(key) in Record.METADATA]
+
+
+    def to_dict(self) -> dict:
+        '''Flattened representation used by persistent writers'''
+        return {'record_type': self.record_type, 'module': self.module, 'run_id': self.run_id, 'timestamp': self.timestamp, **self.fields}
+
+
+class RecordWriter(object):
+    '''Base class for record consumers (the base writer discards records). Writers are only called while the dispatcher
+    holds its lock.'''
+
+    def write(self, record: Record) -> None:
+        pass
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+class ConsoleRecordWriter(RecordWriter):
+    '''Renders records to the framework console using the record's message (or its fields) at the record's level'''
+
+    def __init__(self, framework) -> None:
+        self.framework = framework
+
+
+    def write(self, record: Record) -> None:
+        msg = record.message
+        if msg == None:
+            msg = f'({record.record_type}) ' + ', '.join(f'{key}: {val}' for key, val in record.fields.items())
+
+        printer = getattr(self.framework, f'print_{record.level}', self.framework.print_success)
+        printer(msg)
+
+
+class JSONLRecordWriter(RecordWriter):
+    '''Streams records as JSON lines to a file (or an already open stream such as stdout, which is left open), writing in batches'''
+
+    def __init__(self, path: Path = None, batch_size: int = RECORD_BATCH_SIZE, stream = None) -> None:
+        self.path = Path(path) if (path != None) else None
+        self._batch_size = batch_size
+        self._pending = []
+        self._owns_handle = (stream == None)
+        self._handle = open(self.path, 'a') if self._owns_handle else stream
+
+
+    def write(self, record: Record) -> None:
+        self._pending.append(json.dumps(record.to_dict(), default=str))
+        if len(self._pending) >= self._batch_size:
+            self.flush()
+
+
+    def flush(self) -> None:
+        if len(self._pending) > 0:
+            self._handle.write('\n'.join(self._pending) + '\n')
+            self._pending = []
+        self._handle.flush()
+
+
+    def close(self) -> None:
+        self.flush()
+        if self._owns_handle: self._handle.close()
+
+
+class SQLiteRecordWriter(RecordWriter):
+    '''Persists records to a SQLite database with one table per record type; rows are inserted in batched transactions
+    and new fields are added as columns as they are first seen'''
+
+    def __init__(self, path: Path, batch_size: int = RECORD_BATCH_SIZE) -> None:
+        self.path = Path(path)
+        self._batch_size = batch_size
+        self._pending = {} # table => list[dict]
+        self._pending_count = 0
+        self._columns = {} # table => list[str] known columns
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False) # dispatcher lock serializes access
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+
+
+    @staticmethod
+    def identifier(name: str) -> str:
+        '''Sanitize a record type / field name into a SQLite identifier'''
+        ident = re.sub(r'[^A-Za-z0-9_]', '_', str(name))
+        return ident if not ident[:1].isdigit() else f'_{ident}'
+
+
+    @staticmethod
+    def column_value(value):
+        if value == None or isinstance(value, (str, int, float, bool)):
+            return value
+        return json.dumps(value, default=str)
+
+
+    def write(self, record: Record) -> None:
+        table = f'records_{SQLiteRecordWriter.identifier(record.record_type)}'
+        row = {'run_id': record.run_id, 'module': record.module, 'timestamp': record.timestamp}
+        for key, val in record.fields.items():
+            row[SQLiteRecordWriter.identifier(key)] = SQLiteRecordWriter.column_value(val)
+
+        self._pending.setdefault(table, []).append(row)
+        self._pending_count += 1
+        if self._pending_count >= self._batch_size:
+            self.flush()
+
+
+    def ensure_columns(self, table: str, columns: set) -> list:
+        '''Create the table / add columns as needed; returns the table's full column list'''
+        known = self._columns.get(table, None)
+        if known == None:
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ("run_id" TEXT, "module" TEXT, "timestamp" TEXT)')
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_run_id" ON "{table}" ("run_id")')
+            known = [row[1] for row in self._conn.execute(f'PRAGMA table_info("{table}")')]
+
+        for column in sorted(columns - set(known)):
+            self._conn.execute(f'ALTER TABLE "{table}" ADD COLUMN "{column}"')
+            known.append(column)
+
+        self._columns[table] = known
+        return known
+
+
+    def flush(self) -> None:
+        if self._pending_count == 0: return
+
+        with self._conn: # one transaction per batch
+            for table, rows in self._pending.items():
+                columns = set()
+                for row in rows: columns.update(row.keys())
+                ordered = [col for col in self.ensure_columns(table, columns) if col in columns]
+
+                placeholders = ', '.join('?' for _ in ordered)
+                names = ', '.join(f'"{col}"' for col in ordered)
+                self._conn.executemany(f'INSERT INTO "{table}" ({names}) VALUES ({placeholders})',
+                                       ([row.get(col, None) for col in ordered] for row in rows))
+
+        self._pending = {}
+        self._pending_count = 0
+
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
+
+
+# Persistent writer types selectable through the RECORD_OUTPUT framework config; values are factories taking
+# (record directory, module, run id) and returning a RecordWriter
+RECORD_WRITERS = {
+    'jsonl': lambda directory, module, run_id: JSONLRecordWriter(Path(directory)/f'{module.name}_{run_id}.jsonl'),
+    'sqlite': lambda directory, module, run_id: SQLiteRecordWriter(Path(directory)/'records.sqlite')
+}
+
+
+class RecordDispatcher(object):
+    '''Fans records out to the console writer and any persistent writers opened for the current module run'''
+
+    def __init__(self, framework) -> None:
+        self._logger = logging.getLogger('stratustryke.records')
+        self._lock = threading.Lock()
+        self.console = ConsoleRecordWriter(framework)
+        self.writers = []
+        self.run_id = None
+
+
+    def new_run_id(self) -> str:
+        return f'{datetime.datetime.now().strftime("%Y%m%d%H%M%S")}_{uuid.uuid4().hex[:8]}'
+
+
+    def open(self, names: list, directory: Path, module, run_id: str = None) -> list:
+        '''Open persistent writers by name for a module run; returns the writers opened'''
+        self.run_id = run_id if (run_id != None) else self.new_run_id()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+
+        opened = []
+        for name in names:
+            factory = RECORD_WRITERS.get(name, None)
+            if factory == None:
+                raise ValueError(f'Unknown record output \'{name}\' (supported: {", ".join(RECORD_WRITERS.keys())})')
+            opened.append(factory(directory, module, self.run_id))
+
+        with self._lock:
+            self.writers.extend(opened)
+        return opened
+
+
+    def attach(self, writer: RecordWriter) -> None:
+        '''Add a writer opened by the caller (e.g., a stream writer) for the current run; it is closed with the others'''
+        with self._lock:
+            self.writers.append(writer)
+
+
+    def close(self) -> None:
+        '''Flush and close all persistent writers'''
+        with self._lock:
+            writers, self.writers = self.writers, []
+            for writer in writers:
+                try:
+                    writer.close()
+                except Exception as err:
+                    self._logger.error(f'Error closing record writer {type(writer).__name__}: {err}')
+        self.run_id = None
+
+
+    def dispatch(self, record: Record, console: bool = True) -> None:
+        if console: self.console.write(record) # outside the lock; console output may be buffered per-thread
+
+        with self._lock:
+            for writer in self.writers:
+                try:
+                    writer.write(record)
+                except Exception as err:
+                    self._logger.error(f'Error writing {record.record_type} record with {type(writer).__name__}: {err}')
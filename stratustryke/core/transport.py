@@ -0,0 +1,224 @@
+# Author: @vexance
+# Purpose: Framework-owned HTTP transport; keeps per-host keep-alive connection pools shared by all modules
+#
+
+import http.cookiejar
+import logging
+import socket
+import threading
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlsplit
+from requests import Session, Response
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
+
+from stratustryke.settings import HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, RETRY_MODE, MAX_ATTEMPTS, TCP_KEEPALIVE
+
+
+# Response status codes retried (idempotent methods only) outside of the legacy retry mode
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def http_retry(retry_mode: str, max_attempts: int) -> Retry:
+    '''
+    urllib3 retry policy matching the framework RETRY_MODE / MAX_ATTEMPTS configs. Connection failures are retried for any
+    method (the request was never sent); outside the legacy mode, idempotent requests are also retried on read errors and
+    throttling / 5xx responses with exponential backoff, honoring Retry-After. The final response is returned rather than raised.
+    '''
+    retries = max(0, max_attempts - 1)
+    if retry_mode == 'legacy':
+        return Retry(total=retries, connect=retries, read=False, status=0, redirect=False, raise_on_status=False)
+
+    return Retry(total=retries, backoff_factor=0.5, status_forcelist=RETRY_STATUS_CODES, respect_retry_after_header=True,
+                 redirect=False, raise_on_status=False)
+
+
+class KeepAliveHTTPAdapter(HTTPAdapter):
+    '''HTTPAdapter that optionally enables TCP keepalive probes on the sockets of its pooled connections'''
+
+    def __init__(self, tcp_keepalive: bool = False, **kwargs) -> None:
+        self._tcp_keepalive = tcp_keepalive
+        super().__init__(**kwargs)
+
+
+    def _socket_options(self, kwargs: dict) -> dict:
+        if self._tcp_keepalive:
+            kwargs['socket_options'] = HTTPConnection.default_socket_options + [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        return kwargs
+
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **self._socket_options(kwargs))
+
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        return super().proxy_manager_for(proxy, **self._socket_options(proxy_kwargs))
+
+
+class HTTPTransport(object):
+    '''
+    Wraps a single requests.Session whose adapters keep connection pools per host (scheme, host, port) so that repeated
+    requests reuse TCP / TLS connections rather than performing a fresh handshake each time.\n
+    The session does not persist cookies, so the only shared state is the urllib3 pools (which are thread-safe); the
+    transport may be used concurrently from module worker threads.\n
+    Retries are applied by the adapters, so requests with a non-default retry policy (see request()) use a separate session
+    (and connection pools) per policy.
+    '''
+
+    def __init__(self, pool_connections: int = HTTP_POOL_CONNECTIONS, pool_maxsize: int = HTTP_POOL_MAXSIZE, retry_mode: str = RETRY_MODE,
+                 max_attempts: int = MAX_ATTEMPTS, tcp_keepalive: bool = TCP_KEEPALIVE) -> None:
+        self._logger = logging.getLogger('stratustryke.transport')
+        self._lock = threading.Lock()
+        self._pool_connections = pool_connections
+        self._pool_maxsize = pool_maxsize
+        self._retry_policy = (retry_mode, max_attempts)
+        self._tcp_keepalive = tcp_keepalive
+        self._session = self._build_session(self._retry_policy)
+        self._policy_sessions = {} # (retry_mode, max_attempts) => Session for non-default retry policies
+
+
+    def _build_session(self, retry_policy: tuple) -> Session:
+        session = Session()
+        session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[])) # match requests.request(); no cookies carried between calls
+        # pool_block=False: if more threads than pool_maxsize hit one host, extra connections are opened and discarded rather than blocking
+        adapter = KeepAliveHTTPAdapter(self._tcp_keepalive, pool_connections=self._pool_connections, pool_maxsize=self._pool_maxsize,
+                                       pool_block=False, max_retries=http_retry(*retry_policy))
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+
+    @property
+    def pool_sizes(self) -> tuple:
+        ''':return: tuple(pool_connections, pool_maxsize)'''
+        return (self._pool_connections, self._pool_maxsize)
+
+
+    @property
+    def settings(self) -> tuple:
+        ''':return: tuple(pool_connections, pool_maxsize, retry_mode, max_attempts, tcp_keepalive)'''
+        return (self._pool_connections, self._pool_maxsize, *self._retry_policy, self._tcp_keepalive)
+
+
+    def reconfigure(self, pool_connections: int, pool_maxsize: int, retry_mode: str = RETRY_MODE, max_attempts: int = MAX_ATTEMPTS,
+                    tcp_keepalive: bool = TCP_KEEPALIVE) -> None:
+        '''Rebuild the connection pools if the configured sizes / retry policy / keepalive changed. Requests already in flight
+        finish on the old sessions.'''
+        with self._lock:
+            if (pool_connections, pool_maxsize, retry_mode, max_attempts, tcp_keepalive) == self.settings:
+                return
+
+            self._logger.info(f'Rebuilding HTTP connection pools: {pool_connections} hosts / {pool_maxsize} connections per host, '
+                              f'{retry_mode} retries ({max_attempts} attempts), TCP keepalive {"on" if tcp_keepalive else "off"}')
+            old = [self._session, *self._policy_sessions.values()]
+            self._pool_connections, self._pool_maxsize = pool_connections, pool_maxsize
+            self._retry_policy, self._tcp_keepalive = (retry_mode, max_attempts), tcp_keepalive
+            self._session = self._build_session(self._retry_policy)
+            self._policy_sessions = {}
+
+        for session in old: session.close()
+
+
+    def _session_for(self, retry_policy: tuple) -> Session:
+        if retry_policy == None or retry_policy == self._retry_policy:
+            return self._session
+
+        with self._lock:
+            session = self._policy_sessions.get(retry_policy, None)
+            if session == None:
+                session = self._policy_sessions[retry_policy] = self._build_session(retry_policy)
+            return session
+
+
+    def request(self, method: str, url: str, retry_policy: tuple = None, **kwargs) -> Response:
+        '''Perform an HTTP request over the pooled session; accepts the same keyword args as requests.request()
+        :param retry_policy: optional (retry_mode, max_attempts) tuple overriding the transport's retry policy'''
+        return self._session_for(retry_policy).request(method, url, **kwargs)
+
+
+    def close(self) -> None:
+        '''Close all pooled connections'''
+        with self._lock:
+            self._session.close()
+            for session in self._policy_sessions.values(): session.close()
+
+
+def normalize_request(item) -> tuple:
+    '''Normalize a batch request item into (method, url, kwargs). Items may be (method, url) tuples, (method, url, kwargs)
+    tuples, or dicts with 'method' / 'url' keys plus any http_request() keyword args'''
+    if isinstance(item, dict):
+        kwargs = dict(item)
+        return kwargs.pop('method', 'GET'), kwargs.pop('url'), kwargs
+
+    if len(item) == 2:
+        return item[0], item[1], {}
+    return item[0], item[1], dict(item[2])
+
+
+def request_many(send, requests_iterable, concurrency: int, per_host: int):
+    '''
+    Dispatch requests concurrently and yield (request, response) tuples as each completes (not in submission order).\n
+    At most 'concurrency' requests are in flight, and at most 'per_host' to any one host. The iterable is consumed lazily
+    so arbitrarily large (generated) wordlists don't need to be materialized.\n
+    :param send: callable(method, url, **kwargs) -> Response | None performing one request
+    :param requests_iterable: iterable of request items (see normalize_request())
+    :param concurrency: max number of requests in flight
+    :param per_host: max number of requests in flight to a single host
+    '''
+    concurrency = max(1, concurrency)
+    per_host = max(1, per_host)
+    source = iter(requests_iterable)
+    exhausted = False
+    deferred = deque() # requests pulled from the source while their host was at its limit
+    in_flight = {} # future => (request, host)
+    host_counts = {}
+
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='stratustryke-http')
+    try:
+        while True:
+            # Fill open slots; previously deferred requests first, then new ones from the source
+            for _ in range(len(deferred)):
+                if len(in_flight) >= concurrency: break
+                item, method, url, kwargs, host = deferred.popleft()
+                if host_counts.get(host, 0) >= per_host:
+                    deferred.append((item, method, url, kwargs, host))
+                    continue
+                host_counts[host] = host_counts.get(host, 0) + 1
+                in_flight[executor.submit(send, method, url, **kwargs)] = (item, host)
+
+            while (not exhausted) and len(in_flight) < concurrency and len(deferred) < concurrency:
+                try:
+                    item = next(source)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                method, url, kwargs = normalize_request(item)
+                host = urlsplit(url).netloc.lower()
+                if host_counts.get(host, 0) >= per_host:
+                    deferred.append((item, method, url, kwargs, host))
+                    continue
+                host_counts[host] = host_counts.get(host, 0) + 1
+                in_flight[executor.submit(send, method, url, **kwargs)] = (item, host)
+
+            if len(in_flight) == 0:
+                if exhausted and len(deferred) == 0: return
+                continue # only reachable if every deferred host is saturated, which requires something in flight
+
+            done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                item, host = in_flight.pop(future)
+                host_counts[host] -= 1
+                if host_counts[host] == 0: del host_counts[host]
+
+                try:
+                    res = future.result()
+                except Exception:
+                    res = None
+                yield item, res
+
+    finally: # also reached when the caller stops iterating early
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -40,6 +40,26 @@ def sqlite_filepath() -> Path:
     return path
 
 
+def checkpoint_filepath() -> Path:
+    path = home_dir()/'checkpoints.sqlite'
+    return path
+
+
+def aws_cache_filepath() -> Path:
+    path = home_dir()/'aws_cache.sqlite'
+    return path
+
+
+def inventory_filepath() -> Path:
+    path = home_dir()/'inventory.sqlite'
+    return path
+
+
+def module_index_filepath() -> Path:
+    path = home_dir()/'module_index.json'
+    return path
+
+
 def module_data_dir(mod: str) -> Path:
     '''
     Returns directory for specific modules data
@@ -51,3 +71,15 @@ def module_data_dir(mod: str) -> Path:
     os.makedirs(p, exist_ok=True)
     return p
 
+
+
+def profile_dir(mod: str) -> Path:
+    '''
+    Returns directory profiling reports for a module are saved to
+    :param: mod: <str> module name
+    :rtype: <Path> Path to module-specific profile directory
+    '''
+    # e.g., /home/user/.local/share/stratustryke/profiles/aws/iam/enum/bruteforce_iam_privileges
+    p = (home_dir()/'profiles'/mod).absolute()
+    os.makedirs(p, exist_ok=True)
+    return p
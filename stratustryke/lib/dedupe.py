@@ -0,0 +1,111 @@
+# Author: @vexance
+# Purpose: In-order duplicate filtering for large streamed inputs (wordlists, pasted option values)
+#
+
+import math
+import sys
+
+from array import array
+
+from stratustryke.settings import LINE_DEDUPE_MAX_EXACT
+
+
+class FingerprintSet(object):
+    '''
+    Compact set of string fingerprints: each item is stored as its 64-bit hash() in an open-addressed array (~12-24 bytes per
+    item vs. ~100 for a set of str). Two different items only collide with probability ~n/2**64, so for inputs of any
+    practical size membership tests are exact. Fingerprints are only comparable within one process (str hashes are salted).
+    '''
+
+    def __init__(self, capacity: int = 1024) -> None:
+        slots = 1 << max(4, math.ceil(math.log2(capacity * 3 / 2)))
+        self._table = array('Q', bytes(8 * slots))
+        self._mask = slots - 1
+        self.count = 0
+
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._table) * self._table.itemsize
+
+
+    def __len__(self) -> int:
+        return self.count
+
+
+    def add(self, item: str) -> bool:
+        ''':return: (bool) True if the item was already present'''
+        fingerprint = (hash(item) & 0xFFFFFFFFFFFFFFFF) or 1 # 0 marks an empty slot
+        table, mask = self._table, self._mask
+        slot = fingerprint & mask
+        while True:
+            current = table[slot]
+            if current == fingerprint: return True
+            if current == 0: break
+            slot = (slot + 1) & mask
+
+        table[slot] = fingerprint
+        self.count += 1
+        if self.count * 3 > mask * 2: self._grow() # keep load below 2/3 so probe runs stay short
+        return False
+
+
+    def _grow(self) -> None:
+        old = self._table
+        slots = len(old) * 2
+        table = self._table = array('Q', bytes(8 * slots))
+        mask = self._mask = slots - 1
+        for fingerprint in old:
+            if fingerprint == 0: continue
+            slot = fingerprint & mask
+            while table[slot] != 0: slot = (slot + 1) & mask
+            table[slot] = fingerprint
+
+
+class UniqueFilter(object):
+    '''
+    In-order duplicate filter for streamed strings. Seen items are tracked in a set until max_exact unique items have been
+    seen, then as 64-bit fingerprints in a FingerprintSet so memory per unique item stays small for very large inputs (e.g., a
+    10M line wordlist). Counts of unique / duplicate items are kept as it runs.
+    '''
+
+    def __init__(self, max_exact: int = LINE_DEDUPE_MAX_EXACT) -> None:
+        self.max_exact = max_exact
+        self.unique = 0
+        self.duplicates = 0
+        self._seen = set()
+        self._fingerprints = None
+
+
+    @property
+    def nbytes(self) -> int:
+        '''Approximate memory used to track seen items'''
+        if self._fingerprints != None: return self._fingerprints.nbytes
+        return sys.getsizeof(self._seen) + sum(sys.getsizeof(item) for item in self._seen)
+
+
+    def add(self, item: str) -> bool:
+        ''':return: (bool) True if the item has not been seen before'''
+        if self._fingerprints == None:
+            if item in self._seen:
+                self.duplicates += 1
+                return False
+            self._seen.add(item)
+            if self.max_exact != None and len(self._seen) >= self.max_exact:
+                self._fingerprints = FingerprintSet(len(self._seen) * 4)
+                for seen in self._seen: self._fingerprints.add(seen)
+                self._seen = set()
+
+        elif self._fingerprints.add(item):
+            self.duplicates += 1
+            return False
+
+        self.unique += 1
+        return True
+
+
+    def filter(self, items):
+        '''Yield items not seen before, in their original order'''
+        add = self.add
+        for item in items:
+            if add(item): yield item
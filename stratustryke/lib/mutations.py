@@ -0,0 +1,174 @@
+# Author: @vexance
+# Purpose: Lazy generation of mutated cloud storage name candidates (bucket bruteforce modules)
+#
+
+import re
+
+from stratustryke.lib.dedupe import UniqueFilter
+
+
+# Separators placed between a keyword and an affix by default ('' concatenates)
+DEFAULT_SEPARATORS = ('', '.', '-')
+
+# Environment / stage names commonly found in bucket names
+ENVIRONMENTS = ('dev', 'development', 'test', 'testing', 'qa', 'uat', 'stage', 'staging', 'preprod', 'prod', 'production',
+                'sandbox', 'demo', 'int', 'integration', 'internal', 'public', 'private', 'backup', 'logs')
+
+IPV4_REGEX = re.compile(r'^\d{1,3}(?:\.\d{1,3}){3}$')
+S3_BUCKET_REGEX = re.compile(r'^[a-z0-9][a-z0-9.-]{1,61}[a-z0-9]$')
+S3_RESERVED_PREFIXES = ('xn--', 'sthree-', 'amzn-s3-demo-')
+S3_RESERVED_SUFFIXES = ('-s3alias', '--ol-s3', '.mrap', '--x-s3', '--table-s3')
+GCS_BUCKET_REGEX = re.compile(r'^[a-z0-9][a-z0-9._-]{1,220}[a-z0-9]$')
+GCS_GOOGLE_REGEX = re.compile(r'g[o0]{2}g[l1]e') # 'google' and close misspellings are not allowed anywhere in a name
+
+
+def valid_s3_bucket_name(name: str) -> bool:
+    '''General purpose S3 bucket naming rules (3-63 lowercase letters / digits / dots / hyphens, no adjacent dots, not an IP address, no reserved prefixes / suffixes)'''
+    return (S3_BUCKET_REGEX.match(name) != None) and ('..' not in name) and (IPV4_REGEX.match(name) == None) and \
+        (not name.startswith(S3_RESERVED_PREFIXES)) and (not name.endswith(S3_RESERVED_SUFFIXES))
+
+
+def valid_gcs_bucket_name(name: str) -> bool:
+    '''Cloud Storage bucket naming rules (3-63 lowercase letters / digits / hyphens / underscores / dots, or up to 222 with dot-separated components of at most 63, not an IP address, no 'goog' prefix or 'google')'''
+    if GCS_BUCKET_REGEX.match(name) == None or IPV4_REGEX.match(name) != None: return False
+    if '.' in name:
+        if '..' in name or any(len(part) > 63 for part in name.split('.')): return False
+    elif len(name) > 63: return False
+    return not (name.startswith('goog') or GCS_GOOGLE_REGEX.search(name))
+
+
+# provider => bucket name validator
+BUCKET_NAME_VALIDATORS = {
+    'aws': valid_s3_bucket_name,
+    'gcp': valid_gcs_bucket_name
+}
+
+
+class MutationRule(object):
+    '''Base class for mutation rules: apply() yields the candidate names a rule derives from one keyword (none by default;
+    the keyword itself is yielded by CandidateGenerator)'''
+
+    def apply(self, keyword: str):
+        return iter(())
+
+
+class AffixRule(MutationRule):
+    '''Joins each affix after (keyword{sep}{affix}) and / or before ({affix}{sep}keyword) the keyword with each separator'''
+
+    def __init__(self, affixes: list, separators: tuple = DEFAULT_SEPARATORS, suffix: bool = True, prefix: bool = True) -> None:
+        self.affixes = [affix for affix in dict.fromkeys(affixes) if affix != '']
+        self.separators = tuple(dict.fromkeys(separators))
+        self.suffix = suffix
+        self.prefix = prefix
+
+
+    def apply(self, keyword: str):
+        for affix in self.affixes:
+            if self.suffix:
+                for sep in self.separators: yield f'{keyword}{sep}{affix}'
+            if self.prefix:
+                for sep in self.separators: yield f'{affix}{sep}{keyword}'
+
+
+class YearRule(AffixRule):
+    '''Affixes each year of an inclusive range'''
+
+    def __init__(self, start: int, end: int, separators: tuple = DEFAULT_SEPARATORS, suffix: bool = True, prefix: bool = True) -> None:
+        super().__init__([str(year) for year in range(start, end + 1)], separators, suffix, prefix)
+
+
+class EnvironmentRule(AffixRule):
+    '''Affixes environment / stage names (ENVIRONMENTS by default)'''
+
+    def __init__(self, environments: list = ENVIRONMENTS, separators: tuple = DEFAULT_SEPARATORS, suffix: bool = True, prefix: bool = True) -> None:
+        super().__init__(environments, separators, suffix, prefix)
+
+
+class CandidateGenerator(object):
+    '''
+    Lazily generates candidate names from keywords: each keyword (unless include_keywords is disabled) followed by the names
+    each rule derives from it. Names are lowercased, names the validator rejects are dropped, and duplicates are dropped as
+    they are generated, so nothing is materialized up front. Iteration is deterministic, so independent workers can split
+    the candidates with candidates(shard, shards) without coordinating.\n
+    :param keywords: re-iterable (e.g., list) of keywords; it is iterated once per pass over the candidates
+    :param rules: list[MutationRule] applied to each keyword in order
+    :param validator: callable(name) -> bool rejecting names invalid for the target (see BUCKET_NAME_VALIDATORS)
+    '''
+
+    def __init__(self, keywords, rules: list, validator = None, include_keywords: bool = True, lowercase: bool = True) -> None:
+        self.keywords = keywords
+        self.rules = rules
+        self.validator = validator
+        self.include_keywords = include_keywords
+        self.lowercase = lowercase
+        self.dedupe = None # UniqueFilter of the latest pass; unique / duplicate counts
+
+
+    def _names(self):
+        for keyword in self.keywords:
+            if keyword == '': continue
+            if self.include_keywords: yield keyword
+            for rule in self.rules:
+                yield from rule.apply(keyword)
+
+
+    def candidates(self, shard: int = 0, shards: int = 1):
+        '''
+        Yield valid, unique candidate names; with shards > 1 only those whose index (in the full candidate sequence) is
+        shard modulo shards, so shards 0..shards-1 together cover every candidate exactly once\n
+        :param shard: (int) zero-based shard index
+        :param shards: (int) total number of shards
+        '''
+        if not 0 <= shard < shards: raise ValueError(f'Invalid shard {shard} of {shards}')
+        lower = str.lower if self.lowercase else None
+        valid = self.validator
+        names = self._names()
+        if lower != None: names = (lower(name) for name in names)
+        if valid != None: names = (name for name in names if valid(name))
+
+        self.dedupe = UniqueFilter()
+        for index, name in enumerate(self.dedupe.filter(names)):
+            if shards == 1 or index % shards == shard: yield name
+
+
+    def __iter__(self):
+        return self.candidates()
+
+
+    def count(self, shard: int = 0, shards: int = 1) -> int:
+        '''Count the candidates of a shard without storing them'''
+        return sum(1 for _ in self.candidates(shard, shards))
+
+
+def parse_shard(value: str) -> tuple:
+    '''Parse a 'N/M' (1-based shard N of M) value into a zero-based (shard, shards) tuple; None / '' selects every candidate'''
+    if value == None or value == '': return (0, 1)
+    shard, sep, shards = value.partition('/')
+    if sep == '' or not (shard.strip().isdigit() and shards.strip().isdigit()):
+        raise ValueError(f'Invalid shard \'{value}\' (expected N/M with 1 <= N <= M)')
+    shard, shards = int(shard), int(shards)
+    if not 1 <= shard <= shards: raise ValueError(f'Invalid shard \'{value}\' (expected N/M with 1 <= N <= M)')
+    return (shard - 1, shards)
+
+
+def parse_years(value: str) -> tuple:
+    '''Parse a 'YYYY-YYYY' (or single 'YYYY') value into an inclusive (start, end) tuple'''
+    start, sep, end = value.partition('-')
+    start = int(start)
+    end = int(end) if (sep != '') else start
+    if end < start: raise ValueError(f'Invalid year range \'{value}\'')
+    return (start, end)
+
+
+def bucket_candidates(keywords, mutations: list, provider: str, separators: tuple = DEFAULT_SEPARATORS, years: str = None,
+                      environments: bool = False) -> CandidateGenerator:
+    '''
+    CandidateGenerator for the bucket bruteforce modules: keywords joined with each mutation (and optionally a year range /
+    ENVIRONMENTS) using each separator, keeping only names valid for the provider's buckets\n
+    :param provider: str key of BUCKET_NAME_VALIDATORS (aws, gcp)
+    :param years: str 'YYYY-YYYY' range of years to affix (see parse_years())
+    '''
+    rules = [AffixRule(mutations, separators)]
+    if years not in [None, '']: rules.append(YearRule(*parse_years(years), separators))
+    if environments: rules.append(EnvironmentRule(ENVIRONMENTS, separators))
+    return CandidateGenerator(keywords, rules, BUCKET_NAME_VALIDATORS[provider])
@@ -5,6 +5,7 @@ from pathlib import Path
 from collections import OrderedDict
 
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.inventory import normalize_stack
 from stratustryke.lib import module_data_dir
 
 
@@ -32,11 +33,11 @@ class Module(AWSModule):
     
 
     def list_stacks(self, region: str) -> list:
-        session = self.get_cred().session(region)
+        cred = self.get_cred()
         stacks = []
         
         try:
-            client = session.client('cloudformation')
+            client = cred.client('cloudformation', region)
             paginator = client.get_paginator('list_stacks')
             pages = paginator.paginate()
 
@@ -57,12 +58,12 @@ class Module(AWSModule):
 
     def describe_stacks(self, region: str, stack_name: str = None) -> dict:
         '''List and get stack metadata'''
-        session = self.get_cred().session(region)
+        cred = self.get_cred()
         ret = {}
         ### First we'll try cloudformation:DescribeStacks; if this fails we may need to list and then describe individualls
 
         try:
-            client = session.client('cloudformation')\
+            client = cred.client('cloudformation', region)\
             
             if stack_name == None:
                 paginator = client.get_paginator('describe_stacks')
@@ -78,8 +79,10 @@ class Module(AWSModule):
             return None
 
 
+        described = []
         for page in pages:
             stacks = page.get('Stacks', [])
+            described.extend(normalize_stack(stack) for stack in stacks)
 
             for stack in stacks:
                 stack_id = stack.get('StackId', None)
@@ -120,15 +123,19 @@ class Module(AWSModule):
 
                 ret[name] = stack_id
 
+        # Stack ids are ARNs (arn:aws:cloudformation:<region>:<account>:stack/<name>/<id>); a full listing replaces the region's stacks
+        account = described[0]['stack_id'].split(':')[4] if (len(described) > 0) else None
+        self.record_inventory('stacks', region, described, complete=(stack_name == None), account=account)
+
         return ret
     
 
     def get_stack_template(self, region: str, stack_name: str, stack_id: str) -> bool:
-        session = self.get_cred().session(region)
+        cred = self.get_cred()
         download_dir = self.get_opt(Module.OPT_DOWNLOAD_DIR)
 
         try:
-            client = session.client('cloudformation')
+            client = cred.client('cloudformation', region)
             res = client.get_template(StackName=stack_id)
 
             content = res.get('TemplateBody')
@@ -159,27 +166,30 @@ class Module(AWSModule):
             return False
 
 
-    def run(self) -> None:
-
-        regions = self.get_regions()
+    def extract_region(self, region: str) -> None:
+        '''Describe stacks in a region and download each stack's template'''
         # First, just attempt to describe all stacks
-        
-        for region in regions:
-            stacks = self.describe_stacks(region)
+        stacks = self.describe_stacks(region)
 
-            # First get all the metadata with regards to the stacks while collecting stack ARNs/Ids
-            if stacks == {}: self.print_status('No cloudformation stacks found')
-            elif stacks == None:
-                self.print_status('cloudformation:DescribeStacks failed, attempting to perform cloudformation:ListStacks call')
-                stack_names = self.list_stacks(region)
+        # First get all the metadata with regards to the stacks while collecting stack ARNs/Ids
+        if stacks == {}: self.print_status('No cloudformation stacks found')
+        elif stacks == None:
+            self.print_status('cloudformation:DescribeStacks failed, attempting to perform cloudformation:ListStacks call')
+            stack_names = self.list_stacks(region)
 
-                for stack in stack_names:
-                    ret = self.describe_stacks(region, stack)
-                    stacks[stack] = ret[stack]
+            stacks = {}
+            for stack in stack_names:
+                ret = self.describe_stacks(region, stack)
+                if ret != None: stacks[stack] = ret[stack]
 
-            # Now we'll iterate through the ARNs and download the stack templates
-            for stack in stacks.keys():
-                stack_arn = stacks[stack]
+        # Now we'll iterate through the ARNs and download the stack templates
+        for stack in stacks.keys():
+            stack_arn = stacks[stack]
+
+            self.get_stack_template(region, f'{stack}', stack_arn)
+
+
+    def run(self) -> None:
 
-                self.get_stack_template(region, f'{stack}', stack_arn)
+        self.map_regions(self.extract_region)
         
\ No newline at end of file
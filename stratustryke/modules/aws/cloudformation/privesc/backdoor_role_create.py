@@ -311,7 +311,7 @@ class Module(AWSModule):
         primary_reason = None
         max_events = 50
         try:
-            client = self.get_cred().session(region).client('cloudformation')
+            client = self.get_cred().client('cloudformation', region)
             paginator = client.get_paginator('describe_stack_events')
             
             for page in paginator.paginate(StackName=stack_id):
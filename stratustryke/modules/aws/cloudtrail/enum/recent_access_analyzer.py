@@ -47,8 +47,8 @@ class Module(AWSModule):
         return (True, None)
     
 
-    def fetch_records(self, region: str, read_only: bool) -> bool:
-        '''Paginate through CloudTrail events'''
+    def fetch_records(self, region: str, read_only: bool) -> dict:
+        '''Paginate through CloudTrail events, returning {principal_arn: set(event messages)} (empty on error)'''
 
         self.print_status(f'Ingesting events from {region}...')
         session = self.get_cred().session(region)
@@ -60,6 +60,7 @@ class Module(AWSModule):
         query_start = int((now - timedelta(days=delta)).timestamp())
 
         attributes = [{'AttributeKey': 'ReadOnly', 'AttributeValue': f'{read_only}'.lower()}]
+        trail_events = {}
 
         try:
             client = session.client('cloudtrail')
@@ -97,24 +98,31 @@ class Module(AWSModule):
                     #msg = f'{prefix} PRINCIPAL_ARN {role_session}called {service}:{event_name}'
                     #if region: msg = f'{msg} in {region}'
 
-                    if principal not in self.trail_events.keys(): self.trail_events[principal] = set([msg])
-                    else: self.trail_events[principal].add(msg)
+                    if principal not in trail_events.keys(): trail_events[principal] = set([msg])
+                    else: trail_events[principal].add(msg)
                 
         except Exception as err:
             self.print_error(f'Error during cloudtrail:LookupEvents call: {err}')
-            return False
+            return {}
         
-        return True
+        return trail_events
+
+
+    def merge_records(self, regional_events: dict) -> None:
+        '''Merge per-region results from fetch_records() into self.trail_events'''
+        for trail_events in regional_events.values():
+            for principal, msgs in (trail_events or {}).items():
+                self.trail_events[principal] = self.trail_events.get(principal, set()) | msgs
 
 
     def run(self):       
         self.print_status('Starting query for CloudTrail events...')
         
-        for region in self.get_regions(): self.fetch_records(region, True)
+        self.merge_records(self.map_regions(lambda region: self.fetch_records(region, True)))
 
         if not self.get_opt(Module.OPT_SKIP_NONREAD):
             self.print_status('Starting query for non-ReadOnly CloudTrail events')
-            for region in self.get_regions(): self.fetch_records(region, False)
+            self.merge_records(self.map_regions(lambda region: self.fetch_records(region, False)))
 
         principals = self.get_opt_multiline(Module.OPT_PRINCIPAL_ARN, unique=True)
         if principals == None: principals = [f'{key}' for key in self.trail_events.keys()]
@@ -76,24 +76,28 @@ class Module(AWSModule):
         return arns
 
 
-    def run(self):
-        
-        all_records = set()
-        for region in self.get_regions():
+    def inspect_region(self, region: str) -> set:
+        '''Collect ARN patterns from (ReadOnly and optionally non-ReadOnly) CloudTrail events in a region'''
+        self.print_status(f'Inspecting CloudTrail events in {region}')
+        regional_records = self.fetch_records(region, True)
+
+        if not self.get_opt(Module.OPT_SKIP_NONREAD):
+            if self.verbose: self.print_status(f'Starting search on non-ReadOnly events in {region}')
+            regional_records = regional_records | self.fetch_records(region, False)
 
-            self.print_status(f'Inspecting CloudTrail events in {region}')
-            regional_records = self.fetch_records(region, True)
+        self.print_status(f'Found {len(regional_records)} unqiue ARN patterns in {region}')
+        return regional_records
 
-            if not self.get_opt(Module.OPT_SKIP_NONREAD):
-                if self.verbose: self.print_status(f'Starting search on non-ReadOnly events in {region}')
-                regional_records = regional_records | self.fetch_records(region, False)
 
-            self.print_status(f'Found {len(regional_records)} unqiue ARN patterns in {region}')
+    def run(self):
+        
+        all_records = set()
+        for regional_records in self.map_regions(self.inspect_region).values():
             all_records = all_records | regional_records # accumulate accross regions
 
 
         for arn in all_records:
             if arn.endswith('\\\\'): arn = arn[:-2] # odd case where this is a common trailing thing 
-            self.print_success(arn)
+            self.emit('arn', arn, arn=arn)
 
         return None
\ No newline at end of file
@@ -89,7 +89,7 @@ class Module(AWSModule):
         query_id = None
 
         try:
-            client = self.get_cred().session(region).client('logs')
+            client = self.get_cred().client('logs', region)
 
 
             res = client.start_query(queryString=query, startTime=start, endTime=end, limit=record_limit)
@@ -54,8 +54,7 @@ class Module(AWSModule):
         :return: str | None'''
         cred = self.get_cred()
         try:
-            session = cred.session(region=src_reg)
-            client = session.client('ec2')
+            client = cred.client('ec2', src_reg)
             res = client.copy_snapshot(Description=desc, SourceSnapshotId=src_id, SourceRegion=src_reg, DestinationRegion=dest)
 
             copy_id = res.get('SnapshotId', False)
@@ -73,8 +72,7 @@ class Module(AWSModule):
         '''Perform ec2:DescribeSnapshots until response comes back with state 'completed' '''
         cred = self.get_cred()
         try:
-            session = cred.session()
-            client = session.client('ec2')
+            client = cred.client('ec2')
             state = 'pending'
 
             while state == 'pending':
@@ -103,8 +101,7 @@ class Module(AWSModule):
         blocks = []
 
         try:
-            session = cred.session()
-            client = session.client('ebs')
+            client = cred.client('ebs')
             res = client.list_snapshot_blocks(SnapshotId=copy_id)
             
             blocks.extend(res.get('Blocks', []))
@@ -128,8 +125,7 @@ class Module(AWSModule):
         cred = self.get_cred()
 
         try:
-            session = cred.session()
-            client = session.client('ebs')
+            client = cred.client('ebs')
 
             i = 0
             for block in blocks:
@@ -164,8 +160,7 @@ class Module(AWSModule):
         # Delete the copy of the snapshot
         cred = self.get_cred()
         try:
-            session = cred.session()
-            client = session.client('ec2')
+            client = cred.client('ec2')
             res = client.delete_snapshot(SnapshotId=copy_id)
 
         except Exception as err:
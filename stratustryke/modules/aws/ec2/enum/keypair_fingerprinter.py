@@ -8,6 +8,7 @@ from cryptography.hazmat.primitives.serialization import Encoding, PrivateFormat
 from cryptography.hazmat.primitives.asymmetric import rsa, ed25519
 
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.inventory import instance_addresses, normalize_instance, normalize_key_pair
 
 
 class Module(AWSModule):
@@ -187,16 +188,20 @@ class Module(AWSModule):
         cred = self.get_cred()
 
         try:
-            client = cred.session(region).client('ec2')
-            
-            # Apparently describe_key_pairs does not paginate 
-            # API response structure: {'Keypairs: [{{'KeyPairId': str, 'KeyType': str, 'Tags': array, 'CreateTime': datetime, 'KeyName':  str, 'KeyFingerprint': str}]}
-            res = client.describe_key_pairs()
-            pairs = res.get('KeyPairs', [])
+            # Key pairs of the region from a fresh inventory listing, if available
+            pairs = self.query_inventory('key_pairs', region)
+            if pairs == None:
+                client = cred.client('ec2', region)
+
+                # Apparently describe_key_pairs does not paginate
+                # API response structure: {'Keypairs: [{{'KeyPairId': str, 'KeyType': str, 'Tags': array, 'CreateTime': datetime, 'KeyName':  str, 'KeyFingerprint': str}]}
+                res = client.describe_key_pairs()
+                pairs = [normalize_key_pair(entry) for entry in res.get('KeyPairs', [])]
+                self.record_inventory('key_pairs', region, pairs)
 
             for entry in pairs:
-                key_name = entry.get('KeyName', None)
-                fingerprint = entry.get('KeyFingerprint', None)
+                key_name = entry.get('name', None)
+                fingerprint = entry.get('fingerprint', None)
 
                 if fingerprint in accumulator.keys():
                     accumulator[fingerprint][region] = key_name
@@ -237,45 +242,15 @@ class Module(AWSModule):
 
     def get_instance_ips(self, instance: dict) -> list[str]:
         '''Return all unique IP address for an instance's network interfaces / IP associations'''
-        ips = []
         try:
-            # Top-level IPv4/IPv6
-            ips.append(instance.get('PrivateIpAddress', None))
-            ips.append(instance.get('PublicIpAddress', None))
-            ips.append(instance.get('Ipv6Address', None))
-
-            # Walk network interfaces
-            for ni in instance.get('NetworkInterfaces', []) or []:
-                # Interface primary private IP
-                ips.append(ni.get('PrivateIpAddress', None))
-
-                # Interface association-level addresses
-                assoc = ni.get('Association', {}) or {}
-                ips.append(assoc.get('PublicIp', None))
-                ips.append(assoc.get('CarrierIp', None))
-                ips.append(assoc.get('CustomerOwnedIp', None))
-                # Any explicitly listed private IPs (and their associations)
-                for pip in ni.get('PrivateIpAddresses', []) or []:
-                    ips.append(pip.get('PrivateIpAddress', None))
-                    
-                    private_assoc = pip.get('Association', {}) or {}
-                    ips.append(private_assoc.get('PublicIp', None))
-                    ips.append(private_assoc.get('CarrierIp', None))
-                    ips.append(private_assoc.get('CustomerOwnedIp', None))
-
-                # IPv6 addresses on the interface
-                for ipv6 in ni.get('Ipv6Addresses', []) or []:
-                    ips.append(ipv6.get('Ipv6Address', None))
+            # Top-level, network interface, and association addresses
+            return instance_addresses(instance)
 
         except Exception as err:
             self.print_failure(f'Failed to retrieve instance IP addresses')
             if self.verbose:
                 self.print_error(str(err))
-        
-        # Unique and remove None values
-        uniqued = set(ips)
-        uniqued.discard(None)
-        return list(uniqued)
+            return []
 
 
     def format_sg_rules(self, ruleset: list[dict]) -> list[str]:
@@ -366,7 +341,7 @@ class Module(AWSModule):
         cred = self.get_cred()
 
         try:
-            client = cred.session(region).client('ec2')
+            client = cred.client('ec2', region)
             res = client.describe_security_groups(GroupIds=groups)
 
             sgs = res.get('SecurityGroups', [])
@@ -389,36 +364,43 @@ class Module(AWSModule):
 
         instances = []
         try:
-            client = cred.session(region).client('ec2')
-            paginator = client.get_paginator('describe_instances')
-
-            for page in paginator.paginate():
-                for reservation in page.get('Reservations', []):
-                    for inst in reservation.get('Instances', []):
-                        # Key pair
-                        key_name = inst.get('KeyName', None)
-                        if key_name not in keynames: continue
-
-                        # If it is in keynames, we have a match!
-                        instance_id = inst.get('InstanceId', None)
-                        instance_arn = f'arn:aws:ec2:{region}:{cred.account_id}:instance/{instance_id}'
-                        instance_profile = inst.get('IamInstanceProfile', {}).get('Arn', None)
-                        instance_state = inst.get('State', {}).get('Name', 'unknown')
-                        instance_platform = inst.get('Platform', 'Linux') # 'Windows' or None as per docs
-                        ip_addresses = self.get_instance_ips(inst)
-                        instance_sgs = [sg.get('GroupId', None) for sg in inst.get('SecurityGroups', []) or []]
-                        instance_info = {
-                            'KeyName': key_name,
-                            'InstanceId': instance_id,
-                            'InstanceArn': instance_arn,
-                            'InstanceProfile': instance_profile,
-                            'IpAddresses': ip_addresses,
-                            'InstanceState': instance_state,
-                            'InstancePlatform': instance_platform,
-                            'InstanceSecurityGroups': instance_sgs
-                        }
-
-                        instances.append(instance_info)
+            # Indexed lookup of instances launched with the key names when the region's inventory is fresh
+            matched = []
+            for key_name in keynames:
+                found = self.query_inventory('instances', region, key_name=key_name)
+                if found == None:
+                    matched = None
+                    break
+                matched.extend(found)
+
+            if matched == None:
+                client = cred.client('ec2', region)
+                paginator = client.get_paginator('describe_instances')
+
+                region_instances = []
+                for page in paginator.paginate():
+                    for reservation in page.get('Reservations', []):
+                        for inst in reservation.get('Instances', []):
+                            if inst.get('InstanceId', None) == None: continue
+                            region_instances.append(normalize_instance(inst, region, cred.account_id))
+
+                self.record_inventory('instances', region, region_instances)
+                matched = [inst for inst in region_instances if inst.get('key_name') in keynames]
+
+            for inst in matched:
+                # If it is in keynames, we have a match!
+                instance_info = {
+                    'KeyName': inst.get('key_name'),
+                    'InstanceId': inst.get('instance_id'),
+                    'InstanceArn': inst.get('arn'),
+                    'InstanceProfile': inst.get('instance_profile'),
+                    'IpAddresses': inst.get('addresses') or [],
+                    'InstanceState': inst.get('state'),
+                    'InstancePlatform': inst.get('platform'),
+                    'InstanceSecurityGroups': inst.get('security_groups') or []
+                }
+
+                instances.append(instance_info)
 
         except Exception as err:
             self.print_failure(f'Exception thrown when performing ec2:DescribeInstances in region {region}')
@@ -460,6 +442,25 @@ class Module(AWSModule):
                 self.print_warning(f'({inst_id}) No rules found or error encountered when inspecting security groups')
 
 
+    def collect_regional_keypairs(self, region: str) -> dict:
+        '''Return {fingerprint: {region: key_name}} for keypairs within a region'''
+        regional_keypairs = {}
+        self.get_regional_keypair_fingerprints(region, regional_keypairs)
+        return regional_keypairs
+
+
+    def report_region_matches(self, region: str, key_names: list) -> None:
+        '''Search ec2 instances within a region for the matched key names and report them'''
+        matched_instances = self.check_ec2_instances_for_keypair(region, key_names)
+
+        if len(matched_instances) > 0:
+            for inst in matched_instances:
+                self.report_instance_match(inst)
+
+        else:
+            self.print_failure(f'No matching instances found within region {region}')
+
+
     def run(self) -> None:
         keys = self.parse_provided_keys()
         regions = self.get_regions()
@@ -492,24 +493,16 @@ class Module(AWSModule):
 
         # Check if keys exist in EC2 that match the fingerprint
         deployed_keypairs = {}
-        for region in regions:
-            self.get_regional_keypair_fingerprints(region, deployed_keypairs)
+        for regional_keypairs in self.map_regions(self.collect_regional_keypairs, regions).values():
+            for fingerprint, names in (regional_keypairs or {}).items():
+                deployed_keypairs[fingerprint] = deployed_keypairs.get(fingerprint, {}) | names
             
         self.print_status(f'Identified {len(deployed_keypairs.keys())} total unique keypairs within the account')
 
         matches = self.match_fingerprints(key_fingerprints, deployed_keypairs)
 
         # Search ec2 instances within matched regions for the key
-        for region, keypair in matches.items():
-            key_names = matches[region].keys()
-            matched_instances = self.check_ec2_instances_for_keypair(region, key_names)
-
-            if len(matched_instances) > 0:
-                for inst in matched_instances:
-                    self.report_instance_match(inst)
-
-            else:
-                self.print_failure(f'No matching instances found within region {region}')
+        self.map_regions(lambda region: self.report_region_matches(region, matches[region].keys()), list(matches.keys()))
 
             # ec2:DescribeInstances (paginated) to determine if an instance was run with that key fingerprint (might need to match on the key name)
 
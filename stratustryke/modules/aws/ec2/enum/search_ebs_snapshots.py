@@ -29,7 +29,7 @@ class Module(AWSModule):
         '''ec2:DescribeSnapshots in a region filtering on the owner-id as the target'''
         snapshots = []
         try:
-            client = self.get_cred.session(region).client('ec2')
+            client = self.get_cred().client('ec2', region)
 
             paginator = client.get_paginator('describe_snapshots')
             pages = paginator.paginate(Filters=[{
@@ -49,30 +49,33 @@ class Module(AWSModule):
     def run(self):
 
         targets = self.get_opt_multiline(Module.OPT_TARGET_ACCOUNT_ID)
-        regions = self.get_regions()
 
         self.print_status(f'Searching for snapshots with owner ids: {targets}')
-        for region in regions:
-            if self.verbose: self.print_status(f'Filtering ec2:DescribeSnapshots in {region} on target owners')
-            
-            snapshots = self.search_for_public_snapshots(region, targets)
-
-            snapshot_count = len(snapshots)
-            if snapshot_count < 1:
-                self.print_warning(f'No snapshots found in {region} for account(s) {", ".join(targets)}')
-                continue
-
-            for snap in snapshots:
-                enc = 'Encrypted' if (snap.get('Encrypted', False)) else 'Unencrypted'
-                snap_id = snap.get('SnapshotId', None)
-                owner_id = snap.get('OwnerId', 'UNKNOWN')
-                size = snap.get('VolumeSize', -1)
-                desc = snap.get('Description', '')
-                snap_arn = f'arn:aws:ec2:{region}:{owner_id}:snapshot/{snap_id}'
+        self.map_regions(lambda region: self.report_region(region, targets))
+        
+        return
+
+
+    def report_region(self, region: str, targets: list[str]) -> None:
+        '''Search a region for public snapshots owned by the target account(s) and print them'''
+        if self.verbose: self.print_status(f'Filtering ec2:DescribeSnapshots in {region} on target owners')
+        
+        snapshots = self.search_for_public_snapshots(region, targets)
+
+        snapshot_count = len(snapshots)
+        if snapshot_count < 1:
+            self.print_warning(f'No snapshots found in {region} for account(s) {", ".join(targets)}')
+            return
+
+        for snap in snapshots:
+            enc = 'Encrypted' if (snap.get('Encrypted', False)) else 'Unencrypted'
+            snap_id = snap.get('SnapshotId', None)
+            owner_id = snap.get('OwnerId', 'UNKNOWN')
+            size = snap.get('VolumeSize', -1)
+            desc = snap.get('Description', '')
+            snap_arn = f'arn:aws:ec2:{region}:{owner_id}:snapshot/{snap_id}'
 
             if (snap_id != None):
                 self.print_success(f'({size} GiB | {enc}) {snap_arn}')
                 if desc != '': self.print_success(f'({snap_id}) Description: {desc}')
-        
-        return
 
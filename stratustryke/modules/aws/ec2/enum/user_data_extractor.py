@@ -4,6 +4,7 @@ from pathlib import Path
 from re import fullmatch
 
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.inventory import normalize_instance
 from stratustryke.lib import module_data_dir
 from stratustryke.settings import AWS_DEFAULT_ENABLED_REGIONS
 
@@ -69,6 +70,10 @@ class Module(AWSModule):
         for page in pages:
             reservations = page.get('Reservations', [])
             for r in reservations: instances.extend(r.get('Instances', []))
+
+        # Store what was described in the inventory; only an unfiltered listing replaces the region's instances
+        rows = [normalize_instance(i, region, account) for i in instances if i.get('InstanceId', None) != None]
+        self.record_inventory('instances', region, rows, complete=(targets == None and not only_running), account=account)
         
         for i in instances:
             # Instance Id / derive instance ARN
@@ -154,7 +159,7 @@ class Module(AWSModule):
 
         if '__DEFAULT__' in ret.keys():
             ids = ret.pop('__DEFAULT__')
-            for region in AWS_DEFAULT_ENABLED_REGIONS: ret[region] = ret[region] | ids
+            for region in AWS_DEFAULT_ENABLED_REGIONS: ret[region] = ret.get(region, set()) | ids
             
         
         return ret
@@ -178,6 +183,18 @@ class Module(AWSModule):
         return None
 
 
+    def extract_region(self, region: str) -> None:
+        '''Describe all instances in a region and save each instance's user data'''
+        instances = self.describe_instances(region, None)
+        
+        for instance in instances:
+            content = self.get_user_data(region, instance)
+
+            if content != None: self.write_user_data(instance, content)
+            
+            else: self.print_warning(f'No user data found for {instance}')
+
+
     def run(self) -> None:
 
         targets = self.get_opt_multiline(Module.OPT_TARGET_INSTANCE)
@@ -186,17 +203,7 @@ class Module(AWSModule):
         if targets == None:
             if self.verbose: self.print_status('No targets specified, attempting to retrieve all instances...')
 
-            for region in self.get_regions():
-                
-
-                instances = self.describe_instances(region)
-                
-                for instance in instances:
-                    content = self.get_user_data(region, instance)
-
-                    if content != None: self.write_user_data(instance, content)
-                    
-                    else: self.print_warning(f'No user data found for {instance}')
+            self.map_regions(self.extract_region)
             
 
         # Target Arns / Ids specified
@@ -204,20 +211,20 @@ class Module(AWSModule):
             targets = self.parse_target_instances(targets)
             individual_calls = self.get_opt(Module.OPT_INDIVIDUAL_CALLS)
 
-            for region, target_ids in targets.keys():
+            for region, target_ids in targets.items():
                 self.print_status(f'Enumerating information for target instances in {region}...')
 
                 if individual_calls: # One-by-one in case we can describe some, but not all
-                    for target in target_ids: self.describe_instances(region, target_ids=target)
+                    for target in target_ids: self.describe_instances(region, target)
 
-                else: instances = self.describe_instances(region, target_ids=list(target_ids))
+                else: self.describe_instances(region, list(target_ids))
 
                 # Likely poor handling for instances that don't exist. But whatever...
                 # Todo: come back to this and skip instances that didn't have a describe call response?
                 for target in target_ids:
                     content = self.get_user_data(region, target)
-                    if content != None: self.write_user_data(instance, content)
-                    else: self.print_warning(f'No user data found for {instance}')
+                    if content != None: self.write_user_data(target, content)
+                    else: self.print_warning(f'No user data found for {target}')
 
 
         return None
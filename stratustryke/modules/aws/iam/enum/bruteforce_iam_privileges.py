@@ -1,7 +1,11 @@
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.ratelimit import is_throttle
 import botocore
 
 class Module(AWSModule):
+
+    CACHE_API_RESPONSES = False # a cached response would report a privilege the current keys may not have
+
     def __init__(self, framework) -> None:
         super().__init__(framework)
         self._info = {
@@ -15,6 +19,9 @@ class Module(AWSModule):
         }
 
         self.set_opt(Module.OPT_VERBOSE, True) # Default to true for this one
+        # Services without an endpoint in the region fail to connect; don't spend the default connect timeout on each call.
+        # Retries are left to the framework config so throttled calls are still retried rather than reported as failures
+        self.set_opt(Module.OPT_CONNECT_TIMEOUT, '3')
 
 
     @property
@@ -22,30 +29,41 @@ class Module(AWSModule):
         return f'aws/iam/enum/{self.name}'
 
 
+    def checkpoint_scope(self) -> dict:
+        '''Privileges belong to the calling principal, so checkpoints are kept per principal rather than shared by options'''
+        scope = super().checkpoint_scope()
+        try:
+            scope['principal'] = self.get_cred().arn
+        except Exception: # keys can't call sts:GetCallerIdentity; fall back to the access key id
+            scope['principal'] = None
+        if scope['principal'] == None: scope['principal'] = self.get_opt(Module.OPT_ACCESS_KEY)
+        return scope
+
+
     def run(self):
         regions = self.get_regions(False)
         cred = self.get_cred()
 
-        total = sum([len(BRUTEFORCE_TESTS[key]) for key in BRUTEFORCE_TESTS.keys()])
-        percentiles = [int(total* (i * 0.05)) for i in range (1, 21)]
-
-        session = cred.session(regions[0])
-        i = 0
+        # Each service:api_call check is a checkpoint unit; checks completed by an interrupted run are skipped on resume
+        checkpoint = self.checkpoint()
+        units = dict.fromkeys(f'{service}:{apicall}' for service, calls in BRUTEFORCE_TESTS.items() for apicall in calls) # some calls are listed twice
+        remaining = set(checkpoint.pending(list(units)))
+        total = len(remaining)
+        progress = self.progress(total, 'checks', steps=20)
 
         self.print_status(f'Enumerating API privileges with region {regions[0]}...')
         self.print_status(f'Attempting {total} total API calls')
         # Iterate through services
         for service in BRUTEFORCE_TESTS.keys():
-            calls = BRUTEFORCE_TESTS[service]
+            calls = [apicall for apicall in dict.fromkeys(BRUTEFORCE_TESTS[service]) if f'{service}:{apicall}' in remaining]
+            if len(calls) == 0: continue
 
             try:
-                client = session.client(str(service))
+                client = cred.client(str(service), regions[0])
             except Exception as err:
                 self.framework._logger.error(f'Unable to create boto3 client for service \'{service}\'')
-                for j in range (0, len(calls)):
-                    i += 1
-                    if i in percentiles:
-                        self.print_status(f'[{i} / {total}] checks completed')
+                for apicall in calls: checkpoint.complete(f'{service}:{apicall}')
+                progress.advance(len(calls))
                 continue
 
             # Iterate through API calls in a service
@@ -61,27 +79,43 @@ class Module(AWSModule):
                     else:
                         res = api_function()
                     
-                    self.print_success(f'{service}:{"".join(split)}')
+                    self.emit('privilege', f'{service}:{"".join(split)}', service=service, action=''.join(split))
+                    checkpoint.complete(f'{service}:{apicall}')
 
-                except (botocore.exceptions.ClientError, botocore.exceptions.EndpointConnectionError,
-                        botocore.exceptions.ConnectTimeoutError, botocore.exceptions.ReadTimeoutError):
-                    
+                except botocore.exceptions.ClientError as err:
+                    error = err.response.get('Error', {}).get('Code', None)
+                    status = err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', None)
+                    if is_throttle(status, error): # still throttled after retries; left incomplete so 'run --resume' retries the check
+                        self.print_error(f'{service}:{"".join(split)} throttled ({error})')
+                        self.framework._logger.error(f'{service}:{"".join(split)} throttled ({error}).')
+                    else:
+                        if self.verbose:
+                            self.print_failure(f'{service}:{"".join(split)}')
+                        self.framework._logger.error(f'{service}:{"".join(split)} failed.')
+                        checkpoint.complete(f'{service}:{apicall}')
+
+                except botocore.exceptions.EndpointConnectionError: # no endpoint for the service in this region
                     if self.verbose:
                         self.print_failure(f'{service}:{"".join(split)}')
                     self.framework._logger.error(f'{service}:{"".join(split)} failed.')
+                    checkpoint.complete(f'{service}:{apicall}')
+
+                except (botocore.exceptions.ConnectTimeoutError, botocore.exceptions.ReadTimeoutError) as err: # left incomplete for 'run --resume'
+                    self.print_error(f'{service}:{"".join(split)} timed out')
+                    self.framework._logger.error(f'{service}:{"".join(split)} timed out: {err}')
 
                 except botocore.exceptions.ParamValidationError:
                     self.framework._logger.error(f'botocore.exceptions.ParamValidationError raised in {service}:{"".join(split)} call.')
+                    checkpoint.complete(f'{service}:{apicall}')
 
-                except Exception as err:
+                except Exception as err: # unexpected failure; left incomplete so 'run --resume' retries the check
                     self.print_error(f'{err}')
-                    self.framework._logger.err(f'{err}')
-                
-                
-                i += 1
-                if i in percentiles:
-                    self.print_status(f'[{i} / {total}] checks completed')
+                    self.framework._logger.error(f'{err}')
+
+
+                progress.advance()
 
+        progress.finish()
         return True
 
 
@@ -1,7 +1,10 @@
 
 from pathlib import Path
 
+from botocore.exceptions import ClientError
+
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.ratelimit import is_throttle
 from stratustryke.lib import StratustrykeException
 
 class Module(AWSModule):
@@ -79,28 +82,42 @@ class Module(AWSModule):
             wordlist = [line.strip() for line in file.readlines()]
         self.print_status(f'Loaded {len(wordlist)} entries from {path}')        
         
-        # Now enumerate the IAM principles
+        # Now enumerate the IAM principles; names completed by an interrupted run are skipped on resume
+        checkpoint = self.checkpoint()
         self.print_status(f'Enumerating IAM principles in account: {account}')
-        for principle in wordlist:
-            user_policy = self.get_policy('user', principle)
-            role_policy = self.get_policy('role', principle)
-
+        for principle in checkpoint.pending(wordlist):
             client = session.client('s3')
+            done = True # only names with a definitive answer for both principal types are checkpointed
+
+            for principal_type in ['user', 'role']:
+                arn = f'arn:aws:iam::{account}:{principal_type}/{principle}'
+                exists = self.principal_exists(client, bucket, self.get_policy(principal_type, principle), arn)
+
+                if exists == True:
+                    self.emit('principal', arn, arn=arn, account=account, principal_type=principal_type)
+                elif exists == False:
+                    if verbose: self.print_failure(arn)
+                    self.framework._logger.info(f'Principle does not exist: {arn}')
+                else: done = False
+
+            if done: checkpoint.complete(principle)
+
+
+    def principal_exists(self, client, bucket: str, policy: str, arn: str) -> bool:
+        '''s3:PutBucketPolicy with a policy naming the principal; True if accepted, False if rejected as an invalid principal
+        (MalformedPolicy), or None if the call failed for any other reason (e.g., throttling) and the name should be retried'''
+        try:
+            client.put_bucket_policy(Bucket=bucket, Policy=policy)
+            return True
+
+        except ClientError as err:
+            code = err.response.get('Error', {}).get('Code', None)
+            if code == 'MalformedPolicy': return False
+            if is_throttle(err.response.get('ResponseMetadata', {}).get('HTTPStatusCode', None), code):
+                self.print_error(f'Throttled checking {arn}; it will be retried on resume')
+            else: self.print_error(f'Unable to check {arn}: {err}')
+
+        except Exception as err:
+            self.print_error(f'Unable to check {arn}: {err}')
 
-            try:
-                client.put_bucket_policy(Bucket=bucket, Policy=user_policy)   
-                self.print_success(f'arn:aws:iam::{account}:user/{principle}')
-            except Exception:
-                if verbose:
-                    self.print_failure(f'arn:aws:iam::{account}:user/{principle}')
-                self.framework._logger.info(f'Principle does not exist: arn:aws:iam::{account}:user/{principle}')
-
-            try:
-                client.put_bucket_policy(Bucket=bucket, Policy=role_policy)
-                self.print_success(f'arn:aws:iam::{account}:role/{principle}')
-            except Exception:
-                if verbose:
-                    self.print_failure(f'arn:aws:iam::{account}:role/{principle}')
-                self.framework._logger.info(f'Principle does not exist: arn:aws:iam::{account}:user/{principle}')
-
-        
\ No newline at end of file
+        return None
@@ -20,7 +20,7 @@ class Module(AWSModule):
     def run(self):
         region = self.get_regions(multi_support=False)[0]
         try:
-            client = self.get_cred().session(region).client('sts')
+            client = self.get_cred().client('sts', region)
             res = client.get_caller_identity()
 
             arn = res.get('Arn', res.get('UserId', None))
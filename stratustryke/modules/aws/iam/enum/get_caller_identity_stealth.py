@@ -34,7 +34,7 @@ class Module(AWSModule):
         topic_arn = f'arn:aws:sns:{region}:{acc_id}:{topic}'
 
         try:
-            client = self.get_cred().session(region).client('sns')
+            client = self.get_cred().client('sns', region)
 
             self.print_status('Attempting sns:Publish call...')
             res = client.publish(TopicArn=topic_arn, Message='sns-message-stratustryke')
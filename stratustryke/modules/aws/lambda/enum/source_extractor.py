@@ -1,8 +1,7 @@
 from stratustryke.core.module.aws import AWSModule
+from stratustryke.core.inventory import normalize_function
 from pathlib import Path
-from stratustryke.lib import module_data_dir
-import requests
-import urllib3
+from stratustryke.lib import module_data_dir, StratustrykeException
 
 class Module(AWSModule):
 
@@ -32,10 +31,11 @@ class Module(AWSModule):
         return f'aws/lambda/enum/{self.name}'
     
 
-    def list_lambdas(region: str, self) -> list:
+    def list_lambdas(self, region: str) -> list:
         '''List lambdas in the region, return list of function names with the given prefix. If list operation fails, return ["LAMBDA_PREFIX"]'''
         session  = self.get_cred().session(region)
         lambdas = []
+        listed = [] # every function listed, stored in the inventory
 
         prefix = self.get_opt(Module.OPT_LAMBDA_PREFIX)
         if prefix == None: prefix = ''
@@ -50,6 +50,7 @@ class Module(AWSModule):
             for page in pages:
                 funcs = page.get('Functions')
                 for function in funcs:
+                    listed.append(normalize_function(function))
                     arn = function.get('FunctionArn', None)
                     name = function.get('FunctionName', None)
                     envs = function.get('Environment', {}).get('Variables', None)
@@ -71,10 +72,12 @@ class Module(AWSModule):
                         if self.verbose and desc != None and desc != '':
                             self.print_success(f'({name}) Function Description: {desc}')
 
+            self.record_inventory('functions', region, listed, account=self.function_account(listed))
 
         except Exception as err:
             self.print_failure(f'Exception thrown during lambda:ListFunctions in {region}')
             if self.verbose: self.print_error(str(err))
+            if listed != []: self.record_inventory('functions', region, listed, complete=False, account=self.function_account(listed))
 
             if lambdas == []:
                 self.print_warning(f'Attempting to continue with source extraction for \'{prefix}\'')
@@ -85,6 +88,11 @@ class Module(AWSModule):
         return lambdas
     
 
+    def function_account(self, functions: list) -> str:
+        '''Account id of listed functions from their ARN (arn:aws:lambda:<region>:<account>:function:<name>)'''
+        return functions[0]['arn'].split(':')[4] if (len(functions) > 0) else None
+
+
     def get_presigned_url(self, region: str, name: str) -> str:
         '''Retrieve pre-signed URL for the lambda source'''
         presigned_url = None
@@ -111,12 +119,9 @@ class Module(AWSModule):
         if self.get_opt(Module.OPT_NO_DOWNLOAD): return True
 
         try:
-            # Make sure to conform to framework HTTP proxy settings
-            HTTP_PROXY = self.web_proxies
-            HTTP_VERIFY_SSL = self.framework._config.get_val(self.framework.CONF_HTTP_VERIFY_SSL)
-            urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-
-            res = requests.get(s3_url, stream=True, proxies=HTTP_PROXY, verify=HTTP_VERIFY_SSL)
+            # Framework transport conforms to HTTP proxy / TLS verification settings
+            res = self.http_request('GET', s3_url, stream=True)
+            if res == None: raise StratustrykeException('HTTP request for pre-signed URL failed')
             res.raise_for_status()
 
             download_path = str(Path(download_dir).resolve().absolute())
@@ -137,14 +142,18 @@ class Module(AWSModule):
         return True
 
     
-    def run(self):
+    def extract_region(self, region: str) -> None:
+        '''List lambda functions in a region and extract source for each'''
+        matches = self.list_lambdas(region)
+        self.print_status(f'Attempting to extract code for {len(matches)} function(s)...')
 
-        for region in self.get_regions():
-            matches = self.list_lambdas(region)
-            self.print_status(f'Attempting to extract code for {len(matches)} function(s)...')
+        for func in matches:
+            self.download_source(region, func)
+
+
+    def run(self):
 
-            for func in matches:
-                self.download_source(region, func)
+        self.map_regions(self.extract_region)
 
         return None
         
\ No newline at end of file
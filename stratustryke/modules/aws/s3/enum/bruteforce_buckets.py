@@ -3,30 +3,51 @@ from pathlib import Path
 
 from stratustryke.core.module import StratustrykeModule
 from stratustryke.lib import stratustryke_dir
+from stratustryke.lib.mutations import bucket_candidates, parse_shard
 
 
+# Bucket probes are path-style (endpoint/bucket) so every request goes to one host and reuses pooled keep-alive connections
+S3_ENDPOINT = 'https://s3.amazonaws.com'
+S3_REGIONAL_ENDPOINT = 'https://s3.{region}.amazonaws.com'
+S3_REGION_HEADER = 'x-amz-bucket-region'
 
+# HEAD bucket statuses that answer whether a bucket exists; 503 (SlowDown) is S3's throttling response
+S3_PROBE_STATUS = {301, 307, 400, 403, 404}
+S3_THROTTLE_STATUS = {503}
 
-# Todo: Multithread / multiprocess to increase speed
 
 class Module(StratustrykeModule):
 
     OPT_KEYWORD = 'KEYWORD'
     OPT_MUTATIONS = 'MUTATIONS'
     OPT_THREADS = 'THREADS'
+    OPT_SEPARATORS = 'SEPARATORS'
+    OPT_YEARS = 'YEARS'
+    OPT_ENVIRONMENTS = 'ENVIRONMENTS'
+    OPT_SHARD = 'SHARD'
+    OPT_ENDPOINT = 'ENDPOINT'
+
+    # Advanced options that change the candidates a run checks; separate shards / year ranges keep separate checkpoints
+    CHECKPOINT_ADVANCED_OPTIONS = (OPT_SEPARATORS, OPT_YEARS, OPT_ENVIRONMENTS, OPT_SHARD, OPT_ENDPOINT)
 
     def __init__(self, framework) -> None:
         super().__init__(framework)
         self._info = {
             'Authors': ['@vexance'],
             'Description': 'Enumerate valid S3 buckets from a provided wordlist',
-            'Details': 'Performs a series of HTTP/S requests to various public AWS / S3 endpoints and analyzes the response to determine whether the bucket exists and whether it is public.',
+            'Details': 'Sends concurrent unauthenticated HEAD requests for each candidate bucket to the global S3 endpoint. The response status / headers indicate whether the bucket exists, its region, and whether its contents can be listed publicly; response bodies are never read.',
             'References': ['https://github.com/initstring/cloud_enum']
         }
 
         self._options.add_string(Module.OPT_KEYWORD, 'Individual keyword to mutate (overriden by KEYWORD_FILE)', True)
         self._options.add_string(Module.OPT_MUTATIONS, 'File containing list of strings to pre/append to keyword(s)', True, default=str(stratustryke_dir()/'data/multi/cloud_storage_mutations.txt'))
-        self._options.add_integer(Module.OPT_THREADS, '(WIP) Number of threads to use [1-10]', True, 1)
+        self._options.add_integer(Module.OPT_THREADS, 'Number of concurrent requests [1-256]', True, 32)
+
+        self._advanced.add_string(Module.OPT_SEPARATORS, 'Characters placed between keywords and mutations, in addition to direct concatenation', False, '.-')
+        self._advanced.add_string(Module.OPT_YEARS, 'Range of years (YYYY-YYYY) to also join to keywords', False, None, '^([0-9]{4}(-[0-9]{4})?)?$')
+        self._advanced.add_boolean(Module.OPT_ENVIRONMENTS, 'When enabled, also join common environment names (dev, prod, staging, ...) to keywords', False, False)
+        self._advanced.add_string(Module.OPT_SHARD, 'Only check shard N of M (N/M) of the candidate names, so separate runs can split the work', False, None, '^([0-9]+/[0-9]+)?$')
+        self._advanced.add_string(Module.OPT_ENDPOINT, f'S3 endpoint URL to send bucket probes to [default: {S3_ENDPOINT}]', False, None, '^(https?://[^/]+/?)?$')
 
     @property
     def search_name(self) -> str:
@@ -37,97 +58,102 @@ class Module(StratustrykeModule):
         if not valid:
             return (valid, msg)
 
-        key = self.get_opt(Module.OPT_KEYWORD)
-        filename = filename if (Path.exists(filename)) else None
-        if filename != None:
-            if not (Path(filename).exists() and Path(filename).is_file()):
-                return (False, f'Cannot find keyword file \'{filename}\'')
-        
         perms = self.get_opt(Module.OPT_MUTATIONS)
         if not (Path(perms).exists() and Path(perms).is_file()):
             return (False, 'Cannot find specified permutations file')
 
         threads = self.get_opt(Module.OPT_THREADS)
-        if not threads in range(1, 11):
-            return (False, f'Invalid number of threads not in range 1 - 10: {threads}')
+        if not threads in range(1, 257):
+            return (False, f'Invalid number of threads not in range 1 - 256: {threads}')
 
         return (True, None)
 
 
-    def permutate(self, keywords: list, permutations: list) -> list:
+    def candidates(self, keywords: list, mutations: list):
         '''
-        :param keywords: list[str] keywords to permutate
-        :param permutations: list[str] permutation to apply to keywords
-        :return: list[str] permutated keywords'''
-        out = []
-        for word in keywords:
-            out.append(word)
-            for mutation in permutations:
-                out.append(f'{word}{mutation}')
-                out.append(f'{word}.{mutation}')
-                out.append(f'{word}-{mutation}')
-                out.append(f'{mutation}{word}')
-                out.append(f'{mutation}.{word}')
-                out.append(f'{mutation}-{word}')
-
-        return out
+        :param keywords: list[str] keywords to mutate
+        :param mutations: list[str] mutations to join to keywords
+        :return: CandidateGenerator lazily yielding unique, valid bucket names'''
+        separators = ('',) + tuple(self.get_opt(Module.OPT_SEPARATORS) or '')
+        return bucket_candidates(keywords, mutations, 'aws', separators, self.get_opt(Module.OPT_YEARS), self.get_opt(Module.OPT_ENVIRONMENTS))
 
     def run(self):
-        kw = self.get_opt(Module.OPT_KEYWORD)
-
-        is_pasted = self._options.get_opt(Module.OPT_KEYWORD)._pasted
-        if is_pasted: # paste command was used
-            keywords = self.load_strings(kw, is_paste=True)
-        elif Path.exists(Path(kw)): # filepath specified
-            keywords = self.load_strings(kw)
-        else:
-            keywords = [kw]
-
-        perm_file = self.get_opt(Module.OPT_MUTATIONS)
-        is_pasted = self._options.get_opt(Module.OPT_MUTATIONS)._pasted
-
-        if is_pasted: # paste command was used
-            mutations = self.load_strings(perm_file, is_paste=True)
-        elif Path.exists(Path(perm_file)): # filepath specified
-            mutations = self.load_strings(perm_file)
-        else:
-            mutations = [perm_file]
-        
-        # Remove dunplicates / empty lines from keywords and mutations
-        if len(keywords) > 1:
-            keywords = sorted(set(keywords), key = lambda idx: keywords.index(idx))
-            if ('' in keywords): keywords.remove('')
-        if len(mutations) > 1:
-            mutations = sorted(set(mutations), key = lambda idx: mutations.index(idx))
-            if ('' in mutations): mutations.remove('')
-
+        # Streamed and deduplicated (blank lines dropped) in order
+        keywords = list(self.iter_opt_lines(Module.OPT_KEYWORD, unique=True))
+        mutations = list(self.iter_opt_lines(Module.OPT_MUTATIONS, unique=True))
 
-        if (keywords == None or mutations == None): # error reading from the files; already printed error
+        if (len(keywords) == 0 or len(mutations) == 0): # empty input or error reading from the files; already printed error
             return False
         
-        self.print_status('Creating mutated wordlist...')
-        wordlist = self.permutate(keywords, mutations)
+        candidates = self.candidates(keywords, mutations)
+        shard, shards = parse_shard(self.get_opt(Module.OPT_SHARD))
         threads = self.get_opt(Module.OPT_THREADS)
 
-        total = len(wordlist)
-        percentiles = [int(total* (i * 0.1)) for i in range (1, 11)]
-        self.print_status(f'Prepared {total} total mutations; beginning enumeration...')
-        
-        for i in range(0,len(wordlist)):
-            if i in percentiles:
-                self.print_status(f'Completed [{i}/{total}] total requests')
-            url = f'http://{wordlist[i]}.s3.amazonaws.com'
-
-            res = self.http_request('GET', url)
-            if not '<Code>NoSuchBucket</Code>' in res.text:
-                if '<Code>AccessDenied</Code>' in res.text:
-                    status = 'protected'
-                else:
-                    status = 'open'
-                self.print_success(f'Identified ({status}) S3 bucket: s3://{wordlist[i]}')
-
-        
+        # Names are generated lazily; counting takes one extra (request-free) pass over them
+        total = candidates.count(shard, shards)
+
+        # Mutations checked by an interrupted run are skipped on resume
+        checkpoint = self.checkpoint()
+        checkpoint.total = total
+        progress = self.progress(total - checkpoint.completed)
+        self.print_status(f'Prepared {total} total mutations ({candidates.dedupe.duplicates} duplicates dropped); beginning enumeration...')
+
+        pool_size = self.framework._config.get_val(self.framework.CONF_HTTP_POOL_MAXSIZE)
+        if threads > pool_size:
+            self.print_warning(f'THREADS ({threads}) exceeds the HTTP_POOL_MAXSIZE config ({pool_size}); connections beyond the pool size are not reused')
+
+        endpoint = (self.get_opt(Module.OPT_ENDPOINT) or S3_ENDPOINT).rstrip('/')
+        pending = (name for name in candidates.candidates(shard, shards) if not checkpoint.is_done(name))
+        probe_args = {'allow_redirects': False, 'expected_status': S3_PROBE_STATUS, 'throttle_status': S3_THROTTLE_STATUS}
+        probes = (('HEAD', f'{endpoint}/{name}', probe_args) for name in pending)
+
+        # Results are reported as each probe completes (not in candidate order)
+        for probe, res in self.http_request_many(probes, concurrency=threads, per_host=threads):
+            progress.advance()
+            name = probe[1].rsplit('/', 1)[-1]
+            status, region = self.classify(res)
+            if status == None: continue # request failed or throttled; left incomplete so 'run --resume' retries it
+
+            if status == 'redirect': # exists in another region; listability is only answered by the bucket's regional endpoint
+                status, region = self.probe_region(name, region, endpoint)
+                if status == None: continue
+
+            if status != 'missing':
+                location = f' ({region})' if (region != None) else ''
+                self.emit('bucket', f'Identified ({status}) S3 bucket: s3://{name}{location}', bucket=name, provider='aws', status=status, region=region)
+            checkpoint.complete(name)
+
+        progress.finish()
         return True
 
 
-
+    def classify(self, res) -> tuple:
+        '''
+        Classify a HEAD bucket response from its status / headers alone\n
+        :param res: requests.Response (or None if the request failed)
+        :return: tuple(status, region) where status is 'open' (contents listable), 'protected' (exists, access denied), 'missing',
+            'redirect' (exists in another region), or None if the response does not answer (failed / throttled / server error)
+        '''
+        if res == None: return (None, None)
+        region = res.headers.get(S3_REGION_HEADER, None)
+        code = res.status_code
+        if code == 404: return ('missing', None)
+        if code == 200: return ('open', region)
+        if code == 403: return ('protected', region)
+        if code in (301, 307) or (code == 400 and region != None): return ('redirect', region) # 400: e.g., opt-in region bucket
+        if code in S3_THROTTLE_STATUS or code >= 500: return (None, None)
+
+        self.log_error(f'Unexpected HTTP {code} response probing bucket: {res.url}')
+        return (None, None)
+
+
+    def probe_region(self, name: str, region: str, endpoint: str) -> tuple:
+        '''Repeat a bucket probe against the bucket's regional endpoint (custom ENDPOINT values are reused as-is); a bucket
+        that still does not answer is reported as protected'''
+        if region == None: return ('protected', None)
+        regional = S3_REGIONAL_ENDPOINT.format(region=region) if (endpoint == S3_ENDPOINT) else endpoint
+        res = self.http_request('HEAD', f'{regional}/{name}', allow_redirects=False, expected_status=S3_PROBE_STATUS, throttle_status=S3_THROTTLE_STATUS)
+        status, regional_region = self.classify(res)
+        if status == None: return (None, region)
+        if status in ('redirect', 'missing'): return ('protected', region)
+        return (status, regional_region or region)
@@ -53,28 +53,11 @@ class Module(AWSModule):
 
 
     def assume_role(self, arn: str, policy: str = None) -> AWSCredential:
-        '''Assumes the specified role with the supplied s3:ResourceAccount policy'''
+        '''Assumes the specified role with the supplied s3:ResourceAccount policy (sessions for a policy are reused while valid)'''
         cred = self.get_cred()
 
         try:
-            session = cred.session()
-            client = session.client('sts')
-
-            if policy:
-                res = client.assume_role(RoleSessionName=f'stratustryke-{self.name}', RoleArn=arn, Policy=policy, DurationSeconds=900)
-
-            else:
-                res = client.assume_role(RoleSessionName=f'stratustryke-{self.name}', RoleArn=arn, DurationSeconds=900)
-
-            creds = res.get('Credentials', {})
-            access_key = creds.get('AccessKeyId', False)
-            secret_key = creds.get('SecretAccessKey', False)
-            token = creds.get('SessionToken', False)
-
-            if not all([access_key, secret_key, token]):
-                raise StratustrykeException(f'Error performing sts:AssumeRole for ARN: {arn}')
-
-            return AWSCredential(f'stratustryke-{self.name}', access_key=access_key, secret_key=secret_key, session_token=token)
+            return cred.assume_role(arn, policy=policy, duration=15, session_name=f'stratustryke-{self.name}', alias=f'stratustryke-{self.name}')
 
         except Exception as err:
             self.print_error(f'{err}')
@@ -87,8 +70,7 @@ class Module(AWSModule):
         prefix = self.get_opt(Module.OPT_S3_OBJECT)
 
         try:
-            session = creds.session()
-            client = session.client('s3')
+            client = creds.client('s3')
 
             if prefix != None:
                 res = client.head_object(Bucket=bucket, Key=prefix)
@@ -1,7 +1,6 @@
 
 import logging
 import datetime
-import requests
 import os
 
 from termcolor import colored
@@ -130,7 +129,7 @@ class S3Bucket():
 def bucket_exists(framework, name: str) -> bool:
     try:
         url = f'http://{name}.s3.amazonaws.com'
-        res = requests.get(url)
+        res = framework.http_request('GET', url)
 
         if '<Code>NoSuchBucket</Code>' in res.text:
             framework.print_failure(f'S3 Bucket {name} does not exist')
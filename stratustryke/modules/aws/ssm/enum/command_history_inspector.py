@@ -57,53 +57,53 @@ class Module(AWSModule):
         return filters
 
 
-    def run(self) -> None:
+    def inspect_region(self, region: str) -> None:
+        '''Inspect ssm command history (command parameters) in a region'''
+        max_items = self.get_opt(Module.MAX_ITEMS) or 100000
+        filters = self.resolve_filter_args()
 
-        regions = self.get_regions()
-        # First, just attempt to describe all stacks
-        
-        for region in regions:
-            max_items = self.get_opt(Module.MAX_ITEMS) or 100000
-            filters = self.resolve_filter_args()
-
-            self.print_status(f'Inspecting ssm command history in region {region}')
-            try:
-                client = self.get_cred().session(region).client('ssm')
-                next_token = ''
-                inspected_items = 0
-                
-                args = {
-                    'Filters': filters,
-                }
-
-                while next_token is not None and inspected_items < max_items:
-                    if next_token != '': args['NextToken'] = next_token
-                    res = client.list_commands(**args)
-
-                    for c in res.get('Commands', []):
-                        cmd_id = c.get('CommandId')
-                        params = c.get('Parameters', {})
-
-                        for key, val in params.items():
-                            self.print_success(f'({region}:{cmd_id}) {key}: {val}')
-                        
-                        if self.verbose:
-                            out_bucket = c.get('OutputS3BucketName', None)
-                            out_prefix = c.get('OutputS3KeyPrefix', None)
-                            if out_bucket is not None and out_prefix is not None:
-                                self.print_status(f'({region}:{cmd_id}) S3 Output prefix: s3://{out_bucket}')
-                        
-                        inspected_items += 1
-                        if not (inspected_items < max_items):
-                            break
-
-                    next_token = res.get('NextToken', None)
-
-                if inspected_items < 1:
-                    self.print_failure(f'No commands matching supplied filters found in region {region}')
-
-
-            except Exception as err:
-                self.print_warning(f'Uncaught exception inspecting command history in {region}')
-                if self.verbose: self.print_error(err)
+        self.print_status(f'Inspecting ssm command history in region {region}')
+        try:
+            client = self.get_cred().client('ssm', region)
+            next_token = ''
+            inspected_items = 0
+
+            args = {
+                'Filters': filters,
+            }
+
+            while next_token is not None and inspected_items < max_items:
+                if next_token != '': args['NextToken'] = next_token
+                res = client.list_commands(**args)
+
+                for c in res.get('Commands', []):
+                    cmd_id = c.get('CommandId')
+                    params = c.get('Parameters', {})
+
+                    for key, val in params.items():
+                        self.print_success(f'({region}:{cmd_id}) {key}: {val}')
+
+                    if self.verbose:
+                        out_bucket = c.get('OutputS3BucketName', None)
+                        out_prefix = c.get('OutputS3KeyPrefix', None)
+                        if out_bucket is not None and out_prefix is not None:
+                            self.print_status(f'({region}:{cmd_id}) S3 Output prefix: s3://{out_bucket}')
+
+                    inspected_items += 1
+                    if not (inspected_items < max_items):
+                        break
+
+                next_token = res.get('NextToken', None)
+
+            if inspected_items < 1:
+                self.print_failure(f'No commands matching supplied filters found in region {region}')
+
+
+        except Exception as err:
+            self.print_warning(f'Uncaught exception inspecting command history in {region}')
+            if self.verbose: self.print_error(err)
+
+
+    def run(self) -> None:
 
+        self.map_regions(self.inspect_region)
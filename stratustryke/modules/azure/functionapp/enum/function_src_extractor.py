@@ -28,11 +28,11 @@ class Module(AzureModule):
     def list_function_apps(self, subscription: str) -> list[str]:
         '''Return list[str] containing resource id paths for function apps in the subscription'''
 
-        token = self.get_cred().access_token(AZ_MGMT_TOKEN_SCOPE)
+        token = self.get_cred().access_token(MicrosoftCredential.AZ_MGMT_TOKEN_SCOPE)
         path = f"subscriptions/{subscription}/providers/Microsoft.Web/sites?api-version=2025-03-01"
         headers = {'Authorization': f'Bearer {token}'}
 
-        res = self.http_request('GET', f'{AZ_MGMT_REST_URL}/{path}', headers=token)
+        res = self.http_request('GET', f'{AZ_MGMT_REST_URL}/{path}', headers=headers)
 
         if not res.ok:
             self.print_error(f'Error during GET /{path}')
@@ -77,7 +77,7 @@ class Module(AzureModule):
     def list_functions_for_app(self, subscription: str, app: dict):
         '''List functions inside a Function App using Web Apps - List Functions.'''
         rg, name = self.parse_rg_and_name(app)
-        token = self.get_cred().access_token(AZ_MGMT_TOKEN_SCOPE)
+        token = self.get_cred().access_token(MicrosoftCredential.AZ_MGMT_TOKEN_SCOPE)
         headers = {'Authorization': f'Bearer {token}'}
         path = f'subscriptions/{subscription}/resourceGroups/{rg}/providers/Microsoft.Web/sites/{name}/functions?api-version=2025-03-1'
 
@@ -92,5 +92,5 @@ class Module(AzureModule):
 
 
     def run(self) -> None:
-        self.auth_token = self.get_cred().access_token(scope=AZ_MGMT_TOKEN_SCOPE)
+        self.auth_token = self.get_cred().access_token(scope=MicrosoftCredential.AZ_MGMT_TOKEN_SCOPE)
         subscriptions = self.get_opt_az_subscription()
\ No newline at end of file
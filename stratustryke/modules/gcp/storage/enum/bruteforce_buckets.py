@@ -1,10 +1,9 @@
 
-import requests
-
 from pathlib import Path
 
 from stratustryke.core.module import StratustrykeModule
 from stratustryke.lib import stratustryke_dir
+from stratustryke.lib.mutations import bucket_candidates, parse_shard
 
 
 class Module(StratustrykeModule):
@@ -12,6 +11,13 @@ class Module(StratustrykeModule):
     OPT_KEYWORD = 'KEYWORD'
     OPT_MUTATIONS = 'MUTATIONS'
     OPT_THREADS = 'THREADS'
+    OPT_SEPARATORS = 'SEPARATORS'
+    OPT_YEARS = 'YEARS'
+    OPT_ENVIRONMENTS = 'ENVIRONMENTS'
+    OPT_SHARD = 'SHARD'
+
+    # Advanced options that change the candidates a run checks; separate shards / year ranges keep separate checkpoints
+    CHECKPOINT_ADVANCED_OPTIONS = (OPT_SEPARATORS, OPT_YEARS, OPT_ENVIRONMENTS, OPT_SHARD)
 
     def __init__(self, framework) -> None:
         super().__init__(framework)
@@ -24,7 +30,12 @@ class Module(StratustrykeModule):
 
         self._options.add_string(Module.OPT_KEYWORD, 'Individual keyword to mutate (overriden by KEYWORD_FILE)', True)
         self._options.add_string(Module.OPT_MUTATIONS, 'File containing list of strings to pre/append to keyword(s)', True, default=str(stratustryke_dir()/'data/multi/cloud_storage_mutations.txt'))
-        self._options.add_integer(Module.OPT_THREADS, '(WIP) Number of threads to use [1-10]', True, 1)
+        self._options.add_integer(Module.OPT_THREADS, 'Number of concurrent requests to use [1-10]', True, 1)
+
+        self._advanced.add_string(Module.OPT_SEPARATORS, 'Characters placed between keywords and mutations, in addition to direct concatenation', False, '.-')
+        self._advanced.add_string(Module.OPT_YEARS, 'Range of years (YYYY-YYYY) to also join to keywords', False, None, '^([0-9]{4}(-[0-9]{4})?)?$')
+        self._advanced.add_boolean(Module.OPT_ENVIRONMENTS, 'When enabled, also join common environment names (dev, prod, staging, ...) to keywords', False, False)
+        self._advanced.add_string(Module.OPT_SHARD, 'Only check shard N of M (N/M) of the candidate names, so separate runs can split the work', False, None, '^([0-9]+/[0-9]+)?$')
 
 
     @property
@@ -53,76 +64,65 @@ class Module(StratustrykeModule):
         return (True, None)
 
 
-    def permutate(self, keywords: list, permutations: list) -> list:
-        ''':param keywords: list[str] keywords to apply permutations to
-        :param permutations: list[str] permutation to apply to keywords
-        :return: list[str] permutated keywords'''
-        out = []
-        for word in keywords:
-            out.append(word)
-            for mutation in permutations:
-                out.append(f'{word}{mutation}')
-                out.append(f'{word}.{mutation}')
-                out.append(f'{word}-{mutation}')
-                out.append(f'{mutation}{word}')
-                out.append(f'{mutation}.{word}')
-                out.append(f'{mutation}-{word}')
+    def candidates(self, keywords: list, mutations: list):
+        '''
+        :param keywords: list[str] keywords to mutate
+        :param mutations: list[str] mutations to join to keywords
+        :return: CandidateGenerator lazily yielding unique, valid bucket names'''
+        separators = ('',) + tuple(self.get_opt(Module.OPT_SEPARATORS) or '')
+        return bucket_candidates(keywords, mutations, 'gcp', separators, self.get_opt(Module.OPT_YEARS), self.get_opt(Module.OPT_ENVIRONMENTS))
 
-        return out
+    def test_permissions(self, name: str) -> list:
+        '''
+        :param name: bucket name
+        :return: list[str] storage permissions the caller has on the bucket, or None if the testPermissions request failed'''
+        res = self.http_request('GET', f'https://www.googleapis.com/storage/v1/b/{name}/iam/testPermissions?permissions=storage.buckets.delete&permissions=storage.buckets.get&permissions=storage.buckets.getIamPolicy&permissions=storage.buckets.setIamPolicy&permissions=storage.buckets.update&permissions=storage.objects.create&permissions=storage.objects.delete&permissions=storage.objects.get&permissions=storage.objects.list&permissions=storage.objects.update')
+        if res == None: return None # error already printed by the framework
+
+        try:
+            permissions = res.json()
+        except ValueError as err: # not JSON (e.g., an HTML error page)
+            self.framework._logger.error(f'Unexpected testPermissions response for bucket {name}: {err}')
+            return None
+
+        return permissions.get('permissions', []) if isinstance(permissions, dict) else None
 
 
     def run(self):
-        kw = self.get_opt(Module.OPT_KEYWORD)
-
-        is_pasted = self._options.get_opt(Module.OPT_KEYWORD)._pasted
-        if is_pasted: # paste command was used
-            keywords = self.load_strings(kw, is_paste=True)
-        elif Path.exists(Path(kw)): # filepath specified
-            keywords = self.load_strings(kw)
-        else:
-            keywords = [kw]
-
-        perm_file = self.get_opt(Module.OPT_MUTATIONS)
-        is_pasted = self._options.get_opt(Module.OPT_MUTATIONS)._pasted
-
-        if is_pasted: # paste command was used
-            mutations = self.load_strings(perm_file, is_paste=True)
-        elif Path.exists(Path(perm_file)): # filepath specified
-            mutations = self.load_strings(perm_file)
-        else:
-            mutations = [perm_file]
-        
-        # Remove dunplicates / empty lines from keywords and mutations
-        if len(keywords) > 1:
-            keywords = sorted(set(keywords), key = lambda idx: keywords.index(idx))
-            if ('' in keywords): keywords.remove('')
-        if len(mutations) > 1:
-            mutations = sorted(set(mutations), key = lambda idx: mutations.index(idx))
-            if ('' in mutations): mutations.remove('')
-
-        if (keywords == None or mutations == None): # error reading from the files; already printed error
+        # Streamed and deduplicated (blank lines dropped) in order
+        keywords = list(self.iter_opt_lines(Module.OPT_KEYWORD, unique=True))
+        mutations = list(self.iter_opt_lines(Module.OPT_MUTATIONS, unique=True))
+
+        if (len(keywords) == 0 or len(mutations) == 0): # empty input or error reading from the files; already printed error
             return False
         
-        self.print_status('Creating mutated wordlist...')
-        wordlist = self.permutate(keywords, mutations)
+        candidates = self.candidates(keywords, mutations)
+        shard, shards = parse_shard(self.get_opt(Module.OPT_SHARD))
         threads = self.get_opt(Module.OPT_THREADS)
 
-        total = len(wordlist)
-        percentiles = [int(total* (i * 0.1)) for i in range (1, 11)]
-        self.print_status(f'Prepared {total} total mutations; beginning enumeration...')
-        
-        for i in range(0,len(wordlist)):
-            if i in percentiles:
-                self.print_status(f'Completed [{i}/{total}] total requests')
-            url = f'https://www.googleapis.com/storage/v1/b/{wordlist[i]}'
+        # Names are generated lazily; counting takes one extra (request-free) pass over them
+        total = candidates.count(shard, shards)
+
+        # Mutations checked by an interrupted run are skipped on resume
+        checkpoint = self.checkpoint()
+        checkpoint.total = total
+        progress = self.progress(total - checkpoint.completed)
+        self.print_status(f'Prepared {total} total mutations ({candidates.dedupe.duplicates} duplicates dropped); beginning enumeration...')
 
-            res = requests.head(url)
+        pending = (name for name in candidates.candidates(shard, shards) if not checkpoint.is_done(name))
+        probes = (('HEAD', f'https://www.googleapis.com/storage/v1/b/{name}') for name in pending)
+        for probe, res in self.http_request_many(probes, concurrency=threads):
+            progress.advance()
+            if res == None: continue # error already printed by the framework; left incomplete so 'run --resume' retries it
+            if res.status_code == 429 or res.status_code >= 500: continue # throttled / server error; retried on resume
 
+            name = probe[1].rsplit('/', 1)[-1]
             if res.status_code not in [400, 404]:
-                permissions = requests.get(f'https://www.googleapis.com/storage/v1/b/{wordlist[i]}/iam/testPermissions?permissions=storage.buckets.delete&permissions=storage.buckets.get&permissions=storage.buckets.getIamPolicy&permissions=storage.buckets.setIamPolicy&permissions=storage.buckets.update&permissions=storage.objects.create&permissions=storage.objects.delete&permissions=storage.objects.get&permissions=storage.objects.list&permissions=storage.objects.update').json()
-                privs = permissions.get('permissions', None)
-                access = '' if (privs == None) else f'[{", ".join(privs)}]'
+                privs = self.test_permissions(name)
+                access = '[permissions unknown]' if (privs == None) else (f'[{", ".join(privs)}]' if (len(privs) > 0) else '')
 
-                self.print_success(f'Identified: {wordlist[i]} {access}')
-        
+                self.emit('bucket', f'Identified: {name} {access}', bucket=name, provider='gcp', permissions=privs)
+            checkpoint.complete(name)
+
+        progress.finish()
         return True
\ No newline at end of file
@@ -73,4 +73,53 @@ DEFAULT_WORKSPACE = 'default'
 FIREPROX_CRED_ALIAS = 'fireprox'
 STRATUSTRYKE_LOGLEVEL = 'INFO' # Must be in enum set: DEBUG, INFO, WARNING, ERROR, CRITICAL
 HTTP_VERIFY_SSL = False
-HTTP_STSK_HEADER = True
\ No newline at end of file
+HTTP_STSK_HEADER = True
+HTTP_POOL_CONNECTIONS = 32 # number of hosts to keep pooled keep-alive connections for
+HTTP_POOL_MAXSIZE = 32 # max pooled connections kept per host (set >= module thread counts)
+HTTP_BATCH_CONCURRENCY = 32 # default max in-flight requests for http_request_many()
+MAX_REGION_WORKERS = 8 # max AWS regions processed concurrently by AWSModule.map_regions()
+FANOUT_PARALLEL = 8 # default max module instances run concurrently by 'run --all-creds'
+PROGRESS_INTERVAL = 30 # max seconds between progress (throughput / ETA) reports from StratustrykeModule.progress()
+PROFILE_TOP = 25 # hotspots / allocation sites printed after 'profile run' (full reports are saved to disk)
+PROFILE_TRACEMALLOC_FRAMES = 1 # stack frames tracemalloc keeps per allocation during 'profile run' (each extra frame slows allocation heavy modules considerably)
+OUTPUT_FLUSH_INTERVAL = 0.1 # seconds between console / spool flushes while output is streaming (idle output is flushed immediately)
+OUTPUT_FLUSH_BYTES = 65536 # flush console / spool output once this many bytes are pending
+OUTPUT_QUEUE_SIZE = 10000 # max queued output messages before printing threads block
+RECORD_OUTPUT = '' # comma-separated record writers enabled for module runs (jsonl, sqlite)
+RECORD_BATCH_SIZE = 1000 # records buffered before a batched write / transaction
+LINE_DEDUPE_MAX_EXACT = 1000000 # unique lines kept in a set when deduplicating option files / pastes before switching to compact 64-bit fingerprints
+CHECKPOINT_ENABLED = True # record completed work units / findings of checkpointed modules so interrupted runs can be resumed ('run --resume')
+CHECKPOINT_BATCH_SIZE = 500 # completed units / findings buffered before a checkpoint write
+CHECKPOINT_INTERVAL = 5.0 # max seconds between checkpoint writes while a run is making progress
+CONNECT_TIMEOUT = 10.0 # seconds to wait for a connection to be established (boto3 clients and framework HTTP requests)
+READ_TIMEOUT = 60.0 # seconds to wait for a response once connected (boto3 clients and framework HTTP requests)
+RETRY_MODE = 'standard' # boto3 retry mode (legacy, standard, adaptive); framework HTTP requests only retry throttling / 5xx responses outside legacy mode
+MAX_ATTEMPTS = 3 # total attempts per request (including the first) for boto3 clients and framework HTTP requests
+TCP_KEEPALIVE = True # enable TCP keepalive probes on boto3 / framework HTTP connections
+AWS_MAX_POOL_CONNECTIONS = 32 # max pooled connections kept per boto3 client (set >= module thread counts)
+AWS_CLIENT_POOL_SIZE = 64 # max boto3 clients cached per set of AWS keys (LRU)
+AWS_CLIENT_POOLS = 16 # max sets of AWS keys with a cached session / client pool (LRU)
+AWS_IDENTITY_CACHE_TTL = 900 # seconds a sts:GetCallerIdentity result is reused for a set of AWS keys
+AWS_ASSUME_ROLE_CACHE_SIZE = 256 # max assumed-role sessions cached (LRU) for reuse by AWSCredential.assume_role()
+AWS_ASSUME_ROLE_REFRESH_MARGIN = 300 # cached assumed-role credentials within this many seconds of expiry are renewed
+AWS_CACHE_ENABLED = False # serve repeated read-only (Describe / List / Get) AWS API calls from a local cache ('cache' command)
+AWS_CACHE_TTL = 900 # seconds a cached AWS API response is reused (operations in AWS_CACHE_OPERATION_TTLS excepted)
+AWS_CACHE_OPERATION_TTLS = { # per 'service:Operation' TTL overrides in seconds
+    'lambda:GetFunction': 300, # Code.Location is a pre-signed URL valid for 10 minutes
+    'ec2:DescribeInstanceStatus': 60,
+    'ssm:GetCommandInvocation': 60,
+    'ssm:ListCommandInvocations': 60,
+    'cloudformation:DescribeStackEvents': 60
+}
+INVENTORY_ENABLED = True # record AWS resources enumerated by modules in the workspace inventory ('inventory' command)
+INVENTORY_MAX_AGE = 0 # seconds a complete regional listing in the inventory is reused by modules instead of listing again (0: always list)
+RATE_LIMIT_ENABLED = True # adaptive per-host / credential rate limiting of boto3 and framework HTTP requests
+RATE_LIMIT_INITIAL_RATE = 50.0 # requests/sec a new limiter starts at before adapting
+RATE_LIMIT_MIN_RATE = 0.5 # floor requests/sec after repeated throttling
+RATE_LIMIT_MAX_RATE = 1000.0 # ceiling requests/sec per host / credential
+RATE_LIMIT_INCREASE = 10.0 # requests/sec added per second of successful traffic once throttling has been seen
+RATE_LIMIT_DECREASE = 0.7 # rate multiplier applied when a request is throttled
+RATE_LIMIT_MAX_LIMITERS = 1024 # max (host, credential) limiters kept (LRU)
+MSFT_PERSIST_TOKENS = False # persist Microsoft access tokens to the credstore so restarts skip re-authentication
+MSFT_TOKEN_REFRESH_MARGIN = 300 # seconds before expiry a cached Microsoft access token is renewed in the background
+MSFT_TOKEN_IDLE_TIMEOUT = 3600 # cached Microsoft access tokens unused for this many seconds are no longer renewed